@@ -0,0 +1,20 @@
+"""
+Shared RNA extraction engine. Protocols only choose a run profile from profiles/:
+
+    from extraction import run_profile
+
+    def run(protocol):
+        run_profile(protocol, "viapath-16-07-20")
+
+Extraction and run_profile need opentrons, the rest (profiles, steps and plans) can be used without it.
+"""
+from .profile import DEFAULTS, load_profile
+from .scheduler import build_steps, plan
+
+
+def __getattr__(name):
+    # The engine is imported only when it is used, so planning tools work where opentrons is not installed
+    if name in ("Extraction", "run_profile"):
+        from . import engine
+        return getattr(engine, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,163 @@
+"""
+Simulation benchmark. Every protocol script in protocols/ and tests/ is simulated for every number of columns, and for
+each run we keep the number of commands, the estimated duration (see estimate.py), the tips used, how far the gantry
+travels and the CPU time of the simulation. Results are saved as a baseline, and later runs are compared against it, so
+changes that make runs longer are seen before going to the bench.
+
+    python -m extraction.benchmark --save                  # Writes benchmarks/baseline.json
+    python -m extraction.benchmark                         # Compares with it, exits with 1 if something got worse (or there is none)
+    python -m extraction.benchmark protocols/RNA-extraction-200ul.py --columns 1 6
+
+Scripts that don't use run_profile() are only simulated once, as runColumns doesn't change them. Numbers of columns that
+a profile can't do (12 with only 6 columns in columnID) are skipped.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from .estimate import REPO_DIR, record, summarize
+from .profile import ColumnsError
+
+BASELINE = os.path.join(REPO_DIR, "benchmarks", "baseline.json")
+COLUMNS = list(range(1, 7)) + [12]
+
+#Metrics kept for every run
+METRICS = ("commands", "duration", "tips", "distance", "cpuSeconds")
+
+#How much (relative) they can grow before it is a regression. CPU time depends on the machine that runs the benchmark,
+#not only on the protocol, so it is shown but never compared with the baseline
+THRESHOLDS = {
+    "commands": 0.05,
+    "duration": 0.02,
+    "tips": 0,
+    "distance": 0.05,
+}
+
+
+def scripts():
+    """Protocol scripts in protocols/ and tests/ (the ones with a run() function, not the pytest files)"""
+    found = []
+    for folder in ("protocols", "tests"):
+        for path in sorted(glob.glob(os.path.join(REPO_DIR, folder, "*.py"))):
+            with open(path) as handle:
+                if "\ndef run(" in handle.read():
+                    found.append(path)
+    return found
+
+
+def uses_profiles(script):
+    """True if <script> runs the extraction engine, so runColumns can be changed"""
+    with open(script) as handle:
+        return "run_profile" in handle.read()
+
+
+def measure(script, runColumns=None, context=None):
+    """Metrics of a single simulation of <script>. runColumns None leaves the script as it is"""
+    settings = {}
+    if runColumns is not None:
+        settings["runColumns"] = runColumns
+    cpu = time.process_time()
+    commands = record(script, context=context, **settings)
+    summary = summarize(commands)
+    return {
+        "commands": summary["commands"],
+        "duration": summary["total"],
+        "tips": summary["tips"],
+        "distance": summary["distance"],
+        "cpuSeconds": round(time.process_time() - cpu, 3),
+    }
+
+
+def run_benchmark(targets=None, columns=COLUMNS, context=None):
+    """
+    {"script (columns)": metrics} for every script in <targets> (all of them if None) and number of columns.
+    A simulation that fails is kept as {"error": message}, so a regression that breaks a script is not missed.
+    """
+    results = {}
+    for script in targets or scripts():
+        name = os.path.relpath(os.path.abspath(script), REPO_DIR)
+        for runColumns in (columns if uses_profiles(script) else [None]):
+            key = name if runColumns is None else "%s (%s)" % (name, runColumns)
+            try:
+                results[key] = measure(script, runColumns, context=context)
+            except ColumnsError:
+                continue
+            except Exception as error:
+                results[key] = {"error": "%s: %s" % (type(error).__name__, error)}
+    return results
+
+
+def compare(results, baseline, thresholds=THRESHOLDS):
+    """
+    List of (run, metric, before, now) for every metric that grew more than its threshold, or runs that fail now.
+    Runs that are not in <baseline> are not compared.
+    """
+    regressions = []
+    for key, metrics in results.items():
+        before = baseline.get(key)
+        if before is None:
+            continue
+        if "error" in metrics:
+            if "error" not in before:
+                regressions.append((key, "error", None, metrics["error"]))
+            continue
+        if "error" in before:
+            continue
+        for metric, threshold in thresholds.items():
+            if metric in before and metrics[metric] > before[metric]*(1 + threshold):
+                regressions.append((key, metric, before[metric], metrics[metric]))
+    return regressions
+
+
+def format_results(results):
+    """A row per run. Runs that failed show their error instead of the metrics"""
+    header = ["run"] + list(METRICS)
+    rows = [[key] + [str(metrics[metric]) for metric in METRICS] for key, metrics in results.items() if "error" not in metrics]
+    widths = [max(len(row[i]) for row in [header] + rows) for i in range(len(header))]
+    lines = []
+    for row in [header] + rows:
+        lines.append("  ".join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+    for key, metrics in results.items():
+        if "error" in metrics:
+            lines.append("%s  ERROR %s" % (key.ljust(widths[0]), metrics["error"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulates every protocol and compares it with the saved baseline")
+    parser.add_argument("scripts", nargs="*", help="scripts to benchmark, all of protocols/ and tests/ by default")
+    parser.add_argument("--columns", nargs="+", type=int, default=COLUMNS, help="values of runColumns (default 1 to 6 and 12)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default benchmarks/baseline.json)")
+    parser.add_argument("--save", action="store_true", help="save the results as the new baseline")
+    args = parser.parse_args(argv)
+    results = run_benchmark(args.scripts, args.columns)
+    print(format_results(results))
+    if args.save:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as handle:
+                baseline = json.load(handle)
+        baseline.update(results)
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as handle:
+            json.dump(baseline, handle, indent=2, sort_keys=True)
+        print("\nSaved %s runs in %s" % (len(results), args.baseline))
+        return 0
+    if not os.path.isfile(args.baseline):
+        print("\nThere is no baseline in %s to compare with, make one with --save" % args.baseline)
+        return 1
+    with open(args.baseline) as handle:
+        regressions = compare(results, json.load(handle))
+    for key, metric, before, now in regressions:
+        print("REGRESSION %s: %s went from %s to %s" % (key, metric, before, now))
+    if regressions:
+        return 1
+    print("\nNo regressions against %s" % args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
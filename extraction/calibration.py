@@ -0,0 +1,167 @@
+"""
+Magnet height calibration. Every column of a plate with beads tests a height and a capture time: the robot resuspends
+the beads, engages the magnet at that height, waits the capture time and takes a sample of the supernatant to the same
+column of the output plate, the way the removals do. Columns where the sample comes out clear captured the beads.
+Every column is written in a log, and the one that worked fastest goes to calibration/magnet_heights.json:
+
+    python -m extraction.calibration protocol --heights 5.5 6 6.5 7 --capture 2 4 6 > magnetCalibration.py
+    python -m extraction.calibration show magnet_calibration.json
+    python -m extraction.calibration save magnet_calibration.json A6
+
+The first one writes a protocol script to upload to the robot. It loads the deck of a run profile (viapath-16-07-20 by
+default, --profile to change it), so the plate is the deepPlate of that profile.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import sys
+import time
+
+try:
+    from opentrons import types
+except ImportError:
+    #The show and save commands run on any computer, and the protocol can run on the fake ProtocolContext (see fake.py)
+    from . import fake as types
+
+from .engine import Extraction
+from .magnets import REGISTRY, module_generation, save_height
+from .profile import load_profile
+
+ROBOT_LOG = "/data/user_storage/magnet_calibration.json"
+
+SCRIPT = '''from opentrons import protocol_api
+from extraction.calibration import run_calibration
+
+metadata =  {{
+    "protocolName": "Magnet height calibration",
+    "author": "Angel Menendez Vazquez <angel.menendez_vazquez@kcl.ac.uk>",
+    "description": "Every column tests a magnet height and a capture time. Fill the columns with beads as after the beads step",
+    "apiLevel": "2.3"
+}}
+
+def run(protocol: protocol_api.ProtocolContext):
+    run_calibration(protocol, {profile!r}, heights={heights!r}, captureMinutes={capture!r}, sampleVol={sampleVol!r})
+'''
+
+
+def calibration_plan(heights, captureMinutes, columns):
+    """
+    [{"column", "height", "captureMinutes"}] with every height for every capture time, one per column of <columns>.
+    Raises ValueError if there are more combinations than columns.
+    """
+    combinations = list(itertools.product(heights, captureMinutes))
+    if len(combinations) > len(columns):
+        raise ValueError("%s heights and %s capture times need %s columns, there are only %s"
+        % (len(heights), len(captureMinutes), len(combinations), len(columns)))
+    return [{"column": column, "height": height, "captureMinutes": capture} for column, (height, capture) in zip(columns, combinations)]
+
+
+def run_calibration(protocol, profile="viapath-16-07-20", heights=(6.7,), captureMinutes=(5,), sampleVol=100, logFile=None, **overrides):
+    """
+    Runs the calibration on <protocol> with the deck of <profile>. Every column of the plan gets a new tip that mixes
+    the beads with the magnet down, engages it at its height, waits its capture time and takes <sampleVol> ul of
+    supernatant to the output plate. The log goes to <logFile> (ROBOT_LOG in the robot, nowhere in a simulation).
+    Returns the log.
+    """
+    overrides.setdefault("magnetHeight", max(heights)) # The plate may not have a height yet, that's what we are looking for
+    settings = load_profile(profile, **overrides)
+    if "runColumns" not in overrides:
+        settings = load_profile(profile, runColumns=len(settings["columnID"]), **overrides)
+    extraction = Extraction(protocol, settings)
+    p300 = extraction.p300
+    plan = calibration_plan(heights, captureMinutes, extraction.columnID)
+    log = {
+        "deepPlate": settings["labware"]["deepPlate"],
+        "magnetModule": settings["magnetModule"],
+        "generation": module_generation(settings["magnetModule"]),
+        "date": datetime.date.today().isoformat(),
+        "sampleVol": sampleVol,
+        "columns": [],
+    }
+    for entry in plan:
+        ID = entry["column"]
+        protocol.comment("\n\nColumn %s: %s mm for %s minutes" % (ID, entry["height"], entry["captureMinutes"]))
+        extraction.magneto.disengage()
+        tip = extraction.availableTips.pop()
+        extraction.retrieve_tip(p300, tip)
+        extraction.well_mix(vol=settings["washMixing"], loc=extraction.deepPlate[ID], reps=settings["mixRepeats"])
+        extraction.magneto.engage(height=entry["height"])
+        engaged = time.time()
+        protocol.delay(minutes=entry["captureMinutes"])
+        p300.flow_rate.aspirate = settings["removalFlowRate"]
+        src = extraction.deepPlate[ID]
+        p300.transfer(sampleVol, src.bottom().move(types.Point(x=extraction.pellet_side(ID), y=0, z=settings["bottomHeight"])),
+        extraction.outplate[ID].bottom(5), new_tip="never")
+        extraction.set_flow_rates()
+        extraction.remove_tip(p300, tip)
+        log["columns"].append(dict(entry, engaged=round(engaged, 1), sampled=round(time.time(), 1)))
+    extraction.magneto.disengage()
+    if logFile is None and not protocol.is_simulating():
+        logFile = ROBOT_LOG
+    if logFile:
+        with open(logFile, "w") as handle:
+            json.dump(log, handle, indent=4)
+        protocol.comment("Calibration log written in %s" % logFile)
+    protocol.comment("Look at the output plate. Of the columns with a clear sample, keep the one with the shortest capture time")
+    for entry in plan:
+        protocol.comment("%s: %s mm, %s minutes" % (entry["column"], entry["height"], entry["captureMinutes"]))
+    return log
+
+
+def format_log(log):
+    """The columns of a calibration log, one per line"""
+    lines = ["%s on a %s module, %s" % (log["deepPlate"], log["generation"], log["date"])]
+    for entry in log["columns"]:
+        lines.append("%-4s %5s mm  %s minutes" % (entry["column"], entry["height"], entry["captureMinutes"]))
+    return "\n".join(lines)
+
+
+def save_column(log, column, path=REGISTRY):
+    """Writes the height and capture time of <column> of <log> in the magnet height registry"""
+    found = [entry for entry in log["columns"] if entry["column"] == column]
+    if not found:
+        raise ValueError("Column %s is not in the calibration log" % column)
+    entry = found[0]
+    save_height(log["deepPlate"], log["magnetModule"], entry["height"], path, captureMinutes=entry["captureMinutes"],
+    source="calibration of %s, column %s" % (log["date"], column))
+    return entry
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Magnet height calibration")
+    commands = parser.add_subparsers(dest="command")
+    protocol = commands.add_parser("protocol", help="write a calibration protocol script")
+    protocol.add_argument("--profile", default="viapath-16-07-20", help="run profile with the deck and the plate")
+    protocol.add_argument("--heights", nargs="+", type=float, required=True, help="magnet heights to test (mm)")
+    protocol.add_argument("--capture", nargs="+", type=float, default=[5], help="capture times to test (minutes)")
+    protocol.add_argument("--sample", type=float, default=100, help="ul of supernatant taken to the output plate")
+    show = commands.add_parser("show", help="show a calibration log")
+    show.add_argument("log")
+    save = commands.add_parser("save", help="save the height of a column of a calibration log in the registry")
+    save.add_argument("log")
+    save.add_argument("column", help="column that captured the beads fastest, e.g. A6")
+    args = parser.parse_args(argv)
+    if args.command == "protocol":
+        settings = load_profile(args.profile, magnetHeight=max(args.heights))
+        try:
+            calibration_plan(args.heights, args.capture, settings["columnID"])
+        except ValueError as error:
+            parser.error(str(error))
+        sys.stdout.write(SCRIPT.format(profile=args.profile, heights=args.heights, capture=args.capture, sampleVol=args.sample))
+        return 0
+    if args.command is None:
+        parser.print_help()
+        return 1
+    with open(args.log) as handle:
+        log = json.load(handle)
+    if args.command == "show":
+        print(format_log(log))
+        return 0
+    entry = save_column(log, args.column)
+    print("Saved %s mm (%s minutes) for %s on a %s module" % (entry["height"], entry["captureMinutes"], log["deepPlate"], log["generation"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
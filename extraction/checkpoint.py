@@ -0,0 +1,79 @@
+"""
+Checkpoints, to go on with a run that stopped half way (a crash, a power cut, the stop button) instead of starting the
+plate again. With "checkpointFile", the engine writes there after every command of the plan and every tip it takes what
+is needed to continue: how many commands are done, the tips left in the racks, the tips in the parking rack, the magnet,
+what is left of every incubation and the volumes. A protocol that calls resume_profile() instead of run_profile(), with
+the same profile and settings, plans the same run and starts at the first column that was not finished:
+
+    from extraction.engine import resume_profile
+
+    def run(protocol: protocol_api.ProtocolContext):
+        resume_profile(protocol, "viapath-16-07-20", checkpointFile="/data/user_storage/checkpoint.json")
+"""
+import hashlib
+import json
+import os
+
+#Settings that don't change the run, so they can be different when resuming
+IGNORED = ("traceFile", "checkpointFile")
+
+
+def settings_hash(settings):
+    """sha256 of <settings>, to know that a checkpoint is of a run with the same settings"""
+    kept = dict((key, value) for key, value in settings.items() if key not in IGNORED)
+    return hashlib.sha256(json.dumps(kept, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def write_checkpoint(path, checkpoint):
+    """
+    Writes <checkpoint> in <path>. It goes to a temporary file first and then replaces the old one, so if the robot
+    stops while writing, the previous checkpoint is still there.
+    """
+    temporary = path + ".tmp"
+    with open(temporary, "w") as handle:
+        json.dump(checkpoint, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+def read_checkpoint(path):
+    """The checkpoint in <path>. Raises ValueError if there is none"""
+    if not path or not os.path.isfile(path):
+        raise ValueError("There is no checkpoint in %s to resume from" % path)
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def progress(commands):
+    """
+    <commands> without tip refills, the commands a checkpoint counts. Refills depend on the tips that are left, so a
+    resumed run plans them again (see scheduler.plan_tips)
+    """
+    return [dict((key, value) for key, value in command.items() if key != "refill") for command in commands if command["type"] != "refill"]
+
+
+def resume_position(commands, done):
+    """
+    First command of <commands> (see progress()) to run when <done> of them are done. A column that uses the tip of the
+    premix before it goes back to that premix, as the tip is not on the pipette anymore.
+    """
+    position = done
+    while 0 < position < len(commands) and commands[position].get("tipOn"):
+        position -= 1
+    return position
+
+
+def describe(command, steps):
+    """What <command> does, for the operator"""
+    if command["type"] == "column":
+        text = "%s, column %s" % (steps[command["step"]]["name"], command["ID"])
+    elif "step" in command:
+        text = steps[command["step"]]["name"]
+    elif command["type"] == "wait":
+        text = "waiting for %s" % command["reason"]
+    else:
+        text = command["type"]
+    if "plate" in command:
+        text = "plate %s, %s" % (command["plate"], text)
+    return text
@@ -0,0 +1,840 @@
+"""
+The RNA extraction itself. Extraction loads the deck described by a run profile and has the helpers every protocol
+used to copy (well_mix, slow_transfer, remove_supernatant, wait, meneillo...). run() plans the steps with
+scheduler.plan() and does them.
+"""
+import contextlib
+import time
+
+try:
+    from opentrons import types
+except ImportError:
+    #Without opentrons the engine can still run on the fake ProtocolContext (see fake.py)
+    from . import fake as types
+
+from .checkpoint import describe, progress, read_checkpoint, resume_position, settings_hash, write_checkpoint
+from .liquid import LiquidTracker
+from .magnets import magnet_height
+from .profile import beads_mixing, column_ids, load_profile, reagent_well, reagent_wells
+from .reagents import fill_sheet
+from .scheduler import build_steps, needs_mixing, plan, plan_tips, tip_capacity
+from .timer import IncubationTimer, count_down
+from . import trace
+from .trace import helper, section
+
+#Settings that run_profile() puts on top of whatever the protocol script asks for. See overridden()
+_overrides = {}
+
+
+class Extraction:
+    """
+    RNA extraction with the settings of a run profile (see profile.py) on <protocol>.
+    """
+
+    def __init__(self, protocol, settings):
+        self.protocol = protocol
+        self.settings = settings
+        self.columnID = column_ids(settings)
+        deck = settings["deck"]
+        labware = settings["labware"]
+
+            #Modules, plate and magnet height
+        self.magneto = protocol.load_module(settings["magnetModule"], deck["magnet"])
+        self.deepPlate = self.magneto.load_labware(labware["deepPlate"], label="Deep well")
+        self.magnetHeight = magnet_height(settings)
+
+            #Plates
+        self.reagents = protocol.load_labware(labware["reagents"], deck["reagents"], label="Reagents reservoir")
+        self.waste = protocol.load_labware(labware["waste"], deck["waste"], label="Liquid waste reservoir")
+        self.outplate = protocol.load_labware(labware["outplate"], deck["outplate"], label="Output plate")
+
+            #Tips - Ordered in the way they are used
+        self.parkingRack = None
+        if deck["parking"] is not None:
+            self.parkingRack = protocol.load_labware(labware["tips"], deck["parking"])
+        self.tipracks = [protocol.load_labware(labware["tips"], slot) for slot in deck["tipracks"]]
+        self.availableTips = []
+        self.tipNames = {} # "slot:well" of every tip by id(), so checkpoints can say which ones are left
+        for slot, rack in zip(deck["tipracks"], self.tipracks):
+            for i in range(1, 13):
+                self.availableTips.append(rack["A" + str(i)])
+                self.tipNames[id(rack["A" + str(i)])] = "%s:A%s" % (slot, i)
+        #To take a tip, just use availableTips.pop() and voila! Tips are taken from right to left instead of the normal way
+        self.parked = set() # Columns with their tip in the parking rack
+
+            #Pipettes
+        self.p300 = protocol.load_instrument(settings["pipette"], settings["mount"])
+        self.set_flow_rates()
+        #Optional second pipette for small volumes, with its own tips. Steps with "pipette": "small" use it (see scheduler.route_small)
+        self.smallPipette = None
+        self.smallTips = []
+        self.smallFlowRates = None # The ones it comes with, the flowRates of the settings are for the p300
+        if settings["smallPipette"] is not None:
+            self.smallPipette = protocol.load_instrument(settings["smallPipette"], settings["smallMount"])
+            rates = self.smallPipette.flow_rate
+            self.smallFlowRates = {"aspirate": rates.aspirate, "dispense": rates.dispense, "blowOut": rates.blow_out}
+            for slot in deck["smallTipracks"]:
+                rack = protocol.load_labware(labware["smallTips"], slot)
+                self.smallTips += [rack["A" + str(i)] for i in range(1, 13)]
+                self.tipNames.update((id(rack["A" + str(i)]), "%s:A%s" % (slot, i)) for i in range(1, 13))
+        self.set_speeds()
+        self.beadsMixing = beads_mixing(settings)
+        self.channels = getattr(self.p300, "channels", 8)
+        self.wasteVolumes = {} # ul dumped in every waste well, see waste_dumped()
+        self.wastePlanned = {} # ul of the removals planned but not done yet, see waste_well()
+
+            #Liquid in every well, see surface_height()
+        self.liquid = LiquidTracker(labware)
+        self.timer = IncubationTimer(protocol.is_simulating())
+        self.engaged = False # Magnet state, for the checkpoints
+        self.done = 0 # Commands of the plan that are done, see save_checkpoint()
+        self.reservoirWells = {} # Reagents reservoir well name of every Well object given by reservoir()
+        for ID in self.columnID:
+            self.liquid.add("deepPlate", ID, settings["originalVol"])
+
+    def set_flow_rates(self, pipette=None):
+        """
+        Back to the normal flow rates of <pipette> (the p300 if None). Flows are reduced compared to default values to avoid the production of air or foam during handling.
+        The smallPipette goes back to the flow rates it had when it was loaded.
+        """
+        if pipette is None or pipette is self.p300:
+            pipette, rates = self.p300, self.settings["flowRates"]
+        else:
+            rates = self.smallFlowRates
+        pipette.flow_rate.aspirate = rates["aspirate"]
+        pipette.flow_rate.dispense = rates["dispense"]
+        pipette.flow_rate.blow_out = rates["blowOut"]
+
+    def set_speeds(self):
+        """
+        Gantry speed of the pipettes for every move that doesn't say otherwise: the long ones between labware, mostly.
+        Moves inside a well (meneillo) and between columns of a plate (hop) are set there, all from settings["motion"].
+        """
+        speed = self.settings["motion"]["speed"]
+        if speed is None:
+            return
+        for pipette in (self.p300, self.smallPipette):
+            if pipette is not None:
+                pipette.default_speed = speed
+
+    def reagent(self, name, ID):
+        """Reservoir well of the reagent <name> for the column <ID>"""
+        return self.reservoir(reagent_well(self.settings, name, ID))
+
+    def reservoir(self, well):
+        """Well <well> of the reagents reservoir, remembering its name for the liquid tracking"""
+        self.reservoirWells[id(self.reagents[well])] = well
+        return self.reagents[well]
+
+    def surface_height(self, labware, well, change=0, default=None):
+        """
+        With liquidTracking, height (from the bottom) liquidMargin under the surface of the liquid in <well> of <labware> after
+        adding <change> ul, but never under bottomHeight. Without it, <default>, so the heights of the profile are used.
+        """
+        if not self.settings["liquidTracking"]:
+            return default
+        height = self.liquid.height(labware, well, change) - self.settings["liquidMargin"]
+        return max(height, self.settings["bottomHeight"])
+
+    def check_reagents(self, steps, commands):
+        """
+        Says how much of every reagent goes in the reservoir (see reagents.fill_sheet). If a well can't hold it, the robot
+        pauses before anything moves, so the reagent can be split between more wells or the run cancelled
+        """
+        warnings = []
+        for row in fill_sheet(self.settings, steps, commands, self.channels):
+            self.protocol.comment("Reagents reservoir %s: %s ml of %s" % (row["well"], round(row["fill"]/1000, 2), row["reagent"]))
+            if row["warning"]:
+                self.protocol.comment("WARNING: " + row["warning"])
+                warnings.append(row["warning"])
+            self.liquid.add("reagents", row["well"], row["fill"])
+        if warnings:
+            self.protocol.pause("The reagents reservoir can't hold the run. %s. Resume only if the wells are filled anyway" % ". ".join(warnings))
+
+    def waste_well(self, wasteID, vol):
+        """
+        Name of the waste well where <vol> ul are going to be dumped. It is <wasteID> if it has room for them, the emptiest well
+        if it doesn't, and if no well has room, the robot pauses so the waste reservoir is emptied.
+        The <vol> ul count as planned until waste_dumped() says they are in the well.
+        """
+        capacity = self.settings["wasteCapacity"] or getattr(self.waste[wasteID], "max_volume", None)
+        planned = self.wastePlanned
+        if capacity:
+            used = lambda well: self.wasteVolumes.get(well, 0) + planned.get(well, 0)
+            if used(wasteID) + vol > capacity:
+                wells = ["A" + str(i) for i in range(1, 13)]
+                emptiest = min(wells, key=used)
+                if used(emptiest) + vol > capacity:
+                    self.protocol.pause("The liquid waste reservoir is full. Empty it and resume")
+                    self.wasteVolumes.clear()
+                else:
+                    self.protocol.comment("Waste well %s is full, using %s" % (wasteID, emptiest))
+                    wasteID = emptiest
+        planned[wasteID] = planned.get(wasteID, 0) + vol
+        return wasteID
+
+    def waste_dumped(self, wasteID, vol):
+        """<vol> ul planned by waste_well() are in waste well <wasteID> now. Only these go in the checkpoints"""
+        self.wastePlanned[wasteID] = self.wastePlanned.get(wasteID, 0) - vol
+        self.wasteVolumes[wasteID] = self.wasteVolumes.get(wasteID, 0) + vol
+
+    def pellet_side(self, ID):
+        """
+        In the move() function, positive X means 'move to the right'. In most columns the pellet is placed to the right, so we use a
+        small offset to the left. In pelletLeftColumns it is the other way around.
+        """
+        if ID in self.settings["pelletLeftColumns"]:
+            return 1
+        return -1
+
+    def delay(self, seconds):
+        """protocol.delay() that also moves the clock of the simulations"""
+        self.protocol.delay(seconds=seconds)
+        self.timer.advance(seconds)
+
+    @helper
+    def wait(self, seconds, reason, stop=False, IDs=None, lead=0):
+        """
+        The uncertainty of not knowing how much time is left in an incubation is horrible. This makes it more bearable.
+        Waits <seconds> (times delayFactor), or with <IDs>, until the incubation of those columns is over (<lead> seconds before),
+        so time lost before, like pauses for tips, is not waited again. Every clockInterval seconds it says how much is left.
+        If <stop> is True, it pauses one minute before the end. The pause counts as part of the wait.
+        """
+        factor = self.settings["delayFactor"]
+        if IDs:
+            deadline = self.timer.deadline(IDs, lead*factor)
+        else:
+            deadline = self.timer.now() + seconds*factor
+        count_down(self.protocol, self.timer, deadline, reason, self.settings["clockInterval"], factor, stop)
+
+    def start_incubation(self, step, IDs):
+        """The incubation of <step> starts now for the columns <IDs>"""
+        if step.get("incubation", 0) > 0:
+            self.timer.start(IDs, step["incubation"]*60*self.settings["delayFactor"])
+
+    @helper
+    def refill_tips(self):
+        """
+        Pauses so the empty tipracks are replaced with full ones. The tips left in the rack that was being used go first,
+        then the new racks in the usual order.
+        """
+        remaining = set(id(tip) for tip in self.availableTips)
+        emptied = []
+        for slot, rack in zip(self.settings["deck"]["tipracks"], self.tipracks):
+            tips = [rack["A" + str(i)] for i in range(1, 13)]
+            if not any(id(tip) in remaining for tip in tips):
+                emptied.append((slot, tips))
+        if not emptied:
+            return
+        self.protocol.pause("Replace the empty tipracks in slots %s with full ones and resume" % ", ".join(str(slot) for slot, _ in emptied))
+        refilled = []
+        for _, tips in emptied:
+            refilled += tips
+        self.availableTips = refilled + self.availableTips
+
+    @helper
+    def meneillo(self, pipette, pos, reps=None, distance=None):
+        """Shakes the tip over <pos> so drops fall"""
+        if reps is None:
+            reps = self.settings["meneilloReps"]
+        if distance is None:
+            distance = self.settings["meneilloDistance"]
+        #With directWiggles the tip goes from side to side without the arc of a move between wells, it is already in the well
+        motion = {"force_direct": True} if self.settings["motion"]["directWiggles"] else {}
+        pipette.move_to(pos, **motion)
+        for _ in range(reps):
+            pipette.move_to(pos.move(types.Point(x=distance, y=0, z=0)), **motion)
+            pipette.move_to(pos.move(types.Point(x=-distance, y=0, z=0)), **motion)
+
+    @helper
+    def hop(self, pipette, start, end):
+        """
+        Takes the tip from the well <start> to the well <end> of the same plate, going straight hopHeight mm over the plate
+        instead of the arc the robot does between wells. Does nothing if hopHeight is None.
+        """
+        height = self.settings["motion"]["hopHeight"]
+        if height is None:
+            return
+        pipette.move_to(start.top(height), force_direct=True)
+        pipette.move_to(end.top(height), force_direct=True)
+
+    def remove_tip(self, pipette, tip):
+        """
+        Originally, I had a special behaviour to drop the tips, but I stopped using it.
+        I keep this function because it makes it easy to change drop_tip() to return_tip() for test runs
+        """
+        if self.settings["returnTips"]:
+            pipette.return_tip()
+        else:
+            pipette.drop_tip()
+
+    def retrieve_tip(self, pipette, tip):
+        """
+        Originally, the robot took a tip, went to the top of the well it was going to work with, and aspired 20 ul there, but now we are making it aspire 20 ul after taking the tip
+        """
+        pipette.pick_up_tip(tip)
+        for ID in [ID for ID in self.parked if tip is self.parkingRack[ID]]:
+            self.parked.discard(ID)
+        self.save_checkpoint()
+
+    def park_tip(self, pipette, ID):
+        """Leaves the tip of column <ID> in the parking rack, to use it again later"""
+        pipette.drop_tip(self.parkingRack[ID])
+        self.parked.add(ID)
+        self.save_checkpoint()
+
+    @helper
+    def well_mix(self, vol, loc, reps, height=None, moveSide=0, bottomHeight=None, downReps=0, yOffset=0):
+        """
+        Aspirates <vol> from bottom of well and dispenses it from <height> <reps> times
+        loc1 is a position at <bottomHeight> over the bottom of the well
+        loc2 is a position in the same x and y posiiton than loc1, but at <height>mm over the bottom of the well
+        The idea here is to take liquid to the very bottom and pour it from a higher point, to mix things.
+        Before that, it aspirates and dispenses <downReps> times at the bottom. Every time, it moves <yOffset> to the other side.
+        """
+        settings = self.settings
+        if height is None:
+            height = settings["generalHeight"]
+        if bottomHeight is None:
+            bottomHeight = settings["bottomMixHeight"]
+        p300 = self.p300
+        p300.flow_rate.aspirate = settings["mixFlowRates"]["aspirate"]
+        p300.flow_rate.dispense = settings["mixFlowRates"]["dispense"]
+        for _ in range(downReps):
+            p300.aspirate(vol, loc.bottom().move(types.Point(x=moveSide, y=yOffset, z=bottomHeight)))
+            p300.dispense(vol, loc.bottom().move(types.Point(x=moveSide, y=yOffset, z=bottomHeight)))
+            yOffset = -yOffset
+        for _ in range(reps):
+            p300.aspirate(vol, loc.bottom().move(types.Point(x=moveSide, y=yOffset, z=bottomHeight)))
+            yOffset = -yOffset
+            p300.dispense(vol, loc.bottom().move(types.Point(x=moveSide, y=yOffset, z=height)))
+        p300.dispense(20, loc.top(settings["topOffset"]))
+        self.set_flow_rates()
+
+    @helper
+    def premix_reagent(self, reagent, reagentName):
+        """
+        Takes the tip for the next column and mixes the reagent in the reservoir with it. We only do this with magnetic beads, that's why we use those variable names.
+        The tip stays on, so the column transfer that comes next must not take another one.
+        """
+        currentip = self.availableTips.pop()
+        self.retrieve_tip(self.p300, currentip)
+        self.protocol.comment("Mixing %s" % reagentName)
+        height = self.surface_height("reagents", self.reservoirWells[id(reagent)], default=self.settings["beadsHeight"])
+        self.well_mix(vol=self.beadsMixing, loc=reagent, reps=self.settings["beadsMixRepeats"], height=height)
+        self.p300.blow_out(reagent.top())
+
+    def pipette(self, small=False):
+        """The pipette to use, and the tips it takes"""
+        if small:
+            return self.smallPipette, self.smallTips
+        return self.p300, self.availableTips
+
+    def removal_trips(self, vol, ID, wasteID, tipVolume=None):
+        """
+        Trips of the removal of <vol> ul from column <ID>, worked out before the pipette moves: [{"vol", "source", "dump", "wasteID"}].
+        While <vol> is bigger than <tipVolume>, it divides it in ceilling(<vol>/<tipVolume>) trips. (So, if it is 396ul, we have 2 180ul trips and a 36ul trip)
+        Every trip aspirates at the pellet side, at the height the liquid will have then, and dumps in the waste well of the column.
+        With wasteByColumn, every column has its own waste well instead of <wasteID>. <tipVolume> is tipVolume if None.
+        """
+        settings = self.settings
+        if tipVolume is None:
+            tipVolume = settings["tipVolume"]
+        if settings["wasteByColumn"]:
+            wasteID = ID
+        wasteID = self.waste_well(wasteID, vol*self.channels)
+        dump = self.waste[wasteID]
+        src = self.deepPlate[ID]
+        trips = []
+        removed = 0
+        while removed < vol:
+            trip = min(vol - removed, tipVolume)
+            removed += trip
+            #With liquidTracking, the tip goes down with the liquid instead of going to the bottom from the start
+            height = self.surface_height("deepPlate", ID, -removed, default=settings["bottomHeight"])
+            trips.append({"vol": trip, "source": src.bottom().move(types.Point(x=self.pellet_side(ID), y=0, z=height)), "dump": dump, "wasteID": wasteID})
+        return trips
+
+    def remove_columns(self, step, IDs, seconds=None):
+        """
+        Removes the supernatant of <step> from all the columns in <IDs>, one after the other. The trips of every column are
+        planned before the first one starts, so if the waste reservoir needs emptying the robot stops before the batch, not in the middle.
+        <seconds> are the planned times of every column, for the incubation timer.
+        """
+        small = step.get("pipette") == "small"
+        tipVolume = self.settings["smallVolume"] if small else None
+        trips = [self.removal_trips(step["vol"], ID, step["wasteID"], tipVolume) for ID in IDs]
+        for ID, columnTrips, columnSeconds in zip(IDs, trips, seconds or [0]*len(IDs)):
+            self.remove_supernatant(vol=step["vol"], ID=ID, wasteID=step["wasteID"], reagentName=step["reagentName"],
+            newtip=step.get("newtip", False), park=step.get("park", False), trips=columnTrips, small=small)
+            self.column_done(step, ID, columnSeconds)
+
+    def column_done(self, step, ID, seconds):
+        """Column <ID> finished <step>, which was planned to take <seconds>. Its incubation starts now"""
+        self.timer.advance(seconds)
+        self.start_incubation(step, [ID])
+        self.command_done()
+
+    def command_done(self):
+        """One more command of the plan is done. Tip refills don't count, see checkpoint.progress()"""
+        self.done += 1
+        self.save_checkpoint()
+
+    def save_checkpoint(self, finished=False):
+        """Writes in checkpointFile what resume() needs to go on from here (see checkpoint.py). Nothing without checkpointFile"""
+        if not self.settings["checkpointFile"]:
+            return
+        now = self.timer.now()
+        write_checkpoint(self.settings["checkpointFile"], {
+            "settings": settings_hash(self.settings),
+            "done": self.done,
+            "finished": finished,
+            "tips": [self.tipNames[id(tip)] for tip in self.availableTips],
+            "smallTips": [self.tipNames[id(tip)] for tip in self.smallTips],
+            "parked": sorted(self.parked),
+            "engaged": self.engaged,
+            "incubations": dict((ID, round(deadline - now, 1)) for ID, deadline in self.timer.deadlines.items() if deadline > now),
+            "saved": round(time.time(), 1),
+            "liquid": [[labware, well, vol] for (labware, well), vol in self.liquid.volumes.items()],
+            "waste": self.wasteVolumes,
+        })
+
+    def restore(self, checkpoint):
+        """
+        Takes the tips, parked tips, magnet, incubations and volumes of <checkpoint>. The time since it was written counts
+        as incubation. Raises ValueError if it is of a run with other settings.
+        """
+        if checkpoint["settings"] != settings_hash(self.settings):
+            raise ValueError("The checkpoint is of a run with other settings. Resume with the same profile and settings")
+        tips = dict((name, tip) for tip in self.availableTips + self.smallTips for name in [self.tipNames[id(tip)]])
+        self.availableTips = [tips[name] for name in checkpoint["tips"]]
+        self.smallTips = [tips[name] for name in checkpoint["smallTips"]]
+        self.parked = set(checkpoint["parked"])
+        self.done = checkpoint["done"]
+        elapsed = 0 if self.protocol.is_simulating() else max(time.time() - checkpoint["saved"], 0)
+        for ID, left in checkpoint["incubations"].items():
+            self.timer.deadlines[ID] = self.timer.now() + max(left - elapsed, 0)
+        self.liquid.volumes = dict(((labware, well), vol) for labware, well, vol in checkpoint["liquid"])
+        self.wasteVolumes = dict(checkpoint["waste"])
+        if checkpoint["engaged"]:
+            self.magneto.engage(height=self.magnetHeight)
+            self.engaged = True
+
+    @helper
+    def remove_supernatant(self, vol, ID, wasteID, reagentName="Something", newtip=False, park=False, trips=None, small=False):
+        """
+        Removes the supernatant of a single column, in the <trips> of removal_trips() (planned here if None).
+        If <park> is True, the tip goes back to the parking rack. With <small>, the smallPipette does it with a new tip.
+        """
+        settings = self.settings
+        pipette, tips = self.pipette(small)
+        topOffset = settings["topOffset"]
+        pipette.flow_rate.aspirate = settings["removalFlowRate"] # In this case we reduce the flow even more to make sure the precipitate is okay. We don't wanna bother the lad
+        if newtip == False:
+            currentip = self.parkingRack[ID]
+        else:
+            currentip = tips.pop()
+        if trips is None:
+            trips = self.removal_trips(vol, ID, wasteID, settings["smallVolume"] if small else None)
+        src = self.deepPlate[ID]
+        self.retrieve_tip(pipette, currentip)
+        for n, trip in enumerate(trips):
+            pipette.dispense(20, src.top(topOffset))
+            pipette.transfer(trip["vol"], trip["source"], trip["dump"].top(topOffset), new_tip="never")
+            self.liquid.remove("deepPlate", ID, trip["vol"])
+            self.waste_dumped(trip["wasteID"], trip["vol"]*self.channels)
+            self.drip(trip["dump"], pipette)
+            if n < len(trips) - 1 or settings["dispenseAfterLast"]:
+                pipette.dispense(20) #Make sure we expel everything that must be expelled. We dont want to move droplets around.
+        if park == True:
+            self.park_tip(pipette, ID)
+        else:
+            self.remove_tip(pipette, currentip)
+        self.set_flow_rates(pipette)
+
+    @helper
+    def drip(self, dump, pipette=None):
+        """
+        In case something is TheOppositeOfDense and just drips down after dispensing in <dump>. <pipette> is the p300 if None
+        """
+        pipette = pipette or self.p300
+        if self.settings["dripDelay"] > 0:
+            self.protocol.delay(seconds=self.settings["dripDelay"]*self.settings["delayFactor"])
+        if self.settings["meneillo"] == "touch_tip":
+            pipette.touch_tip(dump, v_offset=self.settings["topOffset"])
+        elif self.settings["meneillo"] == "blow_out":
+            pipette.blow_out(dump.top(self.settings["topOffset"]))
+        elif self.settings["meneillo"]:
+            self.meneillo(pipette, dump.top(self.settings["topOffset"]))
+
+    @helper
+    def slow_transfer(self, vol, reagent, ID, reagentName,
+    mixVol=None, repeats=None, downRepeats=0,
+    altura=None, tipOn=False, extraVol=0, park=True):
+        """
+        Similar to remove_supernatant, but the other way around. It transfers from point A to point B in <tipVol> ul trips and pours liquid
+        from the top, to avoid contaminating the tip while transfering all the necessary volume.
+        It works on a single column; incubation and magnet are left to the scheduler.
+        If <tipOn> is True, premix_reagent already took the tip for this column. If <park> is True, the tip is left in the parking rack.
+        """
+        settings = self.settings
+        p300 = self.p300
+        tipVolume = settings["tipVolume"]
+        if mixVol is None:
+            mixVol = settings["washMixing"]
+        if repeats is None:
+            repeats = settings["mixRepeats"]
+        src = reagent
+        to = self.deepPlate[ID]
+        currentip = None
+        if tipOn == False:
+            currentip = self.availableTips.pop()
+            self.retrieve_tip(p300, currentip)
+        srcWell = self.reservoirWells[id(src)]
+        tvol = vol
+        while tvol > tipVolume:
+            height = self.surface_height("reagents", srcWell, -tipVolume*self.channels, default=settings["bottomHeight"])
+            p300.dispense(20, src.top())
+            p300.transfer(tipVolume, src.bottom().move(types.Point(x=0, y=0, z=height)),
+            to.top(settings["topOffset"]), new_tip="never", air_gap=extraVol)
+            self.move_liquid(srcWell, ID, tipVolume)
+            self.protocol.delay(seconds=2*settings["delayFactor"])
+            p300.blow_out()
+            tvol -= tipVolume
+        height = self.surface_height("reagents", srcWell, -tvol*self.channels, default=settings["bottomHeight"])
+        p300.dispense(20, src.top())
+        p300.transfer(tvol, src.bottom().move(types.Point(x=0, y=0, z=height)),
+        to.center(), new_tip="never", air_gap=extraVol)
+        self.move_liquid(srcWell, ID, tvol)
+        if settings["mixDelay"] > 0:
+            self.protocol.delay(seconds=settings["mixDelay"]*settings["delayFactor"])
+        altura = self.surface_height("deepPlate", ID, default=altura)
+        self.well_mix(vol=mixVol, loc=to, reps=repeats, moveSide=-self.pellet_side(ID)*settings["mixingOffset"], height=altura,
+        downReps=downRepeats, yOffset=settings["mixYOffset"])
+        if park == True:
+            self.park_tip(p300, ID)
+        else:
+            self.remove_tip(p300, currentip)
+
+    @helper
+    def distribute(self, vol, reagent, IDs, reagentName):
+        """
+        Adds <vol> of <reagent> to every column in <IDs> with a single tip, dispensing from the top so the tip never touches the samples.
+        Every aspiration takes as much as fits in <tipVolume> plus <disposalVolume>, which is blown out back in the reservoir, so
+        aliquots are all dispensed with the same accuracy. Columns are mixed later with mix_column().
+        """
+        settings = self.settings
+        p300 = self.p300
+        capacity = settings["tipVolume"] - settings["disposalVolume"]
+        currentip = self.availableTips.pop()
+        self.retrieve_tip(p300, currentip)
+        pending = [[ID, vol] for ID in IDs]
+        while pending:
+            load = 0
+            aliquots = []
+            while pending and load < capacity:
+                ID, left = pending[0]
+                amount = min(left, capacity - load)
+                aliquots.append((ID, amount))
+                load += amount
+                pending[0][1] -= amount
+                if pending[0][1] <= 0:
+                    pending.pop(0)
+            reagentWell = self.reservoirWells[id(reagent)]
+            height = self.surface_height("reagents", reagentWell, -(load + settings["disposalVolume"])*self.channels, default=settings["bottomHeight"])
+            p300.aspirate(load + settings["disposalVolume"], reagent.bottom().move(types.Point(x=0, y=0, z=height)))
+            for n, (ID, amount) in enumerate(aliquots):
+                if n > 0:
+                    self.hop(p300, self.deepPlate[aliquots[n - 1][0]], self.deepPlate[ID])
+                p300.dispense(amount, self.deepPlate[ID].top(settings["topOffset"]))
+                self.move_liquid(reagentWell, ID, amount)
+            p300.blow_out(reagent.top())
+        self.remove_tip(p300, currentip)
+
+    def move_liquid(self, reagentWell, ID, vol):
+        """Liquid tracking of <vol> ul going from <reagentWell> of the reservoir to the column <ID>, in every channel"""
+        self.liquid.remove("reagents", reagentWell, vol*self.channels)
+        self.liquid.add("deepPlate", ID, vol)
+
+    @helper
+    def mix_column(self, ID, mixVol, repeats, downRepeats=0, altura=None, park=True):
+        """
+        Mixes a column that already has its reagent (see distribute) with a tip of its own, and parks or drops it
+        """
+        p300 = self.p300
+        currentip = self.availableTips.pop()
+        self.retrieve_tip(p300, currentip)
+        altura = self.surface_height("deepPlate", ID, default=altura)
+        self.well_mix(vol=mixVol, loc=self.deepPlate[ID], reps=repeats, moveSide=-self.pellet_side(ID)*self.settings["mixingOffset"], height=altura,
+        downReps=downRepeats, yOffset=self.settings["mixYOffset"])
+        if park == True:
+            self.park_tip(p300, ID)
+        else:
+            self.remove_tip(p300, currentip)
+
+    @helper
+    def elute(self, vol, ID, newtip=True, small=False):
+        """
+        Moves the elute of one column to the output plate while the magnet is engaged. With <small>, the smallPipette does it.
+        """
+        pipette, tips = self.pipette(small)
+        pipette.flow_rate.aspirate = self.settings["removalFlowRate"]
+        if newtip == True:
+            currentip = tips.pop()
+        else:
+            currentip = self.parkingRack[ID]
+        self.retrieve_tip(pipette, currentip)
+        src = self.deepPlate[ID]
+        to = self.outplate[ID]
+        height = self.surface_height("deepPlate", ID, -vol, default=self.settings["bottomHeight"])
+        pipette.dispense(20, src.top())
+        pipette.transfer(vol, src.bottom().move(types.Point(x=self.pellet_side(ID), y=0, z=height)),
+        to.bottom(5), new_tip="never")
+        self.liquid.remove("deepPlate", ID, vol)
+        self.liquid.add("outplate", ID, vol)
+        self.protocol.delay(seconds=2*self.settings["delayFactor"])
+        pipette.dispense(20)
+        self.remove_tip(pipette, currentip)
+        self.set_flow_rates(pipette)
+
+    def execute(self, steps, commands):
+        """
+        Runs the commands returned by scheduler.plan()
+        """
+        announced = set()
+        for command in self.removal_batches(steps, commands):
+            if command["type"] == "refill":
+                with section("tip refills"):
+                    self.refill_tips()
+                continue
+            if command["type"] == "swap":
+                with section("plate swaps"):
+                    if command.get("refill"):
+                        self.refill_tips()
+                    self.swap_plate(command["plate"])
+                announced.clear()
+                self.command_done()
+                continue
+            if command["type"] == "wait":
+                with section("incubations"):
+                    if command.get("refill"):
+                        self.refill_tips()
+                    if command.get("announce"):
+                        self.announce_plate(command["announce"])
+                    self.wait(command["seconds"], command["reason"], stop=command["pause"], IDs=command.get("IDs"), lead=command.get("lead", 0))
+                self.command_done()
+                continue
+            with section(steps[command["step"]]["name"]):
+                self.execute_command(steps, command, announced)
+            step = steps[command["step"]]
+            if command["type"] == "magnet":
+                self.start_incubation(step, self.columnID)
+                self.command_done()
+            elif command["type"] == "premix":
+                self.timer.advance(command["seconds"])
+                self.command_done()
+            elif command["type"] == "distribute":
+                self.timer.advance(command["seconds"])
+                if not needs_mixing(step):
+                    self.start_incubation(step, command["IDs"])
+                self.command_done()
+            elif command["type"] == "column":
+                self.column_done(step, command["ID"], command["seconds"])
+
+    def announce_plate(self, plate):
+        """Says what to get ready for <plate> while the last incubation of the previous one goes on"""
+        self.protocol.comment("\n\nPlate %s of %s is next. Get it ready now: samples with %s ul in columns %s and a new output plate"
+        % (plate, self.settings["plates"], self.settings["originalVol"], ", ".join(self.columnID)))
+
+    @helper
+    def swap_plate(self, plate):
+        """
+        Pauses so the operator changes the deep well plate and the output plate for those of <plate>, and empties the waste.
+        Tips and reagents stay where they were, the new plate starts with its samples and no incubation.
+        """
+        self.magneto.disengage()
+        self.engaged = False
+        self.protocol.pause("Plate %s of %s: take out the deep well plate and the output plate, put in the next ones, "
+        "empty the liquid waste reservoir and resume" % (plate, self.settings["plates"]))
+        self.wasteVolumes.clear()
+        self.wastePlanned.clear()
+        self.timer.deadlines.clear()
+        for ID in self.columnID:
+            self.liquid.remove("deepPlate", ID, self.liquid.volume("deepPlate", ID))
+            self.liquid.remove("outplate", ID, self.liquid.volume("outplate", ID))
+            self.liquid.add("deepPlate", ID, self.settings["originalVol"])
+
+    def removal_batches(self, steps, commands):
+        """
+        <commands> with the removals of a step that come one after the other joined in a single command, with the "IDs" of
+        all those columns (and their "seconds"), so remove_columns() plans them together.
+        """
+        batched = []
+        for command in commands:
+            if command["type"] == "column" and steps[command["step"]]["action"] == "remove":
+                previous = batched[-1] if batched else None
+                if previous is not None and previous["type"] == "removal" and previous["step"] == command["step"]:
+                    previous["IDs"].append(command["ID"])
+                    previous["seconds"].append(command.get("seconds", 0))
+                    continue
+                command = {"type": "removal", "step": command["step"], "IDs": [command["ID"]], "seconds": [command.get("seconds", 0)]}
+            batched.append(command)
+        return batched
+
+    def execute_command(self, steps, command, announced):
+        """
+        Runs a single command of scheduler.plan() that is not a wait. <announced> has the steps that already said what they do
+        """
+        step = steps[command["step"]]
+        if command["type"] == "magnet":
+            if step["engage"] == True:
+                self.protocol.comment("Engaging magnet")
+                self.magneto.engage(height=self.magnetHeight)
+            else:
+                self.protocol.comment("Disengaging magnet")
+                self.magneto.disengage()
+            self.engaged = step["engage"] == True
+            if step.get("incubation", 0) > 0:
+                self.protocol.comment("Incubating for %s minutes" % step["incubation"])
+            return
+        if command["step"] not in announced:
+            announced.add(command["step"])
+            if command["type"] == "distribute":
+                self.protocol.comment("\n\nADDING STEP: Distributing %s ul of %s to samples" % (step["vol"], step["reagentName"]))
+            elif step["action"] == "add":
+                self.protocol.comment("\n\nADDING STEP: Transfering %s ul of %s to samples" % (step["vol"], step["reagentName"]))
+            elif step["action"] == "remove":
+                self.protocol.comment("\n\nREMOVING STEP: Removing %s ul of supernatant (%s) while magnet is still engaged" % (step["vol"], step["reagentName"]))
+            else:
+                self.protocol.comment("Transfering DNA to output plate while magnet is still engaged")
+        if command["type"] == "removal":
+            self.remove_columns(step, command["IDs"], command["seconds"])
+        elif command["type"] == "premix":
+            self.premix_reagent(self.reagent(step["reagent"], command["ID"]), step["reagentName"])
+        elif command["type"] == "distribute":
+            for well in reagent_wells(self.settings, step["reagent"]):
+                IDs = [ID for ID in command["IDs"] if reagent_well(self.settings, step["reagent"], ID) == well]
+                if IDs:
+                    self.distribute(vol=step["vol"], reagent=self.reservoir(well), IDs=IDs, reagentName=step["reagentName"])
+        elif step["action"] == "add" and command["mixOnly"]:
+            self.mix_column(ID=command["ID"], mixVol=step["mixVol"], repeats=step["repeats"], downRepeats=step.get("downRepeats", 0),
+            altura=step.get("altura"), park=step.get("park", False))
+        elif step["action"] == "add":
+            self.slow_transfer(vol=step["vol"], reagent=self.reagent(step["reagent"], command["ID"]), ID=command["ID"], reagentName=step["reagentName"],
+            mixVol=step["mixVol"], repeats=step["repeats"], downRepeats=step.get("downRepeats", 0), altura=step.get("altura"),
+            tipOn=command["tipOn"], extraVol=step.get("extraVol", 0), park=step.get("park", False))
+        else:
+            self.elute(vol=step["vol"], ID=command["ID"], newtip=step.get("newtip", True), small=step.get("pipette") == "small")
+
+    def run(self, steps=None, commands=None, duration=None):
+        """
+        Plans and runs the whole extraction. <steps> and <commands> (and their <duration>, in seconds) are a plan made
+        before, like the one of a program (see program.py), to run instead
+        """
+        if steps is None:
+            steps = build_steps(self.settings)
+            commands, duration = plan(steps, self.settings)
+        self.magneto.disengage() #In case it is engaged from previous protocols.
+        self.protocol.comment("We are working with column IDs: %s" % self.columnID)
+        self.protocol.comment("\n\nSamples should have an initial volume of %s ul" % self.settings["originalVol"])
+        if self.settings["plates"] > 1:
+            self.protocol.comment("Queue of %s plates. The reagents are for all of them" % self.settings["plates"])
+        self.check_reagents(steps, commands)
+        self.protocol.comment("Planned %s commands, around %s minutes of run" % (len(commands), int(duration/60)))
+        self.execute(steps, commands)
+        self.magneto.disengage()
+        self.save_checkpoint(finished=True)
+        self.protocol.comment("\n\nFecho!")
+
+    def resume(self):
+        """
+        Goes on with the run that wrote checkpointFile, from the first command it didn't finish (see checkpoint.py).
+        Raises ValueError if there is no checkpoint, it is of other settings or the run had finished.
+        """
+        checkpoint = read_checkpoint(self.settings["checkpointFile"])
+        if checkpoint["finished"]:
+            raise ValueError("The run of %s finished, there is nothing to resume" % self.settings["checkpointFile"])
+        steps = build_steps(self.settings)
+        commands = progress(plan(steps, self.settings)[0])
+        self.restore(checkpoint)
+        start = resume_position(commands, checkpoint["done"])
+        self.done = start
+        if start >= len(commands):
+            self.protocol.comment("Every command of the run was done")
+        else:
+            command = commands[start]
+            #Tips taken by the command that was interrupted are gone, so refills are planned again with the tips that are left
+            remaining = plan_tips(commands[start:], steps, self.settings, used=tip_capacity(self.settings) - len(self.availableTips))
+            parked = ", ".join(sorted(self.parked)) or "none"
+            self.protocol.pause("Resuming at %s (command %s of %s). Take off any tip left on the pipette. The parking rack must have tips in: %s. "
+            "If the run stopped while a column had its parked tip, put a new one in its place. Resume when ready"
+            % (describe(command, steps), start + 1, len(commands), parked))
+            self.execute(steps, remaining)
+        self.magneto.disengage()
+        self.save_checkpoint(finished=True)
+        self.protocol.comment("\n\nFecho!")
+
+
+def run_profile(protocol, profile="viapath-16-07-20", **overrides):
+    """
+    Runs the RNA extraction of <profile> (a name in profiles/, a path or a dictionary) on <protocol>.
+    <overrides> change single settings, e.g. run_profile(protocol, "200ul", runColumns=4).
+    """
+    settings = dict(overrides)
+    settings.update(_overrides)
+    profile = settings.pop("profile", profile)
+    settings = load_profile(profile, **settings)
+    if settings["traceFile"] and trace.recording() is None:
+        return traced_run(protocol, settings)
+    extraction = Extraction(protocol, settings)
+    extraction.run()
+    return extraction
+
+
+def resume_profile(protocol, profile="viapath-16-07-20", **overrides):
+    """
+    Like run_profile(), but goes on with the run that stopped, from its checkpointFile (see checkpoint.py).
+    <profile> and <overrides> must be those of that run.
+    """
+    settings = dict(overrides)
+    settings.update(_overrides)
+    profile = settings.pop("profile", profile)
+    extraction = Extraction(protocol, load_profile(profile, **settings))
+    extraction.resume()
+    return extraction
+
+
+def traced_run(protocol, settings):
+    """
+    Runs the extraction recording every call, and writes the Chrome trace in settings["traceFile"]. In the robot the
+    times are the real ones; in a simulation, where calls take no time, they are the estimates of estimate.py.
+    """
+    with trace.Recorder() as recorder:
+        extraction = Extraction(recorder.wrap(protocol), settings)
+        extraction.run()
+    clock = "wall"
+    if protocol.is_simulating():
+        from .estimate import timed
+        timed(recorder.commands)
+        clock = "model"
+    trace.write_trace(recorder, settings["traceFile"], clock)
+    protocol.comment("Trace of the run written in %s" % settings["traceFile"])
+    return extraction
+
+
+@contextlib.contextmanager
+def overridden(profile=None, **settings):
+    """
+    Inside, run_profile() uses <profile> instead of the one the protocol script asks for, and <settings> on top.
+    This is how the estimator and the benchmarks run the protocol scripts with other settings.
+    """
+    global _overrides
+    previous = _overrides
+    _overrides = dict(previous)
+    _overrides.update(settings)
+    if profile is not None:
+        _overrides["profile"] = profile
+    try:
+        yield
+    finally:
+        _overrides = previous
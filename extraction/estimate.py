@@ -0,0 +1,317 @@
+"""
+Run time estimator. It simulates a protocol script or a run profile, records every call (see trace.py) and adds up how
+long the robot would take: gantry moves from the deck coordinates of every location and the axis speeds, aspirating and
+dispensing at the flow rates set at that moment, delays, tips and the magnet. The result is split by step.
+
+    python -m extraction.estimate protocols/RNA-extraction-200ul.py
+    python -m extraction.estimate 200ul 200ul-higher-faster --set runColumns=6 --json estimate.json
+    python -m extraction.estimate viapath-16-07-20 --trace trace.json
+
+Several targets are compared side by side. Targets ending in .py are protocol scripts, anything else is a profile.
+--profile runs the scripts with another profile, and --set changes single settings of both. --trace writes a Chrome
+trace of the simulated run, with the estimated times (open it in chrome://tracing or ui.perfetto.dev).
+The simulation needs the opentrons package (opentrons_simulate), as the robot would. --fake uses the ProtocolContext of
+fake.py instead, much faster.
+"""
+import argparse
+import json
+import math
+import os
+import runpy
+import sys
+import time
+
+from .labware import REPO_DIR, custom_labware
+from .trace import CONTAINERS, Recorder, write_trace
+
+#How long things take in the robot. Speeds are the OT-2 defaults, the rest was timed with a stopwatch
+TIME_MODEL = {
+    "speedXY": 400, # mm/s, when the pipette doesn't say its speed
+    "maxSpeeds": (600, 400), # mm/s the X and Y axes can go at most, whatever the speed asked for
+    "speedZ": 125, # mm/s
+    "arcClearance": 20, # Moves between wells go this many mm over the highest of both points
+    "directDistance": 10, # Moves shorter than this (mm) in X and Y don't arc (mixing, meneillo...)
+    "moveOverhead": 0.05, # Seconds every move loses accelerating and stopping
+    "pickUpTip": 4, # Seconds, 3 presses of a multichannel
+    "dropTip": 3,
+    "blowOut": 1,
+    "touchTip": 2,
+    "magnet": 3, # Seconds the magnet needs to go up or down
+    "home": 10,
+    "home position": (418, 353, 205), # Where the pipette is after homing
+    "trash": (340, 350, 80), # Where tips are dropped when the protocol has no fixed trash
+}
+
+CATEGORIES = ("move", "liquid", "tips", "delay", "magnet")
+
+
+def simulation_context(apiLevel="2.3"):
+    """A simulating ProtocolContext with the custom labware, like the one opentrons_simulate makes"""
+    from opentrons import simulate
+    return simulate.get_protocol_api(apiLevel, extra_labware=custom_labware())
+
+
+def record(target, profile=None, context=None, recorder=None, **settings):
+    """
+    Runs <target> (a protocol script or a profile) in a simulation and returns the recorded commands.
+    <profile> and <settings> replace what the script asks for (see engine.overridden). <context> makes the ProtocolContext
+    to use, simulation_context() if None. <recorder> is the Recorder to use, a new one if None.
+    """
+    from .engine import overridden, run_profile
+    if context is None:
+        context = simulation_context
+    with (recorder or Recorder()) as recorder:
+        if target.endswith(".py"):
+            namespace = runpy.run_path(target)
+            protocol = recorder.wrap(context(namespace.get("metadata", {}).get("apiLevel", "2.3")))
+            with overridden(profile, **settings):
+                namespace["run"](protocol)
+        else:
+            protocol = recorder.wrap(context())
+            run_profile(protocol, profile or target, **settings)
+    if recorder.trash is not None:
+        for command in recorder.commands:
+            if command["name"] == "drop_tip" and command.get("location") is None:
+                command["location"] = recorder.trash
+    return recorder.commands
+
+
+def travel_distance(start, end, model=TIME_MODEL, direct=False):
+    """mm the pipette goes through moving from <start> to <end>, the same way as travel_seconds()"""
+    if start is None or end is None or start == end:
+        return 0
+    horizontal = math.hypot(end[0] - start[0], end[1] - start[1])
+    if direct or horizontal < model["directDistance"]:
+        return math.hypot(horizontal, end[2] - start[2])
+    top = max(start[2], end[2]) + model["arcClearance"]
+    return (top - start[2]) + horizontal + (top - end[2])
+
+
+def gantry_speed(start, end, speed=None, model=TIME_MODEL):
+    """mm/s in X and Y from <start> to <end> at <speed> (speedXY if None), slower if an axis would go over its maximum"""
+    speed = speed or model["speedXY"]
+    horizontal = math.hypot(end[0] - start[0], end[1] - start[1])
+    for axis, maximum in enumerate(model["maxSpeeds"]):
+        moved = abs(end[axis] - start[axis])
+        if moved > 0:
+            speed = min(speed, maximum*horizontal/moved)
+    return speed
+
+
+def travel_seconds(start, end, model=TIME_MODEL, speed=None, direct=False):
+    """
+    Seconds to move from <start> to <end> at <speed>, going over both points unless it is a short move or a <direct> one
+    (move_to with force_direct)
+    """
+    if start is None or end is None or start == end:
+        return 0
+    horizontal = math.hypot(end[0] - start[0], end[1] - start[1])
+    speedXY = gantry_speed(start, end, speed, model)
+    if direct or horizontal < model["directDistance"]:
+        seconds = max(horizontal/speedXY, abs(end[2] - start[2])/model["speedZ"])
+    else:
+        top = max(start[2], end[2]) + model["arcClearance"]
+        seconds = (top - start[2])/model["speedZ"] + horizontal/speedXY + (top - end[2])/model["speedZ"]
+    return seconds + model["moveOverhead"]
+
+
+def plunger_seconds(command):
+    """Seconds aspirating or dispensing the volume of <command>"""
+    if not command.get("volume") or not command.get("flowRate"):
+        return 0
+    return command["volume"]/command["flowRate"]
+
+
+def timed(commands, model=TIME_MODEL):
+    """
+    Adds "seconds" and "category" to every command, following where every pipette is.
+    Containers (transfers, mixes...) take the time of the commands inside them. If nothing was recorded inside, they
+    are counted as one aspirate and one dispense.
+    """
+    positions = {}
+    picked = {}
+    for command in commands:
+        seconds = 0
+        category = None
+        name = command["name"]
+        if command["kind"] == "pipette":
+            instrument = command["instrument"]
+            here = positions.get(instrument, model["home position"])
+            location = command.get("location")
+            if name == "drop_tip" and location is None:
+                location = model["trash"]
+            elif name == "return_tip":
+                location = picked.get(instrument)
+            elif name == "home":
+                location = model["home position"]
+            if name in CONTAINERS:
+                if command.get("children") or name != "transfer":
+                    command["seconds"] = 0
+                    command["category"] = None
+                    continue
+                first = command.get("source") or here
+                speed = command.get("speed")
+                travel = travel_seconds(here, first, model, speed) + travel_seconds(first, location or first, model, speed)
+                command["seconds"] = travel
+                command["category"] = "move"
+                command["distance"] = travel_distance(here, first, model) + travel_distance(first, location or first, model)
+                command["liquid"] = plunger_seconds(command) + plunger_seconds(dict(command, flowRate=command.get("dispenseRate")))
+                positions[instrument] = location or first
+                continue
+            travel = travel_seconds(here, location, model, command.get("speed"), command.get("direct"))
+            command["distance"] = travel_distance(here, location, model, command.get("direct"))
+            if location is not None:
+                positions[instrument] = location
+            if name == "pick_up_tip":
+                picked[instrument] = location
+            if name in ("aspirate", "dispense"):
+                seconds, category = plunger_seconds(command), "liquid"
+            elif name == "blow_out":
+                seconds, category = model["blowOut"], "liquid"
+            elif name == "touch_tip":
+                seconds, category = model["touchTip"], "liquid"
+            elif name == "pick_up_tip":
+                seconds, category = model["pickUpTip"], "tips"
+            elif name in ("drop_tip", "return_tip"):
+                seconds, category = model["dropTip"], "tips"
+            command["travel"] = travel
+        elif command["kind"] == "protocol":
+            if name == "delay":
+                seconds, category = command.get("seconds", 0), "delay"
+            elif name == "home":
+                seconds, category = model["home"], "move"
+                positions.clear()
+        elif command["kind"] == "module":
+            seconds, category = model["magnet"], "magnet"
+        command["seconds"] = seconds
+        command["category"] = category
+    return commands
+
+
+def summarize(commands, model=TIME_MODEL):
+    """
+    Per step seconds of every category and the total. Steps are in the order they are first seen.
+    """
+    steps = {}
+    distance = 0
+    for command in timed(commands, model):
+        distance += command.get("distance", 0)
+        step = steps.setdefault(command["section"], dict.fromkeys(CATEGORIES, 0))
+        step["move"] += command.get("travel", 0)
+        if command["category"] is not None:
+            step[command["category"]] += command["seconds"]
+        step["liquid"] += command.get("liquid", 0)
+    rows = []
+    for name, step in steps.items():
+        row = {"step": name}
+        row.update((category, round(seconds, 1)) for category, seconds in step.items())
+        row["total"] = round(sum(step.values()), 1)
+        rows.append(row)
+    return {
+        "steps": rows,
+        "total": round(sum(row["total"] for row in rows), 1),
+        "commands": len(commands),
+        "tips": sum(1 for command in commands if command["name"] == "pick_up_tip"),
+        "distance": round(distance/1000, 2), # m
+    }
+
+
+def estimate(target, profile=None, context=None, model=TIME_MODEL, **settings):
+    """
+    Simulates <target> (protocol script or profile) and returns the summary of how long it takes (see summarize)
+    """
+    cpu = time.process_time()
+    commands = record(target, profile=profile, context=context, **settings)
+    report = summarize(commands, model)
+    report["target"] = target
+    report["profile"] = profile
+    report["settings"] = settings
+    report["cpuSeconds"] = round(time.process_time() - cpu, 2)
+    return report
+
+
+def minutes(seconds):
+    """mm:ss, or h:mm:ss for the long ones"""
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return "%d:%02d:%02d" % (seconds // 3600, seconds % 3600 // 60, seconds % 60)
+    return "%d:%02d" % (seconds // 60, seconds % 60)
+
+
+def format_table(reports):
+    """
+    One row per step and one column per report, so variants can be compared. With a single report, the time of every
+    category is shown too.
+    """
+    lines = []
+    if len(reports) == 1:
+        report = reports[0]
+        header = ["step"] + list(CATEGORIES) + ["total"]
+        rows = [[row["step"]] + [minutes(row[key]) for key in header[1:]] for row in report["steps"]]
+        rows.append(["TOTAL"] + [""]*len(CATEGORIES) + [minutes(report["total"])])
+    else:
+        header = ["step"] + [os.path.basename(report["target"]) for report in reports]
+        names = []
+        for report in reports:
+            for row in report["steps"]:
+                if row["step"] not in names:
+                    names.append(row["step"])
+        rows = []
+        for name in names:
+            row = [name]
+            for report in reports:
+                found = [step["total"] for step in report["steps"] if step["step"] == name]
+                row.append(minutes(found[0]) if found else "-")
+            rows.append(row)
+        rows.append(["TOTAL"] + [minutes(report["total"]) for report in reports])
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        lines.append("  ".join(str(cell).ljust(width) if i == 0 else str(cell).rjust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+        if row is header:
+            lines.append("  ".join("-"*width for width in widths))
+    return "\n".join(lines)
+
+
+def parse_settings(pairs):
+    """["runColumns=6", "meneillo=false"] -> {"runColumns": 6, "meneillo": False}. Values are JSON, or text if they aren't"""
+    settings = {}
+    for pair in pairs or []:
+        key, _, value = pair.partition("=")
+        try:
+            settings[key] = json.loads(value)
+        except ValueError:
+            settings[key] = value
+    return settings
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Estimates how long protocols take in the robot")
+    parser.add_argument("targets", nargs="+", help="protocol scripts (.py) or profile names")
+    parser.add_argument("--profile", help="run the scripts with this profile instead of their own")
+    parser.add_argument("--set", action="append", metavar="SETTING=VALUE", help="change a setting, can be repeated")
+    parser.add_argument("--json", metavar="FILE", help="also write the estimates to FILE ('-' for the screen)")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace of the run to FILE (only one target)")
+    parser.add_argument("--fake", action="store_true", help="use the fake ProtocolContext (fake.py) instead of opentrons_simulate")
+    args = parser.parse_args(argv)
+    settings = parse_settings(args.set)
+    context = None
+    if args.fake:
+        from .fake import ProtocolContext as context
+    if args.trace:
+        if len(args.targets) > 1:
+            parser.error("--trace takes a single target")
+        recorder = Recorder()
+        timed(record(args.targets[0], profile=args.profile, context=context, recorder=recorder, **settings))
+        write_trace(recorder, args.trace, clock="model")
+    reports = [estimate(target, profile=args.profile, context=context, **settings) for target in args.targets]
+    if args.json == "-":
+        print(json.dumps(reports, indent=2))
+        return
+    print(format_table(reports))
+    if args.json:
+        with open(args.json, "w") as handle:
+            json.dump(reports, handle, indent=2)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+"""
+A stand-in for the ProtocolContext of the opentrons package, to run protocols in a fraction of a second. opentrons_simulate
+loads the whole hardware stack (and takes its time), this only keeps what the protocols here use: loading labware,
+modules and pipettes, tips, aspirate, dispense, transfer, mix, moves, delays and the magnet. Every call is written in
+protocol.commands, and the volume in every pipette and well is kept, so a protocol can be checked in a loop:
+
+    from extraction.fake import ProtocolContext
+    protocol = ProtocolContext()
+    run_profile(protocol, "viapath-16-07-20", runColumns=2)
+    protocol.commands
+
+or the estimator and the sweeps can use it instead of the simulation (--fake). Well positions come from the labware
+definitions (see labware.py), so moves are as long as in the robot. Labware without a definition here gets 8 rows of 12
+wells, 9 mm apart, like most plates and tipracks. With opentronsLabware=False, only the labware of custom_labware/ is
+placed with its definition, so positions don't depend on the labware of the installed opentrons (see golden.py).
+Locations are always the ones of this module, whatever opentrons is installed, and the opentrons ones a script makes
+itself are understood too. The engine runs on it without opentrons as long as the labware of the profile is in
+custom_labware/ or opentrons_labware/ (liquid tracking needs the definitions).
+Mistakes the robot would stop at raise RuntimeError: aspirating without a tip, more than fits, or picking up a tip
+with one already on.
+"""
+import collections
+import runpy
+
+from .labware import custom_labware, labware_definition
+
+
+#Not the ones of opentrons.types even if it is installed, so runs don't depend on its version
+class Point(collections.namedtuple("Point", "x y z")):
+    def __new__(cls, x=0.0, y=0.0, z=0.0):
+        return super().__new__(cls, x, y, z)
+
+    def __add__(self, other):
+        return Point(self.x + other.x, self.y + other.y, self.z + other.z)
+
+
+class Location(collections.namedtuple("Location", "point labware")):
+    def move(self, point):
+        return Location(self.point + point, self.labware)
+
+
+def place_of(location):
+    """
+    Well or labware of <location>. An opentrons Location (made by the script with opentrons.types) keeps it in a
+    LabwareLike, with the fake Well in its .object
+    """
+    labware = getattr(location, "labware", None)
+    return getattr(labware, "object", labware)
+
+#Front left corner of every slot of the OT-2 deck
+SLOTS = {
+    1: (0, 0), 2: (132.5, 0), 3: (265, 0),
+    4: (0, 90.5), 5: (132.5, 90.5), 6: (265, 90.5),
+    7: (0, 181), 8: (132.5, 181), 9: (265, 181),
+    10: (0, 271), 11: (132.5, 271), 12: (265, 271),
+}
+
+#Where labware sits on a module, from the corner of its slot (labwareOffset of the module definitions)
+MODULE_OFFSETS = {
+    "GEN1": (0.125, -0.125, 82.25),
+    "GEN2": (-1.175, -0.125, 82.25),
+}
+
+#Default flow rates (ul/s) of the pipettes, by max volume
+FLOW_RATES = {20: 7.6, 300: 94, 1000: 274.7}
+
+
+def generic_definition(loadName):
+    """Definition for labware without one: 8 rows of 12 wells, 9 mm apart, or one well per column for 12 well reservoirs"""
+    rows = "A" if "12" in loadName and "reservoir" in loadName else "ABCDEFGH"
+    wells = {}
+    for column in range(1, 13):
+        for row, letter in enumerate(rows):
+            wells[letter + str(column)] = {"shape": "circular", "diameter": 8, "depth": 40, "totalLiquidVolume": 2000,
+            "x": 14.38 + 9*(column - 1), "y": 74.24 - 9*row, "z": 2}
+    return {
+        "parameters": {"loadName": loadName, "isTiprack": "tip" in loadName},
+        "wells": wells,
+        "ordering": [[letter + str(column) for letter in rows] for column in range(1, 13)],
+        "cornerOffsetFromSlot": {"x": 0, "y": 0, "z": 0},
+    }
+
+
+def trash_definition():
+    return {
+        "parameters": {"loadName": "opentrons_1_trash_1100ml_fixed", "isTiprack": False},
+        "wells": {"A1": {"shape": "rectangular", "xDimension": 172.86, "yDimension": 165.86, "depth": 82, "totalLiquidVolume": 1100000,
+        "x": 82.84, "y": 80, "z": 0}},
+        "ordering": [["A1"]],
+        "cornerOffsetFromSlot": {"x": 0, "y": 0, "z": 0},
+    }
+
+
+def find_definition(loadName, opentronsLabware=True):
+    """
+    Definition of <loadName> (see labware.labware_definition), or generic_definition() if there is none here.
+    Without <opentronsLabware>, only custom_labware/ is looked at.
+    """
+    if not opentronsLabware:
+        return custom_labware().get(loadName) or generic_definition(loadName)
+    try:
+        return labware_definition(loadName)
+    except (ImportError, KeyError, OSError, ValueError):
+        return generic_definition(loadName)
+
+
+class Well:
+    def __init__(self, labware, name, geometry, origin):
+        self.parent = labware
+        self.well_name = name
+        self.display_name = "%s of %s" % (name, labware.name)
+        self.geometry = geometry
+        self.depth = geometry["depth"]
+        self.diameter = geometry.get("diameter")
+        self.max_volume = geometry.get("totalLiquidVolume", 0)
+        self.has_tip = labware.is_tiprack
+        self.volume = 0 # ul in the well, what was dispensed minus what was aspirated
+        self._bottom = Point(origin[0] + geometry["x"], origin[1] + geometry["y"], origin[2] + geometry["z"])
+
+    def bottom(self, z=0):
+        return Location(self._bottom + Point(0, 0, z), self)
+
+    def top(self, z=0):
+        return Location(self._bottom + Point(0, 0, self.depth + z), self)
+
+    def center(self):
+        return Location(self._bottom + Point(0, 0, self.depth/2), self)
+
+    def __repr__(self):
+        return self.display_name
+
+
+class Labware:
+    def __init__(self, loadName, slot, label=None, offset=(0, 0, 0), definition=None):
+        definition = definition or find_definition(loadName)
+        self.load_name = loadName
+        self.name = label or loadName
+        self.parent = slot
+        self.is_tiprack = bool(definition["parameters"].get("isTiprack"))
+        corner = definition.get("cornerOffsetFromSlot", {"x": 0, "y": 0, "z": 0})
+        x, y = SLOTS[int(slot)]
+        origin = (x + offset[0] + corner["x"], y + offset[1] + corner["y"], offset[2] + corner["z"])
+        self._ordering = [name for column in definition["ordering"] for name in column]
+        self._wells = dict((name, Well(self, name, definition["wells"][name], origin)) for name in self._ordering)
+
+    def __getitem__(self, name):
+        return self._wells[name]
+
+    def wells(self):
+        return [self._wells[name] for name in self._ordering]
+
+    def wells_by_name(self):
+        return dict(self._wells)
+
+    def __repr__(self):
+        return "%s on %s" % (self.name, self.parent)
+
+
+class FlowRates:
+    def __init__(self, rate):
+        self.aspirate = rate
+        self.dispense = rate
+        self.blow_out = rate
+
+
+class InstrumentContext:
+    def __init__(self, protocol, name, mount, tip_racks=None):
+        self._protocol = protocol
+        self.name = name
+        self.mount = mount
+        self.channels = 8 if "multi" in name else 1
+        self.max_volume = int(name.split("_")[0][1:])
+        self.min_volume = self.max_volume/20
+        self.flow_rate = FlowRates(FLOW_RATES.get(self.max_volume, self.max_volume/3))
+        self.tip_racks = list(tip_racks or [])
+        self.current_volume = 0
+        self.default_speed = 400 # mm/s
+        self.tip = None # Well the tip on the pipette came from
+        self.location = None
+
+    def _log(self, name, location=None, **details):
+        self._protocol._log(name, self.mount, location, **details)
+
+    def _go(self, location):
+        """Moves to <location> (a Location or a Well, taken at its top). Stays where it is with None"""
+        if location is None:
+            return
+        if isinstance(location, Well):
+            location = location.top()
+        self.location = Location(Point(*location.point), place_of(location))
+
+    def _where(self):
+        return self.location.labware if self.location is not None else None
+
+    def _need_tip(self, what):
+        if self.tip is None:
+            raise RuntimeError("Cannot %s without a tip attached" % what)
+
+    def pick_up_tip(self, location=None):
+        if self.tip is not None:
+            raise RuntimeError("The pipette on the %s mount has a tip already" % self.mount)
+        if location is None:
+            free = [well for rack in self.tip_racks for well in rack.wells() if well.has_tip]
+            if not free:
+                raise RuntimeError("There are no tips left in the tipracks of the %s pipette" % self.mount)
+            location = free[0]
+        well = location if isinstance(location, Well) else place_of(location)
+        self._go(well.top())
+        well.has_tip = False
+        self.tip = well
+        self.current_volume = 0
+        self._log("pick_up_tip", self.location)
+        return self
+
+    def drop_tip(self, location=None):
+        self._need_tip("drop a tip")
+        if location is None:
+            location = self._protocol.fixed_trash["A1"].top()
+        elif isinstance(location, Well):
+            location.has_tip = True
+            location = location.top()
+        self._go(location)
+        self.tip = None
+        self.current_volume = 0
+        self._log("drop_tip", self.location)
+        return self
+
+    def return_tip(self):
+        self._need_tip("return a tip")
+        well = self.tip
+        self.drop_tip(well)
+        return self
+
+    def aspirate(self, volume=None, location=None, rate=1.0):
+        self._need_tip("aspirate")
+        if volume is None:
+            volume = self.max_volume - self.current_volume
+        if self.current_volume + volume > self.max_volume + 0.01:
+            raise RuntimeError("Cannot aspirate more than the %s ul of the pipette (%s ul)" % (self.max_volume, self.current_volume + volume))
+        self._go(location)
+        where = self._where()
+        if isinstance(where, Well):
+            where.volume = max(where.volume - volume*self.channels, 0)
+        self.current_volume += volume
+        self._log("aspirate", self.location, volume=volume, flowRate=self.flow_rate.aspirate*rate)
+        return self
+
+    def dispense(self, volume=None, location=None, rate=1.0):
+        self._need_tip("dispense")
+        #More than there is only empties the tip, as in the robot
+        volume = self.current_volume if volume is None else min(volume, self.current_volume)
+        self._go(location)
+        where = self._where()
+        if isinstance(where, Well):
+            where.volume += volume*self.channels
+        self.current_volume -= volume
+        self._log("dispense", self.location, volume=volume, flowRate=self.flow_rate.dispense*rate)
+        return self
+
+    def blow_out(self, location=None):
+        self._need_tip("blow out")
+        self._go(location)
+        where = self._where()
+        if isinstance(where, Well):
+            where.volume += self.current_volume*self.channels
+        self.current_volume = 0
+        self._log("blow_out", self.location, flowRate=self.flow_rate.blow_out)
+        return self
+
+    def touch_tip(self, location=None, radius=1.0, v_offset=-1.0, speed=60.0):
+        self._need_tip("touch tip")
+        well = location if isinstance(location, Well) else self._where()
+        if isinstance(well, Well):
+            self._go(well.top(v_offset))
+        self._log("touch_tip", self.location)
+        return self
+
+    def move_to(self, location, force_direct=False, minimum_z_height=None, speed=None):
+        self._go(location)
+        self._log("move_to", self.location)
+        return self
+
+    def air_gap(self, volume=None, height=None):
+        self._need_tip("air gap")
+        well = self._where()
+        if isinstance(well, Well):
+            self.move_to(well.top(height or 5))
+        self.aspirate(volume, rate=1.0)
+        return self
+
+    def mix(self, repetitions=1, volume=None, location=None, rate=1.0):
+        self._need_tip("mix")
+        volume = volume or self.max_volume
+        self.aspirate(volume, location, rate)
+        self.dispense(volume, rate=rate)
+        for _ in range(repetitions - 1):
+            self.aspirate(volume, rate=rate)
+            self.dispense(volume, rate=rate)
+        return self
+
+    def transfer(self, volume, source, dest, new_tip="once", air_gap=0, **kwargs):
+        """As many trips as <volume> needs with the pipette (and <air_gap>), each one an aspirate and a dispense"""
+        if new_tip != "never":
+            self.pick_up_tip()
+        left = volume
+        while left > 0:
+            trip = min(left, self.max_volume - air_gap)
+            self.aspirate(trip, source)
+            if air_gap:
+                self.air_gap(air_gap)
+            self.dispense(trip + air_gap, dest)
+            left -= trip
+        if new_tip != "never":
+            self.drop_tip()
+        return self
+
+    def home(self):
+        self.location = None
+        self._log("home")
+        return self
+
+
+class MagneticModuleContext:
+    def __init__(self, protocol, name, slot):
+        self._protocol = protocol
+        self.name = name
+        self.slot = slot
+        self.generation = "GEN2" if "2" in name else "GEN1"
+        self.labware = None
+        self.status = "disengaged"
+
+    def load_labware(self, name, label=None):
+        self.labware = Labware(name, self.slot, label, MODULE_OFFSETS[self.generation], find_definition(name, self._protocol.opentronsLabware))
+        return self.labware
+
+    def engage(self, height=None, offset=None, height_from_base=None):
+        self.status = "engaged"
+        self._protocol._log("engage", self.slot, height=height)
+
+    def disengage(self):
+        self.status = "disengaged"
+        self._protocol._log("disengage", self.slot)
+
+
+class ProtocolContext:
+    """
+    The protocol. <commands> has every call: {"name", "target" (mount, module slot or None), "location" (x, y, z) and
+    the "volume", "flowRate", "seconds", "height" or "text" it had}
+    """
+
+    def __init__(self, apiLevel="2.3", opentronsLabware=True):
+        self.api_version = apiLevel
+        self.opentronsLabware = opentronsLabware
+        self.commands = []
+        self.deck = {}
+        self.fixed_trash = Labware("opentrons_1_trash_1100ml_fixed", 12, definition=trash_definition())
+        self.deck[12] = self.fixed_trash
+
+    def _log(self, name, target=None, location=None, **details):
+        command = {"name": name, "target": target, "location": tuple(location.point) if location is not None else None}
+        command.update(details)
+        self.commands.append(command)
+
+    def _place(self, labware, slot):
+        if int(slot) in self.deck:
+            raise ValueError("Slot %s has %s already" % (slot, self.deck[int(slot)]))
+        self.deck[int(slot)] = labware
+        return labware
+
+    def load_labware(self, name, location, label=None, namespace=None, version=None):
+        return self._place(Labware(name, location, label, definition=find_definition(name, self.opentronsLabware)), location)
+
+    def load_module(self, name, location):
+        lowered = name.lower()
+        if "magnet" not in lowered and "magdeck" not in lowered:
+            raise ValueError("The fake ProtocolContext only has the magnetic module, not %s" % name)
+        return self._place(MagneticModuleContext(self, name, location), location)
+
+    def load_instrument(self, instrument_name, mount, tip_racks=None, replace=False):
+        return InstrumentContext(self, instrument_name, mount, tip_racks)
+
+    def delay(self, seconds=0, minutes=0, msg=None):
+        self._log("delay", seconds=seconds + 60*minutes, text=msg)
+
+    def comment(self, msg):
+        self._log("comment", text=msg)
+
+    def pause(self, msg=None):
+        self._log("pause", text=msg)
+
+    def home(self):
+        self._log("home")
+
+    def is_simulating(self):
+        return True
+
+
+def run_script(path, protocol=None):
+    """Runs the protocol script in <path> on <protocol> (a new ProtocolContext if None) and returns the protocol"""
+    namespace = runpy.run_path(path)
+    if protocol is None:
+        protocol = ProtocolContext(namespace.get("metadata", {}).get("apiLevel", "2.3"))
+    namespace["run"](protocol)
+    return protocol
@@ -0,0 +1,325 @@
+"""
+Golden command traces. Every protocol script in protocols/ and tests/ is run on the fake ProtocolContext (see fake.py)
+for some numbers of columns, and what the robot is asked to do (every call, in order, with the step it belongs to, the
+pipette or module, the well, the deck coordinates, the volume, the flow rate, the speed and the delays) is kept in
+benchmarks/golden/. Later runs are compared with them call by call, so a change that should only make things faster can
+be shown not to change what the robot does, or where it starts doing something else and how much time that costs:
+
+    python -m extraction.golden --save                      # Writes the golden traces
+    python -m extraction.golden                             # Compares with them, exits with 1 if a run changed
+    python -m extraction.golden protocols/RNA-extraction-200ul.py --columns 6
+
+The scripts import opentrons and the profiles use some of its labware (the nest reservoirs), so it has to be installed,
+but traces don't depend on its version: the fake has its own locations, and places only the labware of custom_labware/
+with its definition (the rest gets the generic layout of the fake). Comments are not kept. Scripts in EXCLUDED don't
+get traces.
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import os
+import sys
+
+from .benchmark import scripts, uses_profiles
+from .estimate import REPO_DIR, TIME_MODEL, minutes, record, summarize
+from .fake import ProtocolContext
+from .profile import ColumnsError
+from .trace import CONTAINERS, MODULE_CALLS, Recorder
+
+GOLDEN_DIR = os.path.join(REPO_DIR, "benchmarks", "golden")
+COLUMNS = [1, 6, 12]
+
+#Scripts that can't run with the opentrons of today, relative to the repository
+EXCLUDED = (
+    "tests/test_calibration0.py", # protocol_api.labware.get_all_labware_definitions() is not in opentrons anymore
+)
+
+#What every call of a trace has, in this order. The last two (speed and force_direct of the move) are only there if the
+#move is not the one the robot does by default, so runs without "motion" settings keep the traces they had
+FIELDS = ("section", "op", "target", "well", "location", "volume", "flowRate", "seconds", "height", "speed", "direct")
+
+#What estimate.py needs of every call, kept with the call so a trace can be timed again
+ESTIMATED = ("location", "source", "volume", "flowRate", "dispenseRate", "speed", "direct", "seconds", "height", "text")
+
+
+class CallRecorder(Recorder):
+    """
+    Recorder that also writes down the arguments of every call with labware and wells as {"slot", "well"} and locations
+    with their "point", and the pipette (its mount) or module (its slot) that got it, so traces don't depend on ids.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.places = {} # {id(labware or well): {"slot"} or {"slot", "well"}}
+        self.targets = {} # {id(pipette or module): mount or slot}
+
+    def wrap(self, protocol):
+        loadLabware = protocol.load_labware
+        loadModule = protocol.load_module
+        loadInstrument = protocol.load_instrument
+
+        def load_labware(name, location, label=None, *args, **kwargs):
+            labware = loadLabware(name, location, label, *args, **kwargs)
+            self.register(labware, location)
+            return labware
+
+        def load_module(name, location, *args, **kwargs):
+            module = loadModule(name, location, *args, **kwargs)
+            self.targets[id(module)] = str(location)
+            moduleLabware = module.load_labware
+
+            def load_module_labware(name, label=None, *args, **kwargs):
+                labware = moduleLabware(name, label, *args, **kwargs)
+                self.register(labware, location)
+                return labware
+
+            module.load_labware = load_module_labware
+            return module
+
+        def load_instrument(name, mount, *args, **kwargs):
+            instrument = loadInstrument(name, mount, *args, **kwargs)
+            self.targets[id(instrument)] = mount
+            return instrument
+
+        protocol.load_labware = load_labware
+        protocol.load_module = load_module
+        protocol.load_instrument = load_instrument
+        trash = getattr(protocol, "fixed_trash", None)
+        if trash is not None:
+            self.register(trash, 12)
+        return super().wrap(protocol)
+
+    def register(self, labware, slot):
+        self.places[id(labware)] = {"slot": str(slot)}
+        for name, well in labware.wells_by_name().items():
+            self.places[id(well)] = {"slot": str(slot), "well": name}
+
+    def value(self, value):
+        """<value> of an argument as JSON. Raises ValueError if it can't be"""
+        if value is None or isinstance(value, (bool, int, float, str)):
+            return value
+        if hasattr(value, "point") and hasattr(value, "labware"):
+            found = {}
+            if value.labware is not None:
+                found = dict(self.value(getattr(value.labware, "object", value.labware)) or {})
+            found["point"] = [round(value.point.x, 3), round(value.point.y, 3), round(value.point.z, 3)]
+            return found
+        if hasattr(value, "x") and hasattr(value, "z"):
+            return {"point": [round(value.x, 3), round(value.y, 3), round(value.z, 3)]}
+        if isinstance(value, (list, tuple)):
+            return [self.value(item) for item in value]
+        if id(value) in self.places:
+            return dict(self.places[id(value)])
+        raise ValueError("%r is not labware of the run, it can't go in a trace" % (value,))
+
+    def describe(self, target, name, kind, arguments):
+        command = super().describe(target, name, kind, arguments)
+        command["target"] = self.targets.get(id(target))
+        command["args"] = {}
+        for key, value in arguments.items():
+            if isinstance(value, dict): # **kwargs, like the air_gap of a transfer
+                command["args"].update((keyword, self.value(item)) for keyword, item in value.items())
+            else:
+                command["args"][key] = self.value(value)
+        return command
+
+
+def calls(commands):
+    """
+    The calls of the recorded <commands> made by the protocol, without the ones they made inside. Transfers and mixes
+    are replaced by the calls they made, if they were recorded.
+    """
+    found = []
+    skip = 0
+    for position, command in enumerate(commands):
+        if position < skip:
+            continue
+        if command["name"] in CONTAINERS and command.get("children"):
+            continue
+        found.append({"op": command["name"], "target": command["target"], "section": command["section"], "args": command["args"],
+        "estimate": dict((key, command[key]) for key in ESTIMATED if command.get(key) is not None)})
+        skip = position + 1 + command.get("children", 0)
+    return found
+
+
+def golden_context(apiLevel="2.3"):
+    """Fake ProtocolContext with only the labware of the repository"""
+    return ProtocolContext(apiLevel, opentronsLabware=False)
+
+
+def rounded(value):
+    if isinstance(value, (list, tuple)):
+        return [rounded(item) for item in value]
+    if isinstance(value, float):
+        return round(value, 2)
+    return value
+
+
+def well_of(args):
+    """"slot:well" of the first well in the arguments of a call, or None"""
+    for value in args.values():
+        if isinstance(value, dict) and "slot" in value:
+            return "%s:%s" % (value["slot"], value.get("well", ""))
+    return None
+
+
+def trace_run(script, runColumns=None):
+    """Calls of <script> run with <runColumns> (None leaves the script as it is), as lists of FIELDS"""
+    settings = {} if runColumns is None else {"runColumns": runColumns}
+    trace = []
+    for op in calls(record(script, context=golden_context, recorder=CallRecorder(), **settings)):
+        if op["op"] == "comment":
+            continue
+        estimate = op["estimate"]
+        call = [op["section"], op["op"], op["target"], well_of(op["args"])] + [rounded(estimate.get(key)) for key in FIELDS[4:9]]
+        speed = estimate.get("speed")
+        if speed == TIME_MODEL["speedXY"]:
+            speed = None
+        if speed is not None or estimate.get("direct"):
+            call += [rounded(speed), estimate.get("direct")]
+        trace.append(call)
+    return trace
+
+
+def record_traces(script, columns=COLUMNS):
+    """{runColumns: trace} of <script>. Scripts that don't use profiles have a single "default" run"""
+    if not uses_profiles(script):
+        return {"default": trace_run(script)}
+    runs = {}
+    for runColumns in columns:
+        try:
+            runs[str(runColumns)] = trace_run(script, runColumns)
+        except ColumnsError:
+            continue
+    return runs
+
+
+def golden_path(script):
+    return os.path.join(GOLDEN_DIR, os.path.splitext(os.path.basename(script))[0] + ".json.gz")
+
+
+def read_golden(script):
+    """{runColumns: trace} saved for <script>, or None"""
+    path = golden_path(script)
+    if not os.path.isfile(path):
+        return None
+    with gzip.open(path, "rt") as handle:
+        return json.load(handle)["runs"]
+
+
+def save_golden(script, runs):
+    """Writes the traces of <runs> as the golden ones of <script>, next to the ones of other columns already saved"""
+    saved = read_golden(script) or {}
+    saved.update(runs)
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    #No time in the gzip header, so saving the same traces again doesn't change the file
+    with open(golden_path(script), "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as compressed:
+            compressed.write(json.dumps({"script": os.path.relpath(os.path.abspath(script), REPO_DIR), "runs": saved},
+            separators=(",", ":"), sort_keys=True).encode("utf-8"))
+
+
+def trace_commands(trace):
+    """A trace as the recorded commands estimate.py times"""
+    commands = []
+    for call in trace:
+        command = dict(zip(FIELDS, call))
+        command["name"] = command.pop("op")
+        if command["target"] in ("left", "right"):
+            command["kind"] = "pipette"
+        elif command["name"] in MODULE_CALLS:
+            command["kind"] = "module"
+        else:
+            command["kind"] = "protocol"
+        command["instrument"] = command["target"]
+        if command["location"] is not None:
+            command["location"] = tuple(command["location"])
+        commands.append(dict((key, value) for key, value in command.items() if value is not None))
+    return commands
+
+
+def trace_seconds(trace):
+    """Estimated duration of <trace>"""
+    return summarize(trace_commands(trace))["total"]
+
+
+def compare_traces(golden, current):
+    """
+    None if <current> does the same as <golden>. If not, {"position" of the first call that changes, the "golden" and
+    "current" calls there (None past the end), the "lengths" of both and the "seconds" the run gained (or lost)}
+    """
+    position = 0
+    while position < min(len(golden), len(current)) and golden[position] == current[position]:
+        position += 1
+    if position == len(golden) == len(current):
+        return None
+    return {
+        "position": position,
+        "golden": golden[position] if position < len(golden) else None,
+        "current": current[position] if position < len(current) else None,
+        "lengths": (len(golden), len(current)),
+        "seconds": round(trace_seconds(current) - trace_seconds(golden), 1),
+    }
+
+
+def format_call(call):
+    if call is None:
+        return "(end of the run)"
+    details = ", ".join("%s=%s" % (key, value) for key, value in zip(FIELDS[2:], call[2:]) if value is not None)
+    return "%s %s(%s)" % (call[0], call[1], details)
+
+
+def format_change(key, change):
+    return "\n".join([
+        "CHANGED %s at call %s of %s (now %s calls), %+d s (%s)" % (key, change["position"], change["lengths"][0],
+        change["lengths"][1], change["seconds"], minutes(abs(change["seconds"]))),
+        "  golden:  " + format_call(change["golden"]),
+        "  current: " + format_call(change["current"]),
+    ])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compares what every protocol asks the robot to do with its golden trace")
+    parser.add_argument("scripts", nargs="*", help="scripts to check, all of protocols/ and tests/ by default")
+    parser.add_argument("--columns", nargs="+", type=int, default=COLUMNS, help="values of runColumns (default 1, 6 and 12)")
+    parser.add_argument("--save", action="store_true", help="save the traces as the golden ones")
+    args = parser.parse_args(argv)
+    if importlib.util.find_spec("opentrons") is None:
+        print("The protocol scripts import opentrons, install it to record or check the golden traces")
+        return 1
+    changed = 0
+    for script in args.scripts or scripts():
+        name = os.path.relpath(os.path.abspath(script), REPO_DIR)
+        if name.replace(os.sep, "/") in EXCLUDED:
+            continue
+        try:
+            runs = record_traces(script, args.columns)
+        except Exception as error:
+            print("ERROR %s: %s: %s" % (name, type(error).__name__, error))
+            changed += 1
+            continue
+        if args.save:
+            save_golden(script, runs)
+            print("Saved %s (%s)" % (name, ", ".join(runs)))
+            continue
+        golden = read_golden(script)
+        if golden is None:
+            print("%s has no golden trace, make it with --save" % name)
+            continue
+        for key, trace in runs.items():
+            if key not in golden:
+                continue
+            change = compare_traces(golden[key], trace)
+            if change is None:
+                print("same    %s (%s)" % (name, key))
+            else:
+                print(format_change("%s (%s)" % (name, key), change))
+                changed += 1
+    if changed:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
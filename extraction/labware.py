@@ -0,0 +1,112 @@
+"""
+Labware definitions. The ones in custom_labware/ are read from there (.json files, and the .json inside .zip files as
+they come from the Opentrons labware creator), everything else comes from the opentrons package. Copies of the
+Opentrons labware the profiles use are kept in opentrons_labware/, so plans, the fake robot and the liquid model work
+where opentrons is not installed.
+Files are parsed and checked once: the definitions are kept by the hash of the file they came from, so a run, a batch of
+simulations or a tool only reads them again if the file changed.
+"""
+import functools
+import hashlib
+import json
+import os
+import zipfile
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LABWARE_DIR = os.path.join(REPO_DIR, "custom_labware")
+OPENTRONS_LABWARE_DIR = os.path.join(REPO_DIR, "opentrons_labware") # Version 1 of the standard labware, as opentrons has it
+
+#Keys every definition needs for the robot (and for liquid.py) to use it
+REQUIRED_KEYS = ("parameters", "wells", "ordering", "dimensions", "cornerOffsetFromSlot", "namespace", "version", "schemaVersion")
+
+_hashes = {} # {path: (modification time, size, hash)}, so files that didn't change are not hashed again
+_parsed = {} # {hash: [definitions in that file]}
+
+
+def file_hash(path):
+    """sha256 of the contents of <path>. Only computed again if the file changed since the last time"""
+    stat = os.stat(path)
+    known = _hashes.get(path)
+    if known is not None and known[:2] == (stat.st_mtime, stat.st_size):
+        return known[2]
+    with open(path, "rb") as handle:
+        digest = hashlib.sha256(handle.read()).hexdigest()
+    _hashes[path] = (stat.st_mtime, stat.st_size, digest)
+    return digest
+
+
+def check_definition(definition, source):
+    """Raises ValueError if <definition> (read from <source>) is not a labware definition the robot can load"""
+    missing = [key for key in REQUIRED_KEYS if key not in definition]
+    if missing:
+        raise ValueError("%s is not a labware definition, it has no %s" % (source, ", ".join(missing)))
+    if not definition["parameters"].get("loadName"):
+        raise ValueError("%s has no loadName" % source)
+    for well in [well for column in definition["ordering"] for well in column]:
+        if well not in definition["wells"]:
+            raise ValueError("%s orders well %s, but it is not in its wells" % (source, well))
+
+
+def read_definitions(path):
+    """Checked definitions in <path>, a .json file or a .zip with .json files"""
+    definitions = []
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for name in sorted(archive.namelist()):
+                if name.endswith(".json"):
+                    definitions.append((json.loads(archive.read(name).decode("utf-8")), "%s:%s" % (path, name)))
+    else:
+        with open(path) as handle:
+            definitions.append((json.load(handle), path))
+    for definition, source in definitions:
+        check_definition(definition, source)
+    return [definition for definition, _ in definitions]
+
+
+def labware_files(folder=LABWARE_DIR):
+    """Definition files (.json and .zip) in <folder>"""
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder)) if name.endswith((".json", ".zip"))]
+
+
+def custom_labware(folder=LABWARE_DIR):
+    """
+    Definitions of custom_labware/ by loadName, to load them in a simulation. They are shared between calls, so don't
+    change them. Raises ValueError if two files define the same loadName.
+    """
+    definitions = {}
+    sources = {}
+    for path in labware_files(folder):
+        digest = file_hash(path)
+        if digest not in _parsed:
+            _parsed[digest] = read_definitions(path)
+        for definition in _parsed[digest]:
+            loadName = definition["parameters"]["loadName"]
+            if loadName in definitions:
+                raise ValueError("%s is defined in %s and in %s" % (loadName, sources[loadName], os.path.basename(path)))
+            definitions[loadName] = definition
+            sources[loadName] = os.path.basename(path)
+    return definitions
+
+
+@functools.lru_cache(maxsize=None)
+def _opentrons_definition(loadName):
+    try:
+        from opentrons.protocol_api.labware import get_labware_definition
+    except ImportError:
+        #No opentrons here, the copy in opentrons_labware/ will do (KeyError like opentrons if there is none)
+        path = os.path.join(OPENTRONS_LABWARE_DIR, loadName + ".json")
+        if not os.path.exists(path):
+            raise KeyError("%s is not in %s and opentrons is not installed" % (loadName, OPENTRONS_LABWARE_DIR))
+        return read_definitions(path)[0]
+    return get_labware_definition(loadName)
+
+
+def labware_definition(loadName):
+    """
+    Definition of the labware <loadName>, from custom_labware/ or from the labware that comes with opentrons (or its copy
+    in opentrons_labware/ without opentrons)
+    """
+    definitions = custom_labware()
+    if loadName in definitions:
+        return definitions[loadName]
+    return _opentrons_definition(loadName)
@@ -0,0 +1,220 @@
+"""
+Deck layout optimizer. From the planned commands of a run profile it works out where the pipette goes (which labware
+after which), and then tries every way of placing the magnet, the reservoirs, the output plate and the parking rack
+(the magnetic module only fits in some slots) with the tipracks in the slots that are left, to find the one where the
+gantry travels less. Distances are between slot centres, so they are for comparing layouts, not for timing a run
+(estimate.py does that).
+
+    python -m extraction.layout viapath-16-07-20
+    python -m extraction.layout viapath-16-07-20-96samples --json
+"""
+import argparse
+import collections
+import functools
+import itertools
+import json
+import math
+import sys
+
+from .estimate import TIME_MODEL, parse_settings
+from .profile import load_profile
+from .scheduler import build_steps, plan
+
+            # 10    11      TRASH
+            # 7     8       9
+            # 4     5       6
+            # 1     2       3
+SLOTS = list(range(1, 12))
+TRASH = 12
+MAGNET_SLOTS = (1, 3, 4, 6, 7, 9, 10) # Where the magnetic module can go
+SLOT_SIZE = (132.5, 90.5) # mm between slot origins, in X and Y
+ROLES = ("magnet", "reagents", "waste", "outplate", "parking")
+
+
+def slot_center(slot):
+    """(x, y) of the centre of a deck slot (mm)"""
+    return (((slot - 1) % 3)*SLOT_SIZE[0] + 63.88, ((slot - 1) // 3)*SLOT_SIZE[1] + 42.74)
+
+
+@functools.lru_cache(maxsize=None)
+def distance(slotA, slotB):
+    """mm between the centres of two slots"""
+    a = slot_center(slotA)
+    b = slot_center(slotB)
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+def visits(steps, commands, settings):
+    """
+    Labware the pipette goes to, in order, for <commands>: "magnet" (the deep well plate), "reagents", "waste", "outplate",
+    "parking", "trash", ("tips", n) for the n-th rack of deck["tipracks"] or "smallTips" for the tips of the smallPipette.
+    It follows what the engine does in every command.
+    """
+    racks = len(settings["deck"]["tipracks"])
+    path = []
+    taken = [0]
+    current = [None] # Where the tip in the pipette came from
+
+    def take(fresh=True, small=False):
+        if small:
+            current[0] = "smallTips"
+        elif fresh:
+            current[0] = ("tips", max(racks - 1 - taken[0] // 12, 0)) # Tips are taken from the last rack first
+            taken[0] += 1
+        else:
+            current[0] = "parking"
+        return current[0]
+
+    def leave(park=False):
+        if park:
+            return "parking"
+        if settings["returnTips"]:
+            return current[0]
+        return "trash"
+
+    for command in commands:
+        kind = command["type"]
+        if kind in ("wait", "magnet", "swap"):
+            continue
+        if kind == "refill":
+            taken[0] = taken[0] % 12
+            continue
+        step = steps[command["step"]]
+        if kind == "premix":
+            path += [take(), "reagents"]
+        elif kind == "distribute":
+            aspirations = math.ceil(step["vol"]*len(command["IDs"]) / (settings["tipVolume"] - settings["disposalVolume"]))
+            path.append(take())
+            path += ["reagents", "magnet"]*aspirations + ["reagents", leave()]
+        elif step["action"] == "add":
+            if not command["tipOn"]:
+                path.append(take())
+            if not command["mixOnly"]:
+                path += ["reagents", "magnet"]*math.ceil(step["vol"] / settings["tipVolume"])
+            path += ["magnet", leave(step.get("park"))]
+        elif step["action"] == "remove":
+            small = step.get("pipette") == "small"
+            path.append(take(step.get("newtip"), small))
+            path += ["magnet", "waste"]*math.ceil(step["vol"] / (settings["smallVolume"] if small else settings["tipVolume"]))
+            path.append(leave(step.get("park")))
+        else:
+            path.append(take(step.get("newtip", True), step.get("pipette") == "small"))
+            path += ["magnet", "outplate", leave()]
+    return path
+
+
+def transitions(path):
+    """How many times the pipette goes from one labware to another"""
+    counts = collections.Counter()
+    for a, b in zip(path, path[1:]):
+        if a != b:
+            counts[(a, b)] += 1
+    return counts
+
+
+def deck_slots(deck):
+    """Slot of every labware in <deck> (as in the profiles), with the names used by visits()"""
+    slots = {"magnet": deck["magnet"], "reagents": deck["reagents"], "waste": deck["waste"], "outplate": deck["outplate"],
+    "parking": deck["parking"], "trash": TRASH}
+    for n, slot in enumerate(deck["tipracks"]):
+        slots[("tips", n)] = slot
+    if deck["smallTipracks"]:
+        slots["smallTips"] = deck["smallTipracks"][0]
+    return slots
+
+
+def travel(counts, slots):
+    """mm the pipette travels between labware in <slots> with the <counts> of transitions()"""
+    total = 0
+    for (a, b), count in counts.items():
+        if slots.get(a) is not None and slots.get(b) is not None:
+            total += count*distance(slots[a], slots[b])
+    return total
+
+
+def place_tipracks(counts, slots, free, racks):
+    """
+    Puts the <racks> tipracks in the <free> slots, the busiest rack first in the slot where it makes the pipette travel less.
+    Returns the slots with the tipracks added.
+    """
+    slots = dict(slots)
+    traffic = collections.Counter()
+    for (a, b), count in counts.items():
+        traffic[a] += count
+        traffic[b] += count
+    free = list(free)
+    for n in sorted(range(racks), key=lambda n: -traffic[("tips", n)]):
+        rack = ("tips", n)
+        costs = []
+        for slot in free:
+            cost = 0
+            for (a, b), count in counts.items():
+                other = b if a == rack else a if b == rack else None
+                if other is not None and slots.get(other) is not None:
+                    cost += count*distance(slot, slots[other])
+            costs.append((cost, slot))
+        slot = min(costs)[1]
+        slots[rack] = slot
+        free.remove(slot)
+    return slots
+
+
+def optimize(settings):
+    """
+    Best layout for <settings>: returns (deck, mm travelled with it, mm travelled with the deck of <settings>).
+    The deck is like the "deck" of a profile, so it can be pasted in one.
+    """
+    steps = build_steps(settings)
+    commands, _ = plan(steps, settings)
+    counts = transitions(visits(steps, commands, settings))
+    deck = settings["deck"]
+    current = travel(counts, deck_slots(deck))
+    racks = len(deck["tipracks"])
+    roles = [role for role in ROLES if deck[role] is not None]
+    #The tipracks of the smallPipette stay where they are
+    fixed = deck_slots(deck)
+    small = {"smallTips": fixed["smallTips"]} if "smallTips" in fixed else {}
+    best = None
+    for magnet in MAGNET_SLOTS:
+        if magnet in deck["smallTipracks"]:
+            continue
+        others = [slot for slot in SLOTS if slot != magnet and slot not in deck["smallTipracks"]]
+        for placed in itertools.permutations(others, len(roles) - 1):
+            slots = dict(zip(roles, (magnet,) + placed))
+            free = [slot for slot in others if slot not in placed]
+            if len(free) < racks:
+                continue
+            slots["trash"] = TRASH
+            slots.update(small)
+            slots = place_tipracks(counts, slots, free, racks)
+            distanceTotal = travel(counts, slots)
+            if best is None or distanceTotal < best[0] - 1e-6:
+                best = (distanceTotal, slots)
+    distanceTotal, slots = best
+    layout = {role: slots.get(role) for role in ROLES}
+    layout["tipracks"] = [slots[("tips", n)] for n in range(racks)]
+    layout["smallTipracks"] = list(deck["smallTipracks"])
+    return layout, distanceTotal, current
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Finds the deck layout where the pipette travels less")
+    parser.add_argument("profile", help="run profile")
+    parser.add_argument("--set", action="append", metavar="SETTING=VALUE", help="change a setting, can be repeated")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+    settings = load_profile(args.profile, **parse_settings(args.set))
+    layout, best, current = optimize(settings)
+    saved = (current - best)/TIME_MODEL["speedXY"]
+    if args.json:
+        print(json.dumps({"current": settings["deck"], "recommended": layout, "currentTravel": round(current),
+        "recommendedTravel": round(best), "secondsSaved": round(saved)}, indent=2))
+        return 0
+    print("Current deck:     %s" % json.dumps(settings["deck"]))
+    print("Recommended deck: %s" % json.dumps(layout))
+    print("Travel between labware goes from %s m to %s m, around %s s less of moves" % (round(current/1000, 1), round(best/1000, 1), round(saved)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Liquid tracking. LiquidTracker keeps the volume of every well the extraction touches, updated on every aspirate and
+dispense, and turns it into the height of the liquid with the well geometry of the labware definition.
+Wells are taken as straight cylinders or boxes (the definitions don't describe the shape of the bottom), so the heights
+are a bit high for V and U bottoms; liquidMargin keeps the tip that far under the surface.
+"""
+import math
+
+from .labware import labware_definition
+
+
+def well_geometry(loadName):
+    """Shape, size and depth of the wells of <loadName> (its A1 well), from the labware definition"""
+    return labware_definition(loadName)["wells"]["A1"]
+
+
+def well_area(geometry):
+    """Horizontal section of a well (mm2)"""
+    if geometry["shape"] == "circular":
+        return math.pi*(geometry["diameter"]/2)**2
+    return geometry["xDimension"]*geometry["yDimension"]
+
+
+def liquid_height(geometry, volume):
+    """mm from the bottom of the well to the surface of <volume> ul (1 ul is 1 mm3). It can't be higher than the well"""
+    return min(max(volume, 0)/well_area(geometry), geometry["depth"])
+
+
+class LiquidTracker:
+    """
+    Volumes (ul) in the wells of the labware of a run profile. Wells are named by the labware of the profile and the well,
+    like ("deepPlate", "A1"). Reservoir wells are a single trough for the 8 channels, so they get 8 times what a plate well gets.
+    """
+
+    def __init__(self, labware):
+        self.labware = labware # {"deepPlate": loadName...} as in the profiles
+        self.volumes = {}
+        self.geometries = {}
+
+    def geometry(self, labware):
+        if labware not in self.geometries:
+            self.geometries[labware] = well_geometry(self.labware[labware])
+        return self.geometries[labware]
+
+    def volume(self, labware, well):
+        return self.volumes.get((labware, well), 0)
+
+    def add(self, labware, well, vol):
+        self.volumes[(labware, well)] = self.volume(labware, well) + vol
+
+    def remove(self, labware, well, vol):
+        self.volumes[(labware, well)] = max(self.volume(labware, well) - vol, 0)
+
+    def height(self, labware, well, change=0):
+        """Height of the liquid in <well>, after adding <change> ul (negative to take them)"""
+        return liquid_height(self.geometry(labware), self.volume(labware, well) + change)
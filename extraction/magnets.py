@@ -0,0 +1,73 @@
+"""
+Magnet heights. calibration/magnet_heights.json has the height that works for every deep well plate, by generation of
+the magnetic module (GEN1 modules count in half millimetres, GEN2 in millimetres, so they can't share heights):
+
+    {"GEN2": {"eppendorf_96_deepwell_2ml": {"height": 6.7, "captureMinutes": 4, "source": "..."}}}
+
+With "magnetHeight": null in a profile, the engine takes the height of its deepPlate from here, so changing the plate
+doesn't need a new height in every profile. "captureMinutes" (optional) is how long the beads take to go to the magnet at
+that height; incubations with the magnet are never shorter than that.
+"""
+import json
+import os
+
+from .labware import REPO_DIR
+
+REGISTRY = os.path.join(REPO_DIR, "calibration", "magnet_heights.json")
+
+
+def module_generation(magnetModule):
+    """"GEN1" or "GEN2" for a load_module() name of the magnetic module"""
+    if magnetModule.lower() in ("magneticmodulev2", "magnetic module gen2"):
+        return "GEN2"
+    if magnetModule.lower() in ("magneticmodulev1", "magnetic module", "magdeck"):
+        return "GEN1"
+    raise ValueError("%s is not a magnetic module" % magnetModule)
+
+
+def read_registry(path=REGISTRY):
+    """{generation: {loadName: entry}}, empty if there is no registry yet"""
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def magnet_entry(loadName, magnetModule, path=REGISTRY):
+    """Entry of the registry for <loadName> on <magnetModule>, or None"""
+    return read_registry(path).get(module_generation(magnetModule), {}).get(loadName)
+
+
+def magnet_height(settings, path=REGISTRY):
+    """
+    Height to engage the magnet for <settings>: magnetHeight, or if it is null, the one of the registry for the deepPlate.
+    Raises ValueError if the registry doesn't have it.
+    """
+    if settings["magnetHeight"] is not None:
+        return settings["magnetHeight"]
+    loadName = settings["labware"]["deepPlate"]
+    entry = magnet_entry(loadName, settings["magnetModule"], path)
+    if entry is None:
+        raise ValueError("There is no magnet height for %s on a %s module in %s. Calibrate it (see calibration.py) or set magnetHeight"
+        % (loadName, module_generation(settings["magnetModule"]), os.path.relpath(path, REPO_DIR)))
+    return entry["height"]
+
+
+def capture_minutes(settings, path=REGISTRY):
+    """Minutes the beads need at the registry height for the deepPlate. 0 if unknown or if magnetHeight is set by hand"""
+    if settings["magnetHeight"] is not None:
+        return 0
+    entry = magnet_entry(settings["labware"]["deepPlate"], settings["magnetModule"], path) or {}
+    return entry.get("captureMinutes", 0)
+
+
+def save_height(loadName, magnetModule, height, path=REGISTRY, **details):
+    """Writes <height> (and <details> like captureMinutes or source) for <loadName> on <magnetModule> in the registry"""
+    registry = read_registry(path)
+    entry = {"height": height}
+    entry.update(details)
+    registry.setdefault(module_generation(magnetModule), {})[loadName] = entry
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as handle:
+        json.dump(registry, handle, indent=4, sort_keys=True)
+        handle.write("\n")
@@ -0,0 +1,298 @@
+"""
+Run profiles. A profile is a small JSON (or YAML) file in profiles/ with only the settings that make a variant different.
+Everything else comes from DEFAULTS, which is the Viapath 16/07/20 protocol. A profile can also start from another
+profile with "extends", so the 200ul protocol is just the 140ul one with other volumes.
+"""
+import copy
+import json
+import os
+
+from .magnets import magnet_height
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "profiles")
+
+DEFAULTS = {
+    "description": "",
+    "extends": None,
+
+        #Deck
+            # 10    11      TRASH
+            # 7     8       9
+            # 4     5       6
+            # 1     2       3
+    "deck": {
+        "magnet": 6,
+        "reagents": 5,
+        "waste": 9,
+        "outplate": 1,
+        "parking": 3, # null if tips are never parked
+        "tipracks": [10, 8, 7, 4, 2], # Ordered in the way they are used, tips are taken from the last one
+        "smallTipracks": [], # Tipracks of the smallPipette
+    },
+    "labware": {
+        "deepPlate": "eppendorf_96_deepwell_2ml",
+        "reagents": "nest_12_reservoir_15ml",
+        "waste": "nest_12_reservoir_15ml",
+        "outplate": "eppendorf96_skirted_150ul",
+        "tips": "opentrons_96_filtertiprack_200ul",
+        "smallTips": "opentrons_96_filtertiprack_20ul",
+    },
+    "magnetModule": "magneticModuleV2",
+    "magnetHeight": None, # mm, null to take the height of the deepPlate from calibration/magnet_heights.json (see magnets.py)
+    "pipette": "p300_multi_gen2",
+    "mount": "left",
+    "smallPipette": None, # Second pipette for small volumes, e.g. "p20_multi_gen2". Removals and elutions of up to smallVolume ul use it
+    "smallMount": "right",
+    "smallVolume": 20, # Max volume of the smallPipette
+
+        #RUN SETTINGS
+    "runColumns": 3, # Range 1 to len(columnID), 12 for a full plate. Samples should be a multiple of 8, or you will waste reagents.
+    "mixRepeats": 15, # Used everytime there is mixing, except when mixing beads.
+    "mixDownRepeats": 0, # Aspirate and dispense at the bottom this many times before the mixRepeats.
+    "beadsMixRepeats": 10, # Used when mixing beads in reservoir.
+    "beadsMixIndexes": [0, 2, 5], # Beads are mixed in the reservoir before pipetting column 1, 3 and 6.
+    "waterMixRepeats": 20, # Used when mixing elute.
+
+        #Mixing settings
+    "washMixing": 100, # volume (ul)
+    "waterMixing": 25, # volume (ul)
+    "mixingOffset": 1, # Positive values mean to the right. Relative to center (mm)
+    "mixYOffset": 0, # Alternates between +/- this value (mm) while mixing, to move the liquid around the well
+    "bottomHeight": 0.5, # Distance relative to real labware's bottom. Used when removing supernatant and moving elution.
+    "bottomMixHeight": 0.8, # Distance relative to real labware's bottom. Used when mixing
+    "SamplePlusProteinaseHeight": 3, # For a volume of 260..
+    "SamplePlusProteinasePlusBeadsHeight": 5.75, # For a volume of 465...
+    "generalHeight": 4, # Used always except when mixing beads in reservoir - Units relative to well bottom (mm). For a vol of 280...
+    "beadsHeight": 10, # Used when mixing beads in reservoir - Units relative to well bottom (mm).
+    "liquidTracking": False, # Follow the liquid in every well (see liquid.py) instead of using the heights above, which are then ignored
+    "liquidMargin": 1, # With liquidTracking, mm under the surface where the tip mixes and ends the aspirations
+    "deadHeight": 0.5, # mm of liquid left at the bottom of reservoir wells, added to the volumes of the fill sheet (see reagents.py)
+
+        #Incubation times - Minutes
+    "incubationProteinase": 10,
+    "incubationBeadsNoMagnet": 5, # After adding the beads, we incubate them for 5 min without magnet.
+    "incubationBeadsMagnet": 10,
+    "incubationWash": 6,
+    "incubationDry": 10, # After removing final wash, the beads are left to dry for a while.
+    "incubationWater": 5, # After mixing. No magnet.
+    "incubationWaterMagnet": 2, # After incubationWater.
+
+        #Transference volumes - ul
+    "originalVol": 140, # This is not used for transfers, it is here mostly to make volumes clearer to understand
+    "proteinaseVol": 112,
+    "beadsVol": 143.5,
+    "washVol": 280, # Used for WBE and Ethanol1 and Ethanol2
+    "dilutionVol": 50,
+    "extraSupernatant": 0, # Removed on top of originalVol + proteinaseVol + beadsVol
+
+        #Reagent position in reservoir - Positions go from A1 to A12 (Left to right)
+        #A list of wells splits the columns between them, in order. A 15ml well is not enough for 96 samples of 280ul
+    "reagentWells": {
+        "proteinase": "A1",
+        "beads": "A2",
+        "WBE": "A3",
+        "ethanol1": "A4",
+        "ethanol2": "A5",
+        "water": "A12",
+    },
+
+        #Column accesion list - runColumns takes the first ones
+    "columnID": ["A1", "A2", "A3", "A7", "A9", "A11"],
+    "pelletLeftColumns": ["A2"], # In these columns the pellet is on the left, so we aspirate slightly to the right
+
+        #Pipette settings
+    "tipVolume": 180, # max volume to be transported in a single trip. These tips are 200ul, but if we use the entire volumen, it might touch the filter
+    "topOffset": -5, # I use this to make sure the tip stays inside the well, to avoid it spilling out while dispensing
+    "flowRates": {"aspirate": 50, "dispense": 150, "blowOut": 200}, # Reduced compared to default values to avoid air or foam
+    "mixFlowRates": {"aspirate": 1000, "dispense": 1000},
+    "removalFlowRate": 20, # Used when removing supernatant and elute, so we don't bother the pellet
+    "disposalVolume": 10, # Extra volume aspirated when distributing, blown out back in the reservoir
+    "motion": { # How the gantry moves, see Extraction.set_speeds, meneillo and hop. All off by default, so the robot moves as always
+        "speed": None, # mm/s of moves between labware, null for the robot default (400 mm/s, also its safe maximum)
+        "directWiggles": False, # Meneillo goes straight from side to side inside the well, never over it
+        "hopHeight": None, # mm over the plate the tip goes from column to column when distributing, instead of the usual arc (5 mm). null for the arc
+    },
+
+        #Behaviour
+    "scheduler": "pipelined", # "pipelined" counts incubations per column (see scheduler.py), "linear" is the old order
+    "moveTime": 1.5, # Seconds the planner assumes for every gantry move. On the optimistic side on purpose
+    "parkTips": True, # Tips used to add a reagent wait in the parking rack for the removal of that same reagent
+    "keepTips": "auto", # Reuse parked tips for the dry removal and the elution too. true, false or "auto" (only if the tipracks are not enough)
+    "tipRefills": False, # Pause to replace empty tipracks if the run needs more tips than loaded. If false, those runs don't start
+    "plates": 1, # Plates run one after the other. Between them the robot pauses to swap the deep well and output plates, see scheduler.queue_plates
+    "swapMinutes": 5, # Minutes the planner assumes for every plate swap
+    "wasteCapacity": None, # ul that fit in a waste well, null to take it from the labware. Full wells are changed for the emptiest one
+    "wasteByColumn": True, # Every column dumps in its own waste well instead of one well per step
+    "meneillo": True, # Shake the tip over the waste after each removal trip. "touch_tip" or "blow_out" do a single touch tip or blow out instead, faster
+    "meneilloReps": 10,
+    "meneilloDistance": 0.25,
+    "dripDelay": 0, # Seconds waiting over the waste after each removal trip
+    "dispenseAfterLast": False, # Expel 20ul over the waste after the last removal trip too, not only between trips (the clean_tips of newmix)
+    "mixDelay": 0, # Seconds waiting after adding a reagent, before mixing
+    "splitDry": True, # Half way through drying, remove 20ul of ethanol that went down with new tips
+    "returnTips": False, # return_tip() instead of drop_tip(), for test runs
+    "delayFactor": 1, # Incubations and delays (dripDelay, mixDelay...) last their time * delayFactor, for test runs
+    "dryRun": False, # Water test: tips are returned, there are no magnet incubations and delays last dryRunFactor of their time. See profile.dry_run
+    "dryRunFactor": 0.0166667, # With dryRun, a minute lasts a second
+    "dryRunMeneillo": True, # With dryRun, false skips the meneillo too
+    "clockInterval": 60, # Seconds between the messages that say how long an incubation has left
+    "checkpointFile": None, # Write a checkpoint here after every column (e.g. /data/user_storage/checkpoint.json in the robot), see checkpoint.py
+    "traceFile": None, # Write a Chrome trace of the run here (e.g. /data/user_storage/trace.json in the robot), see trace.py
+    "skipSteps": [], # Names of the steps (see scheduler.build_steps) that are not run
+    "distribute": [], # Add steps done with one tip for all columns, dispensing from the top. Columns are then mixed with their own tip
+    "stepOverrides": {}, # {"step name": {"setting": value}} to change single steps
+}
+
+
+class ColumnsError(ValueError):
+    """runColumns is not possible with the columnID of a profile"""
+
+
+def _merge(base, changes):
+    """
+    Returns a copy of <base> updated with <changes>. Nested dictionaries are updated instead of replaced, so a profile
+    can change one slot of the deck without repeating the others.
+    """
+    merged = copy.deepcopy(base)
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = _merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def profile_path(name):
+    """
+    Finds the file of the profile <name>. It can be a path or the name of a file in profiles/ with or without extension.
+    """
+    if os.path.isfile(name):
+        return name
+    for extension in ("", ".json", ".yaml", ".yml"):
+        path = os.path.join(PROFILE_DIR, name + extension)
+        if os.path.isfile(path):
+            return path
+    raise ValueError("There is no profile called %s in %s" % (name, PROFILE_DIR))
+
+
+def read_profile(path):
+    """
+    Reads a profile file without merging it with anything.
+    """
+    with open(path) as handle:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("PyYAML is needed to read %s, or use a JSON profile instead" % path)
+            return yaml.safe_load(handle) or {}
+        return json.load(handle)
+
+
+def _load_profile(profile, overrides):
+    if isinstance(profile, dict):
+        changes = profile
+    else:
+        changes = read_profile(profile_path(profile))
+    if changes.get("extends"):
+        base = _load_profile(changes["extends"], {})
+    else:
+        base = DEFAULTS
+    settings = _merge(base, changes)
+    settings["extends"] = changes.get("extends")
+    return _merge(settings, overrides)
+
+
+def load_profile(profile="viapath-16-07-20", **overrides):
+    """
+    Returns the complete settings of <profile> (a name, a path or a dictionary) with <overrides> on top.
+    Raises ValueError if any setting is not one of DEFAULTS, so typos don't go unnoticed.
+    """
+    settings = _load_profile(profile, overrides)
+    check_profile(settings)
+    return dry_run(settings)
+
+
+def dry_run(settings):
+    """
+    With dryRun (or the EXTRACTION_DRY_RUN environment variable), a copy of <settings> changed for a water test of the
+    run: tips go back to their rack, delays last dryRunFactor of their time (it is the delayFactor) and, without
+    dryRunMeneillo, there is no meneillo. Magnet incubations are skipped by scheduler.build_steps().
+    Settings that went through it already stay the same.
+    """
+    settings = dict(settings)
+    if os.environ.get("EXTRACTION_DRY_RUN", "").lower() not in ("", "0", "false", "no"):
+        settings["dryRun"] = True
+    if not settings["dryRun"]:
+        return settings
+    settings["returnTips"] = True
+    settings["delayFactor"] = settings["dryRunFactor"]
+    if not settings["dryRunMeneillo"]:
+        settings["meneillo"] = False
+    return settings
+
+
+def check_profile(settings):
+    """
+    Raises ValueError if <settings> can't be run.
+    """
+    unknown = [key for key in settings if key not in DEFAULTS]
+    unknown += ["deck." + key for key in settings["deck"] if key not in DEFAULTS["deck"]]
+    unknown += ["labware." + key for key in settings["labware"] if key not in DEFAULTS["labware"]]
+    unknown += ["motion." + key for key in settings["motion"] if key not in DEFAULTS["motion"]]
+    if unknown:
+        raise ValueError("Unknown settings: %s" % ", ".join(sorted(unknown)))
+    if not 1 <= settings["runColumns"] <= len(settings["columnID"]):
+        raise ColumnsError("runColumns must be between 1 and %s" % len(settings["columnID"]))
+    if settings["scheduler"] not in ("pipelined", "linear"):
+        raise ValueError("scheduler must be 'pipelined' or 'linear', not %r" % settings["scheduler"])
+    if settings["parkTips"] and settings["deck"]["parking"] is None:
+        raise ValueError("parkTips needs a parking rack in the deck")
+    if settings["motion"]["speed"] is not None and not settings["motion"]["speed"] > 0:
+        raise ValueError("motion.speed must be more than 0 mm/s, not %r" % settings["motion"]["speed"])
+    if not 0 <= settings["disposalVolume"] < settings["tipVolume"]:
+        raise ValueError("disposalVolume must be at least 0 and less than tipVolume (%s ul), not %r" % (settings["tipVolume"], settings["disposalVolume"]))
+    if settings["meneillo"] not in (True, False, "touch_tip", "blow_out"):
+        raise ValueError("meneillo must be true, false, 'touch_tip' or 'blow_out', not %r" % settings["meneillo"])
+    if settings["keepTips"] not in (True, False, "auto"):
+        raise ValueError("keepTips must be true, false or 'auto', not %r" % settings["keepTips"])
+    if not isinstance(settings["plates"], int) or settings["plates"] < 1:
+        raise ValueError("plates must be a whole number of at least 1, not %r" % settings["plates"])
+    if settings["keepTips"] == True and settings["deck"]["parking"] is None:
+        raise ValueError("keepTips needs a parking rack in the deck")
+    magnet_height(settings)
+    if settings["smallPipette"] is not None:
+        if not settings["deck"]["smallTipracks"]:
+            raise ValueError("smallPipette needs at least one slot in deck.smallTipracks")
+        if settings["smallMount"] == settings["mount"]:
+            raise ValueError("smallPipette and pipette can't be both on the %s mount" % settings["mount"])
+
+
+def column_ids(settings):
+    """Columns used in the run"""
+    return settings["columnID"][:settings["runColumns"]]
+
+
+def reagent_wells(settings, name):
+    """Wells of the reagent <name>, always as a list"""
+    wells = settings["reagentWells"][name]
+    if isinstance(wells, str):
+        return [wells]
+    return list(wells)
+
+
+def reagent_well(settings, name, ID):
+    """
+    Well of the reagent <name> used for the column <ID>. With several wells, the columns of the run are split between them
+    in order, so with 12 columns and 2 wells, the first 6 columns use the first well.
+    """
+    wells = reagent_wells(settings, name)
+    columns = column_ids(settings)
+    return wells[columns.index(ID)*len(wells) // len(columns)]
+
+
+def beads_mixing(settings):
+    """Volume used when mixing beads (ul)"""
+    if settings["runColumns"] == 1:
+        return 140
+    return settings["tipVolume"]
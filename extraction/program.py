@@ -0,0 +1,539 @@
+"""
+Compiled runs. compile_program() plans a run profile (see scheduler.py) and runs the plan once on the fake robot (see
+fake.py), keeping what the robot is asked to do as a program: the labware, modules and pipettes to load, and a flat list
+of operations (aspirate, dispense, move_to, pick_up_tip, engage, delay...) with their volumes, flow rates and locations
+already worked out. Waits are not kept as delays: they stay as "wait" operations for the incubations of the columns
+they name, with the "incubate" operations that start them, so the run waits what is left of them (see timer.py) and a
+slow robot doesn't get longer incubations. A program is plain JSON, so it can be checked, estimated and compared in
+milliseconds, and run_program() does it with nothing but pipette, module and protocol calls:
+
+    python -m extraction.program compile viapath-16-07-20 --set runColumns=6 -o viapath.json
+    python -m extraction.program check viapath.json
+    python -m extraction.program estimate viapath.json
+    python -m extraction.program diff viapath.json other.json
+
+A protocol script that runs a program only needs run_program(protocol, load_program(path)). Programs don't write
+checkpoints, a run that stops has to be resumed with the engine (see checkpoint.py).
+"""
+import argparse
+import difflib
+import json
+import sys
+
+try:
+    from opentrons import types
+except ImportError: # Only the fake robot here, see fake.py
+    from . import fake as types
+
+from .estimate import format_table, minutes, parse_settings, summarize
+from .fake import ProtocolContext
+from .golden import ESTIMATED, CallRecorder
+from .liquid import well_area, well_geometry
+from .profile import check_profile, column_ids, load_profile
+from .reagents import reagent_usage
+from .scheduler import build_steps, command_tips, needs_mixing, plan, small_tips_needed, tip_capacity
+from .timer import IncubationTimer, count_down
+from .trace import CONTAINERS, MODULE_CALLS, PIPETTE_CALLS, PROTOCOL_CALLS
+
+#Operations of the incubation timer: waits until the deadline of some columns, incubations that start and the planned
+#seconds of what was done, for the simulated clock
+TIMER_CALLS = ("wait", "incubate", "advance")
+
+CALLS = {"pipette": PIPETTE_CALLS, "protocol": PROTOCOL_CALLS, "module": MODULE_CALLS, "timer": TIMER_CALLS}
+
+#Operations that need a tip on the pipette
+WITH_TIP = ("aspirate", "dispense", "blow_out", "touch_tip", "mix", "transfer", "air_gap", "drop_tip", "return_tip")
+
+#Fields every type of command of the plan has (see scheduler.plan). Others, like "plate", "refill" or "lead", are optional
+COMMANDS = {
+    "wait": ("seconds", "reason", "pause"),
+    "magnet": ("step", "engage"),
+    "premix": ("step", "ID", "seconds"),
+    "distribute": ("step", "IDs", "seconds"),
+    "column": ("step", "ID", "tipOn", "mixOnly", "seconds"),
+    "refill": (),
+    "swap": ("plate",),
+}
+
+#Channels of the pipette that takes the reagents, as in reagents.py
+CHANNELS = 8
+
+
+class Compiler(CallRecorder):
+    """
+    CallRecorder that also writes down what gets loaded, the flow rates and speed of the pipette at every call, and the
+    operations of the incubation timer (see timer_op), so the run can be done again in another ProtocolContext.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.loads = []
+
+    def wrap(self, protocol):
+        loadLabware = protocol.load_labware
+        loadModule = protocol.load_module
+        loadInstrument = protocol.load_instrument
+
+        def load_labware(name, location, label=None, *args, **kwargs):
+            self.loads.append({"load": "labware", "name": name, "slot": str(location), "label": label})
+            return loadLabware(name, location, label, *args, **kwargs)
+
+        def load_module(name, location, *args, **kwargs):
+            module = loadModule(name, location, *args, **kwargs)
+            self.loads.append({"load": "module", "name": name, "slot": str(location)})
+            moduleLabware = module.load_labware
+
+            def load_module_labware(name, label=None, *args, **kwargs):
+                self.loads.append({"load": "labware", "name": name, "slot": str(location), "label": label, "module": str(location)})
+                return moduleLabware(name, label, *args, **kwargs)
+
+            module.load_labware = load_module_labware
+            return module
+
+        def load_instrument(name, mount, *args, **kwargs):
+            instrument = loadInstrument(name, mount, *args, **kwargs)
+            self.loads.append({"load": "instrument", "name": name, "mount": mount, "maxVolume": getattr(instrument, "max_volume", None)})
+            return instrument
+
+        protocol.load_labware = load_labware
+        protocol.load_module = load_module
+        protocol.load_instrument = load_instrument
+        return super().wrap(protocol)
+
+    def describe(self, target, name, kind, arguments):
+        command = super().describe(target, name, kind, arguments)
+        flowRates = getattr(target, "flow_rate", None)
+        if kind == "pipette" and flowRates is not None:
+            command["flowRates"] = dict((key, getattr(flowRates, key, None)) for key in ("aspirate", "dispense", "blow_out"))
+            command["defaultSpeed"] = getattr(target, "default_speed", None)
+        return command
+
+    def timer_op(self, name, **args):
+        """Writes down the operation <name> of the incubation timer, with <args>"""
+        self.commands.append({"name": name, "kind": "timer", "target": None, "section": self.sections[-1] if self.sections else "protocol",
+        "helpers": list(self.helpers), "depth": self.depth, "children": 0, "args": args})
+
+
+def operations(commands):
+    """
+    The operations of the recorded <commands>: calls made by the protocol, without the ones they made inside. Transfers
+    and mixes are replaced by the calls they made, if they were recorded.
+    """
+    ops = []
+    skip = 0
+    for position, command in enumerate(commands):
+        if position < skip:
+            continue
+        if command["name"] in CONTAINERS and command.get("children"):
+            continue
+        op = {"op": command["name"], "kind": command["kind"], "target": command["target"], "section": command["section"],
+        "args": command["args"]}
+        for key in ("flowRates", "defaultSpeed"):
+            if command.get(key) is not None:
+                op[key] = command[key]
+        op["estimate"] = dict((key, command[key]) for key in ESTIMATED if command.get(key) is not None)
+        ops.append(op)
+        skip = position + 1 + command.get("children", 0)
+    return ops
+
+
+def compile_program(profile="viapath-16-07-20", **settings):
+    """
+    Program of <profile> (a name in profiles/, a path or a dictionary) with <settings> on top: {"profile", "settings",
+    "steps", "plan", "duration", "reservoir", "loads", "ops"}. "plan" has the commands of scheduler.plan() the operations
+    come from, and "reservoir" the "dead" volume and the "capacity" (ul) of a well of the reagents reservoir, from its
+    labware definition, so the plan can be checked without the labware.
+    """
+    from .engine import Extraction
+    settings = load_profile(profile, **settings)
+    steps = build_steps(settings)
+    commands, duration = plan(steps, settings)
+    compiler = Compiler()
+    with compiler:
+        protocol = compiler.wrap(ProtocolContext())
+        #Checkpoints and traces are of the runs of the program, not of this one
+        extraction = Extraction(protocol, dict(settings, checkpointFile=None, traceFile=None))
+        timer = extraction.timer
+        start, advance = timer.start, timer.advance
+
+        def started(IDs, seconds):
+            compiler.timer_op("incubate", IDs=list(IDs), seconds=seconds)
+            start(IDs, seconds)
+
+        def advanced(seconds):
+            compiler.timer_op("advance", seconds=seconds)
+            advance(seconds)
+
+        timer.start, timer.advance = started, advanced
+        extraction.wait = lambda seconds, reason, stop=False, IDs=None, lead=0: compiler.timer_op("wait", seconds=seconds,
+        reason=reason, pause=stop, IDs=IDs, lead=lead)
+        extraction.run(steps, commands, duration)
+    if compiler.trash is not None:
+        for command in compiler.commands:
+            if command["name"] == "drop_tip" and command.get("location") is None:
+                command["location"] = compiler.trash
+    geometry = well_geometry(settings["labware"]["reagents"])
+    return {"profile": profile if isinstance(profile, str) else None, "settings": settings, "steps": steps, "plan": commands,
+    "duration": round(duration, 1), "reservoir": {"dead": round(well_area(geometry)*settings["deadHeight"], 1),
+    "capacity": geometry.get("totalLiquidVolume")}, "loads": compiler.loads, "ops": operations(compiler.commands)}
+
+
+def save_program(program, path):
+    with open(path, "w") as handle:
+        json.dump(program, handle)
+
+
+def load_program(path):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def plan_problems(program):
+    """
+    Problems of the plan of <program>: settings that check_profile() doesn't take, commands the engine doesn't have or
+    that miss fields, steps and columns that are not in the run, columns that do their steps out of order, skip one or go
+    to the magnet before they are done, tipracks that run out and reservoir wells that overflow.
+    """
+    settings = program["settings"]
+    steps = program["steps"]
+    try:
+        check_profile(settings)
+    except ValueError as error:
+        return [str(error)]
+    problems = []
+    columnID = column_ids(settings)
+    columnSteps = [index for index, step in enumerate(steps) if step["action"] != "magnet"]
+    done = {} # {(plate, ID): column steps done}
+    distributed = set() # (plate, ID, step) added by a distribution, still to be mixed
+    capacity = tip_capacity(settings)
+    tips = 0
+    for position, command in enumerate(program["plan"]):
+        kind = command.get("type")
+        where = "Command %s (%s)" % (position, kind)
+        if kind not in COMMANDS:
+            problems.append("%s: the engine has no such command" % where)
+            continue
+        missing = [field for field in COMMANDS[kind] if field not in command]
+        if missing:
+            problems.append("%s: it has no %s" % (where, ", ".join(missing)))
+            continue
+        if "step" in command:
+            if not 0 <= command["step"] < len(steps):
+                problems.append("%s: there is no step %s" % (where, command["step"]))
+                continue
+            step = steps[command["step"]]
+            where = "Command %s (%s of %s)" % (position, kind, step["name"])
+            if (kind == "magnet") != (step["action"] == "magnet"):
+                problems.append("%s: %s is a %s step" % (where, step["name"], step["action"]))
+                continue
+        IDs = command.get("IDs", [command["ID"]] if "ID" in command else [])
+        unknown = [ID for ID in IDs if ID not in columnID]
+        if unknown:
+            problems.append("%s: column %s is not in the run" % (where, ", ".join(unknown)))
+            continue
+        plate = command.get("plate", 1)
+        if kind in ("premix", "distribute", "column"):
+            for ID in IDs:
+                count = done.get((plate, ID), 0)
+                if count == len(columnSteps) or columnSteps[count] != command["step"]:
+                    expected = steps[columnSteps[count]]["name"] if count < len(columnSteps) else "nothing"
+                    problems.append("%s: column %s of plate %s does %s now" % (where, ID, plate, expected))
+                elif kind == "distribute" and needs_mixing(step):
+                    distributed.add((plate, ID, command["step"]))
+                elif kind == "distribute" or (kind == "column" and not command["mixOnly"]):
+                    done[(plate, ID)] = count + 1
+                elif kind == "column":
+                    if (plate, ID, command["step"]) not in distributed:
+                        problems.append("%s: column %s of plate %s is mixed before %s is added" % (where, ID, plate, step["reagentName"]))
+                    done[(plate, ID)] = count + 1
+        elif kind == "magnet":
+            late = [ID for ID in columnID if any(index < command["step"] for index in columnSteps[done.get((plate, ID), 0):])]
+            if late:
+                problems.append("%s: columns %s of plate %s are not done with the steps before it" % (where, ", ".join(late), plate))
+        if kind == "refill" or command.get("refill"):
+            tips %= 12 # Only the rack that was in use is not full
+        tips += command_tips(command, steps, settings) if "step" in command else 0
+        if tips > capacity:
+            problems.append("%s: the tipracks are empty, there is no refill before it" % where)
+            tips = 0
+    plates = max([command.get("plate", 1) for command in program["plan"]] + [1])
+    for plate in range(1, plates + 1):
+        for ID in columnID:
+            count = done.get((plate, ID), 0)
+            if count < len(columnSteps):
+                problems.append("Column %s of plate %s never does %s" % (ID, plate, steps[columnSteps[count]]["name"]))
+    smallTips = 12*len(settings["deck"]["smallTipracks"])
+    if small_tips_needed(steps, settings) > smallTips:
+        problems.append("The smallPipette needs %s tips, there are %s" % (small_tips_needed(steps, settings), smallTips))
+    reservoir = program["reservoir"]
+    for well, (reagent, used) in sorted(reagent_usage(steps, program["plan"], settings, CHANNELS).items(), key=lambda item: int(item[0][1:])):
+        fill = used + reservoir["dead"]
+        if reservoir["capacity"] and fill > reservoir["capacity"]:
+            problems.append("Reservoir well %s needs %s ml of %s, it holds %s ml" % (well, round(fill/1000, 2), reagent,
+            round(reservoir["capacity"]/1000, 2)))
+    return problems
+
+
+def call_problems(program):
+    """
+    Problems of the operations of <program>: calls the robot doesn't have, pipettes, modules or labware that are not
+    loaded, waits for columns that are not in the run, tips picked up twice or used without picking them up, and
+    aspirates that don't fit in the pipette.
+    """
+    problems = []
+    slots = set(["12"])
+    pipettes = {}
+    modules = set()
+    for load in program["loads"]:
+        if load["load"] == "instrument":
+            if load["mount"] in pipettes:
+                problems.append("Two pipettes on the %s mount" % load["mount"])
+            pipettes[load["mount"]] = {"maxVolume": load.get("maxVolume"), "tip": False, "volume": 0}
+        elif load["load"] == "module":
+            modules.add(load["slot"])
+        else:
+            if load["slot"] in slots:
+                problems.append("Two labware in slot %s" % load["slot"])
+            if load.get("module") is None and load["slot"] in modules:
+                problems.append("Slot %s has a module, labware goes on it" % load["slot"])
+            slots.add(load["slot"])
+
+    def places(value):
+        if isinstance(value, list):
+            return [place for item in value for place in places(item)]
+        if isinstance(value, dict) and "slot" in value:
+            return [value]
+        return []
+
+    columnID = column_ids(program["settings"])
+    for position, op in enumerate(program["ops"]):
+        where = "Operation %s (%s, %s)" % (position, op["op"], op["section"])
+        if op["op"] not in CALLS.get(op["kind"], ()):
+            problems.append("%s: the robot has no %s" % (where, op["op"]))
+            continue
+        for place in places(list(op["args"].values())):
+            if place["slot"] not in slots:
+                problems.append("%s: there is no labware in slot %s" % (where, place["slot"]))
+        if op["kind"] == "timer":
+            unknown = [ID for ID in op["args"].get("IDs") or [] if ID not in columnID]
+            if unknown:
+                problems.append("%s: column %s is not in the run" % (where, ", ".join(unknown)))
+            continue
+        if op["kind"] == "module" and op["target"] not in modules:
+            problems.append("%s: there is no module in slot %s" % (where, op["target"]))
+        if op["kind"] != "pipette":
+            continue
+        pipette = pipettes.get(op["target"])
+        if pipette is None:
+            problems.append("%s: there is no pipette on the %s mount" % (where, op["target"]))
+            continue
+        if op["op"] == "pick_up_tip":
+            if pipette["tip"]:
+                problems.append("%s: the pipette has a tip already" % where)
+            pipette["tip"] = True
+            pipette["volume"] = 0
+        elif op["op"] in WITH_TIP and not pipette["tip"]:
+            problems.append("%s: the pipette has no tip" % where)
+        if op["op"] in ("drop_tip", "return_tip"):
+            pipette["tip"] = False
+        elif op["op"] == "aspirate":
+            volume = op["args"].get("volume")
+            if volume is None:
+                volume = (pipette["maxVolume"] or 0) - pipette["volume"]
+            pipette["volume"] += volume
+            if pipette["maxVolume"] and pipette["volume"] > pipette["maxVolume"] + 0.01:
+                problems.append("%s: %s ul don't fit in the pipette" % (where, round(pipette["volume"], 2)))
+        elif op["op"] == "dispense":
+            volume = op["args"].get("volume")
+            #Dispensing more than there is only empties the tip, the protocols use it to get rid of drops
+            pipette["volume"] = 0 if volume is None else max(pipette["volume"] - volume, 0)
+        elif op["op"] == "blow_out":
+            pipette["volume"] = 0
+    return problems
+
+
+def check_program(program):
+    """Raises ValueError with every problem of the plan and of the operations of <program> (see plan_problems, call_problems)"""
+    problems = plan_problems(program) + call_problems(program)
+    if problems:
+        raise ValueError("\n".join(problems))
+
+
+def resolve(value, deck):
+    """An argument of a program back as labware, wells and locations of the <deck> ({slot: labware}) of a run"""
+    if isinstance(value, list):
+        return [resolve(item, deck) for item in value]
+    if not isinstance(value, dict):
+        return value
+    place = None
+    if "slot" in value:
+        place = deck[value["slot"]]
+        if "well" in value:
+            place = place[value["well"]]
+    if "point" in value:
+        return types.Location(types.Point(*value["point"]), place)
+    return place
+
+
+def wait(protocol, timer, settings, seconds, reason, pause=False, IDs=None, lead=0):
+    """A "wait" operation: as Extraction.wait(), until the incubation of <IDs> is over or for <seconds>"""
+    factor = settings["delayFactor"]
+    if IDs:
+        deadline = timer.deadline(IDs, lead*factor)
+    else:
+        deadline = timer.now() + seconds*factor
+    count_down(protocol, timer, deadline, reason, settings["clockInterval"], factor, pause)
+
+
+def run_program(protocol, program):
+    """
+    Loads the labware, modules and pipettes of <program> in <protocol> and does its operations, one after the other,
+    with the flow rates and speed each one had. Waits go by the incubation timer of this run.
+    Raises ValueError before anything is done if check_program() finds problems.
+    """
+    check_program(program)
+    deck = {}
+    pipettes = {}
+    modules = {}
+    for load in program["loads"]:
+        if load["load"] == "instrument":
+            pipettes[load["mount"]] = protocol.load_instrument(load["name"], load["mount"])
+        elif load["load"] == "module":
+            modules[load["slot"]] = protocol.load_module(load["name"], int(load["slot"]))
+        elif load.get("module") is not None:
+            deck[load["slot"]] = modules[load["module"]].load_labware(load["name"], label=load["label"])
+        else:
+            deck[load["slot"]] = protocol.load_labware(load["name"], int(load["slot"]), label=load["label"])
+    if getattr(protocol, "fixed_trash", None) is not None:
+        deck.setdefault("12", protocol.fixed_trash)
+    timer = IncubationTimer(protocol.is_simulating())
+    for op in program["ops"]:
+        args = dict((key, resolve(value, deck)) for key, value in op["args"].items())
+        if op["kind"] == "timer":
+            if op["op"] == "wait":
+                wait(protocol, timer, program["settings"], **args)
+            elif op["op"] == "incubate":
+                timer.start(**args)
+            else:
+                timer.advance(**args)
+            continue
+        if op["kind"] == "pipette":
+            target = pipettes[op["target"]]
+            for key, rate in op.get("flowRates", {}).items():
+                if rate is not None:
+                    setattr(target.flow_rate, key, rate)
+            if op.get("defaultSpeed") is not None:
+                target.default_speed = op["defaultSpeed"]
+        elif op["kind"] == "module":
+            target = modules[op["target"]]
+        else:
+            target = protocol
+        getattr(target, op["op"])(**args)
+
+
+def program_commands(program):
+    """
+    The operations of <program> as the commands of a recording, so estimate.py can time them. Waits count as delays of
+    their planned seconds
+    """
+    commands = []
+    factor = program["settings"]["delayFactor"]
+    for op in program["ops"]:
+        if op["op"] == "wait":
+            op = dict(op, op="delay", kind="protocol", estimate={"seconds": op["args"]["seconds"]*factor})
+        elif op["kind"] == "timer":
+            continue
+        command = {"name": op["op"], "kind": op["kind"], "section": op["section"], "helpers": [], "depth": 0,
+        "instrument": op["target"], "children": 0}
+        for key, value in op["estimate"].items():
+            command[key] = tuple(value) if isinstance(value, list) else value
+        commands.append(command)
+    return commands
+
+
+def estimate_program(program):
+    """How long <program> takes, as estimate.summarize() says"""
+    report = summarize(program_commands(program))
+    report["target"] = program["profile"] or "program"
+    return report
+
+
+def signature(op):
+    return json.dumps([op["op"], op["target"], op["args"]], sort_keys=True)
+
+
+def diff_programs(a, b):
+    """[(tag, first, last, otherFirst, otherLast)] for the operations that change from <a> to <b>, as in difflib"""
+    matcher = difflib.SequenceMatcher(None, [signature(op) for op in a["ops"]], [signature(op) for op in b["ops"]], autojunk=False)
+    return [opcode for opcode in matcher.get_opcodes() if opcode[0] != "equal"]
+
+
+def diff_settings(a, b):
+    """[(name, value in <a>, value in <b>)] of the settings that are not the same"""
+    names = sorted(set(a["settings"]) | set(b["settings"]))
+    return [(name, a["settings"].get(name), b["settings"].get(name)) for name in names if a["settings"].get(name) != b["settings"].get(name)]
+
+
+def format_op(op):
+    """One line for <op>"""
+    args = ", ".join("%s=%s" % (key, json.dumps(value)) for key, value in op["args"].items() if value is not None)
+    return "%-10s %s %s(%s)" % (op["target"] or "", op["section"], op["op"], args)
+
+
+def format_diff(a, b, changes, limit=20):
+    """The settings that change, the first <limit> <changes> of diff_programs(a, b) and how the estimated time changes"""
+    lines = ["%s: %s -> %s" % (name, json.dumps(before), json.dumps(after)) for name, before, after in diff_settings(a, b)]
+    lines.append("%s operations changed in %s places" % (sum(max(i2 - i1, j2 - j1) for _, i1, i2, j1, j2 in changes), len(changes)))
+    for tag, i1, i2, j1, j2 in changes[:limit]:
+        lines.append("@@ %s %s-%s / %s-%s" % (tag, i1, i2, j1, j2))
+        lines += ["- " + format_op(op) for op in a["ops"][i1:i2][:5]]
+        lines += ["+ " + format_op(op) for op in b["ops"][j1:j2][:5]]
+    before = estimate_program(a)["total"]
+    after = estimate_program(b)["total"]
+    lines.append("Estimated %s -> %s (%+d s)" % (minutes(before), minutes(after), round(after - before)))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compiles run profiles to programs, and checks, estimates and compares them")
+    commands = parser.add_subparsers(dest="command")
+    compiler = commands.add_parser("compile", help="plan a profile, run it on the fake robot and write its program")
+    compiler.add_argument("profile", help="profile name or path")
+    compiler.add_argument("--set", action="append", metavar="SETTING=VALUE", help="change a setting, can be repeated")
+    compiler.add_argument("-o", "--output", required=True, help="program file to write")
+    check = commands.add_parser("check", help="look for problems in a program")
+    check.add_argument("program")
+    estimate = commands.add_parser("estimate", help="how long a program takes")
+    estimate.add_argument("program")
+    diff = commands.add_parser("diff", help="settings and operations that change between two programs")
+    diff.add_argument("program")
+    diff.add_argument("other")
+    args = parser.parse_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    if args.command == "compile":
+        program = compile_program(args.profile, **parse_settings(args.set))
+        save_program(program, args.output)
+        print("%s operations written in %s" % (len(program["ops"]), args.output))
+        return 0
+    program = load_program(args.program)
+    if args.command == "check":
+        try:
+            check_program(program)
+        except ValueError as error:
+            print(error)
+            return 1
+        print("%s operations, no problems" % len(program["ops"]))
+    elif args.command == "estimate":
+        print(format_table([estimate_program(program)]))
+    else:
+        other = load_program(args.other)
+        changes = diff_programs(program, other)
+        print(format_diff(program, other, changes))
+        return 1 if changes or diff_settings(program, other) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
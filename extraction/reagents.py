@@ -0,0 +1,100 @@
+"""
+Reagent volumes. fill_sheet() goes through the planned commands and adds up what is taken from every well of the reagents
+reservoir, plus the dead volume that the tips can't reach (deadHeight mm of liquid over the whole bottom of the well, from
+the labware definition). Wells that would need more than they hold come with a warning, so the reagent can be split
+between several wells in reagentWells.
+
+    python -m extraction.reagents viapath-16-07-20-96samples
+    python -m extraction.reagents 200ul --set runColumns=4 --csv fill.csv
+"""
+import argparse
+import csv
+import sys
+
+from .liquid import well_area, well_geometry
+from .profile import load_profile, reagent_well
+from .scheduler import build_steps, plan
+
+
+def reagent_usage(steps, commands, settings, channels=8):
+    """
+    {well: [reagent, ul]} taken from every reservoir well by <commands>. Reservoir wells feed the <channels> of the pipette.
+    Mixing in the reservoir and the disposal volume of distributions go back to the well, so they are not counted, but
+    a distribution needs its disposal volume in the well until the end, so that is added once.
+    """
+    usage = {}
+    for command in commands:
+        if command["type"] not in ("column", "distribute"):
+            continue
+        step = steps[command["step"]]
+        if step["action"] != "add" or command.get("mixOnly"):
+            continue
+        if command["type"] == "distribute":
+            wells = set()
+            for ID in command["IDs"]:
+                well = reagent_well(settings, step["reagent"], ID)
+                usage.setdefault(well, [step["reagent"], 0])[1] += step["vol"]*channels
+                wells.add(well)
+            for well in wells:
+                usage[well][1] += settings["disposalVolume"]*channels
+        else:
+            well = reagent_well(settings, step["reagent"], command["ID"])
+            usage.setdefault(well, [step["reagent"], 0])[1] += step["vol"]*channels
+    return usage
+
+
+def fill_sheet(settings, steps=None, commands=None, channels=8):
+    """
+    One row per reservoir well in use, in reservoir order: {"well", "reagent", "used", "dead", "fill", "capacity", "warning"}.
+    Volumes are ul. <steps> and <commands> are planned from <settings> if not given.
+    """
+    if steps is None:
+        steps = build_steps(settings)
+    if commands is None:
+        commands, _ = plan(steps, settings)
+    geometry = well_geometry(settings["labware"]["reagents"])
+    dead = well_area(geometry)*settings["deadHeight"]
+    capacity = geometry.get("totalLiquidVolume")
+    rows = []
+    for well, (reagent, used) in sorted(reagent_usage(steps, commands, settings, channels).items(), key=lambda item: int(item[0][1:])):
+        fill = used + dead
+        warning = None
+        if capacity and fill > capacity:
+            warning = "%s ml don't fit in %s (%s ml), split %s between more wells in reagentWells" % (
+                round(fill/1000, 2), well, round(capacity/1000, 2), reagent)
+        rows.append({"well": well, "reagent": reagent, "used": round(used, 1), "dead": round(dead, 1), "fill": round(fill, 1),
+        "capacity": capacity, "warning": warning})
+    return rows
+
+
+def format_sheet(rows):
+    """Fill sheet as text, one line per well"""
+    lines = []
+    for row in rows:
+        lines.append("%-4s %-12s %7.2f ml  (%s ul + %s ul dead volume)" % (row["well"], row["reagent"], row["fill"]/1000, row["used"], row["dead"]))
+        if row["warning"]:
+            lines.append("     WARNING: " + row["warning"])
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from .estimate import parse_settings
+    parser = argparse.ArgumentParser(description="How much of every reagent goes in the reagents reservoir")
+    parser.add_argument("profile", help="run profile")
+    parser.add_argument("--set", action="append", metavar="SETTING=VALUE", help="change a setting, can be repeated")
+    parser.add_argument("--csv", metavar="FILE", help="also write the fill sheet to FILE")
+    args = parser.parse_args(argv)
+    rows = fill_sheet(load_profile(args.profile, **parse_settings(args.set)))
+    print(format_sheet(rows))
+    if args.csv:
+        with open(args.csv, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=list(rows[0]) if rows else ["well"])
+            writer.writeheader()
+            writer.writerows(rows)
+    if any(row["warning"] for row in rows):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+"""
+The protocol is written as a list of steps instead of a list of calls. There are two kinds of steps:
+  - Column steps ("add", "remove", "elute") are done column by column. <incubation> (minutes) starts for each column
+    as soon as that column is done, so column 1 does not have to wait for column 6 before its incubation starts.
+  - Magnet steps ("magnet") act on the whole plate. They wait until every column has finished its incubation, then
+    engage/disengage and start a plate-wide <incubation>.
+plan() turns the step list into the order the robot will follow. Within the steps between two magnet steps, any column
+whose incubation is over can be processed while other columns are still waiting, and the bead premix is done while
+waiting for the column that needs it. Nothing here talks to the robot, so plans can be made without a ProtocolContext.
+"""
+import math
+
+from .magnets import capture_minutes
+from .profile import beads_mixing, column_ids, reagent_well
+
+
+def build_steps(settings):
+    """
+    Returns the list of steps of the RNA extraction for <settings>, without the ones in skipSteps and with stepOverrides applied.
+    Every step has a "name", which is what skipSteps and stepOverrides use.
+    """
+    parked = settings["parkTips"]
+    initialSupernatant = settings["originalVol"] + settings["proteinaseVol"] + settings["beadsVol"] + settings["extraSupernatant"]
+    if settings["splitDry"]:
+        dry = settings["incubationDry"]/2
+    else:
+        dry = settings["incubationDry"]
+    steps = [
+            #STEP 1: Add Proteinase K/LBF.
+        {"name": "proteinase", "action": "add", "vol": settings["proteinaseVol"], "reagent": "proteinase", "reagentName": "Proteinase K/LBF",
+        "altura": settings["SamplePlusProteinaseHeight"], "downRepeats": settings["mixDownRepeats"], "park": False,
+        "incubation": settings["incubationProteinase"]},
+        #INCUBATION 1: counted for each column
+            #STEP 2: mix magnetic beads, add them to samples and mix sample well.
+        {"name": "beads", "action": "add", "vol": settings["beadsVol"], "reagent": "beads", "reagentName": "Magnetic beads", "mixReagent": True,
+        "extraVol": 10, "altura": settings["SamplePlusProteinasePlusBeadsHeight"], "downRepeats": settings["mixDownRepeats"], "park": parked,
+        "incubation": settings["incubationBeadsNoMagnet"]},
+        #INCUBATION 2: without magnet, counted for each column
+        {"name": "beadsMagnet", "action": "magnet", "engage": True, "incubation": settings["incubationBeadsMagnet"]},
+        #INCUBATION 3: with magnet
+            #STEP 3: Remove magnetic beads supernatant
+        {"name": "beadsRemoval", "action": "remove", "vol": initialSupernatant, "wasteID": "A1", "reagentName": "beads and proteinase", "newtip": not parked},
+        {"name": "beadsDisengage", "action": "magnet", "engage": False},
+    ]
+            #STEP 4-9: Washes with WBE and twice with Ethanol
+    washes = [("WBE", "WBE", "A2"), ("ethanol1", "Ethanol 70% (First time)", "A3"), ("ethanol2", "Ethanol 70% (Second time)", "A4")]
+    for reagent, reagentName, wasteID in washes:
+        steps += [
+            {"name": reagent, "action": "add", "vol": settings["washVol"], "reagent": reagent, "reagentName": reagentName,
+            "altura": settings["generalHeight"], "downRepeats": settings["mixDownRepeats"], "park": parked},
+            {"name": reagent + "Magnet", "action": "magnet", "engage": True, "incubation": settings["incubationWash"]},
+            {"name": reagent + "Removal", "action": "remove", "vol": settings["washVol"], "wasteID": wasteID, "reagentName": reagentName,
+            "newtip": not parked},
+            {"name": reagent + "Disengage", "action": "magnet", "engage": False},
+        ]
+    #This time, I do not disengage the magnet and let the beads dry
+    steps.pop()
+    steps[-1]["incubation"] = dry
+    if settings["splitDry"]:
+        #Making sure I removed all the ethanol, then the other half of the drying
+        steps.append({"name": "dryRemoval", "action": "remove", "vol": 20, "wasteID": "A4", "reagentName": "Dried ethanol", "newtip": True,
+        "incubation": dry})
+    steps += [
+        {"name": "dryDisengage", "action": "magnet", "engage": False},
+            #STEP 10: Diluting samples in RNAse free water
+        {"name": "water", "action": "add", "vol": settings["dilutionVol"], "reagent": "water", "reagentName": "RNAse-free water",
+        "mixVol": settings["waterMixing"], "repeats": settings["waterMixRepeats"], "altura": settings["generalHeight"],
+        "downRepeats": settings["mixDownRepeats"], "park": False, "incubation": settings["incubationWater"]},
+        #INCUBATION: without magnet, counted for each column
+        {"name": "waterMagnet", "action": "magnet", "engage": True, "incubation": settings["incubationWaterMagnet"]},
+            #STEP 11: Transfering samples to output plate
+        {"name": "elution", "action": "elute", "vol": settings["dilutionVol"], "newtip": True},
+    ]
+    unknown = set(settings["skipSteps"]) | set(settings["stepOverrides"]) | set(settings["distribute"])
+    unknown -= set(step["name"] for step in steps)
+    if unknown:
+        raise ValueError("There are no steps called %s" % ", ".join(sorted(unknown)))
+    steps = [step for step in steps if step["name"] not in settings["skipSteps"]]
+    capture = capture_minutes(settings)
+    for step in steps:
+        if step["action"] == "magnet" and step["engage"] and step.get("incubation", 0) > 0:
+            step["incubation"] = max(step["incubation"], capture) # The beads of this plate need that long at its height
+        if step["action"] == "add":
+            step.setdefault("mixVol", settings["washMixing"])
+            step.setdefault("repeats", settings["mixRepeats"])
+            step["distribute"] = step["name"] in settings["distribute"]
+        step.update(settings["stepOverrides"].get(step["name"], {}))
+        if settings["dryRun"] and step["action"] == "magnet":
+            step["incubation"] = 0 # Nothing to pull down in a water test
+        if step.get("distribute") and (step["action"] != "add" or step.get("mixReagent") or step.get("extraVol")):
+            raise ValueError("%s can't be distributed, only add steps without reservoir mixing or air gap can" % step["name"])
+    route_small(steps, settings)
+    keep_tips(steps, settings)
+    return steps
+
+
+def route_small(steps, settings):
+    """
+    With a smallPipette, removals and elutions of up to smallVolume ul are done with it ("pipette": "small"), with a new
+    small tip for every column: tips of the big pipette can't be parked for it or taken from it.
+    Steps with a "pipette" in stepOverrides ("big" or "small") are left as they are.
+    """
+    if settings["smallPipette"] is None:
+        return
+    for step in steps:
+        if "pipette" in step:
+            if step["pipette"] == "small":
+                step["newtip"] = True
+            continue
+        if step["action"] in ("remove", "elute") and step["vol"] <= settings["smallVolume"] and not step.get("park"):
+            step["pipette"] = "small"
+            step["newtip"] = True
+
+
+def keep_tips(steps, settings):
+    """
+    With keepTips, the tip that adds water is parked and used again for the elution, and the tip of the last ethanol removal
+    is parked and used again for the dry removal. Both are the same column, so nothing is contaminated. With "auto" this is
+    only done while the tipracks are not enough for the run (a full plate of 12 columns needs 96 tips without it).
+    Steps changed in stepOverrides are left as they are.
+    """
+    if settings["keepTips"] == False or settings["deck"]["parking"] is None:
+        return
+    named = {step["name"]: step for step in steps}
+    for parked, reused in [("water", "elution"), ("ethanol2Removal", "dryRemoval")]:
+        if settings["keepTips"] == "auto" and tips_needed(steps, settings) <= tip_capacity(settings):
+            return
+        if parked not in named or reused not in named or named[reused].get("pipette") == "small":
+            continue
+        if parked not in settings["stepOverrides"] and reused not in settings["stepOverrides"]:
+            named[parked]["park"] = True
+            named[reused]["newtip"] = False
+
+
+def distribute_tips(step, IDs, settings):
+    """Tips used to distribute <step> to the columns <IDs>, one for every reagent well they take it from"""
+    return len(set(reagent_well(settings, step["reagent"], ID) for ID in IDs))
+
+
+def tips_needed(steps, settings):
+    """Tips taken from the tipracks to run <steps> in every column of every plate. Parked tips are not counted, they are used again"""
+    columns = settings["runColumns"]
+    tips = 0
+    for step in steps:
+        if step.get("pipette") == "small":
+            continue
+        if step["action"] == "add" and step.get("distribute"):
+            tips += distribute_tips(step, column_ids(settings), settings)
+            if needs_mixing(step):
+                tips += columns
+        elif step["action"] == "add":
+            tips += columns
+        elif step["action"] in ("remove", "elute") and step.get("newtip", step["action"] == "elute"):
+            tips += columns
+    return tips*settings["plates"]
+
+
+def small_tips_needed(steps, settings):
+    """Tips of the smallPipette used to run <steps> in every column"""
+    return settings["runColumns"]*len([step for step in steps if step.get("pipette") == "small"])*settings["plates"]
+
+
+def tip_capacity(settings):
+    """Tips in the tipracks, for a multichannel that takes a whole column of tips every time"""
+    return 12*len(settings["deck"]["tipracks"])
+
+
+def command_tips(command, steps, settings):
+    """Tips that <command> takes from the tipracks"""
+    if command["type"] == "premix":
+        return 1
+    if command["type"] == "distribute":
+        return distribute_tips(steps[command["step"]], command["IDs"], settings)
+    if command["type"] != "column":
+        return 0
+    step = steps[command["step"]]
+    if step.get("pipette") == "small":
+        return 0 # They come from the smallTipracks
+    if step["action"] == "add":
+        return 0 if command["tipOn"] else 1
+    if step.get("newtip", step["action"] == "elute"):
+        return 1
+    return 0
+
+
+def plan_tips(commands, steps, settings, used=0):
+    """
+    Checks that the tipracks are enough for <commands>. If they are not, with tipRefills the robot pauses to replace the
+    empty tipracks at the start of the last incubation before tips run out, so the time the racks take is not lost; if there
+    is no incubation since the last refill, it pauses just before the command that needs the tip. Tips are taken rack by rack,
+    so after a refill only the tips of the rack that was being used are missing.
+    Without tipRefills, it raises ValueError before anything is done. Tips of the smallPipette are not refilled, there must be enough.
+    <used> tips are already gone from the racks when <commands> start, as when resuming a run (see checkpoint.py).
+    Returns <commands> with "refill": True in those waits, or new "refill" commands.
+    """
+    smallNeeded = small_tips_needed(steps, settings)
+    if smallNeeded > 12*len(settings["deck"]["smallTipracks"]):
+        raise ValueError("This run needs %s tips of the smallPipette, but there are only %s in the smallTipracks"
+        % (smallNeeded, 12*len(settings["deck"]["smallTipracks"])))
+    capacity = tip_capacity(settings)
+    needed = sum(command_tips(command, steps, settings) for command in commands)
+    if used + needed <= capacity:
+        return commands
+    if not settings["tipRefills"]:
+        raise ValueError("This run needs %s tips, but there are only %s in the tipracks. Add tipracks or set tipRefills to true"
+        % (needed, capacity - used))
+    commands = [dict(command) for command in commands]
+    lastWait = None # (position in commands, tips used then)
+    position = 0
+    while position < len(commands):
+        command = commands[position]
+        if command["type"] in ("wait", "swap") and not command.get("refill"):
+            lastWait = (position, used)
+        tips = command_tips(command, steps, settings)
+        if used + tips > capacity:
+            if lastWait is not None and lastWait[1] % 12 + used - lastWait[1] + tips <= capacity:
+                commands[lastWait[0]]["refill"] = True
+                used = lastWait[1] % 12 + used - lastWait[1]
+            else:
+                commands.insert(position, {"type": "refill"})
+                position += 1
+                used = used % 12
+            lastWait = None
+        used += tips
+        position += 1
+    return commands
+
+
+def needs_mixing(step):
+    """True if a step touches the sample to mix it, so every column needs its own tip"""
+    return step["action"] == "add" and step["repeats"] + step.get("downRepeats", 0) > 0
+
+
+def column_seconds(step, settings, mixOnly=False):
+    """
+    Guess of how many seconds a single column of <step> keeps the pipette busy. It does not need to be exact, but it must not
+    be pessimistic: if the robot is slower than this, incubations get a bit longer, never shorter.
+    With <mixOnly>, the reagent is already in the well (see distribute_seconds) and the column is only mixed.
+    """
+    vol = step.get("vol", 0)
+    if mixOnly:
+        vol = 0
+    trips = math.ceil(vol / settings["tipVolume"])
+    aspirate = settings["flowRates"]["aspirate"]
+    dispense = settings["flowRates"]["dispense"]
+    moveTime = settings["moveTime"]
+    if step["action"] == "add":
+        repeats = step["repeats"] + step.get("downRepeats", 0)
+        mixVol = step["mixVol"]
+        seconds = vol/aspirate + vol/dispense + trips*20/dispense
+        seconds += (max(trips - 1, 0)*2 + settings["mixDelay"])*settings["delayFactor"] # Delay before blowing out every full trip
+        seconds += repeats*mixVol*(1/settings["mixFlowRates"]["aspirate"] + 1/settings["mixFlowRates"]["dispense"])
+        return seconds + (2 + 3*trips)*moveTime + 2*repeats*0.2 # Moves inside the well are only a few mm
+    if step["action"] == "remove":
+        seconds = vol/settings["removalFlowRate"] + vol/dispense + trips*20/dispense
+        seconds += trips*settings["dripDelay"]*settings["delayFactor"]
+        if settings["meneillo"] in ("touch_tip", "blow_out"):
+            seconds += trips*1
+        elif settings["meneillo"]:
+            seconds += trips*2*settings["meneilloReps"]*0.1 # meneillo moves are tiny
+        return seconds + (2 + 3*trips)*moveTime
+    if step["action"] == "elute":
+        return vol/settings["removalFlowRate"] + vol/dispense + 2 + 5*moveTime
+    return 0
+
+
+def distribute_seconds(step, settings, columns):
+    """Same as column_seconds, for adding the reagent of <step> to <columns> columns with a single tip"""
+    total = step["vol"]*columns
+    aspirations = math.ceil(total / (settings["tipVolume"] - settings["disposalVolume"]))
+    seconds = (total + aspirations*settings["disposalVolume"])/settings["flowRates"]["aspirate"] + total/settings["flowRates"]["dispense"]
+    return seconds + (2 + 2*aspirations + columns)*settings["moveTime"]
+
+
+def premix_seconds(step, settings):
+    """Same as column_seconds, for the reagent mixing done before some columns"""
+    mixing = beads_mixing(settings)
+    repeats = settings["beadsMixRepeats"]
+    return repeats*mixing*(1/settings["mixFlowRates"]["aspirate"] + 1/settings["mixFlowRates"]["dispense"]) + 2*settings["moveTime"] + 2*repeats*0.2
+
+
+def needs_premix(step, index, settings):
+    """If the reagent is to be mixed, and we are in one of the beadsMixIndexes columns, mix it. We mix three times to make sure we dont have differences"""
+    return step.get("mixReagent", False) and index in settings["beadsMixIndexes"]
+
+
+def plan(steps, settings):
+    """
+    Returns the list of commands to run <steps>, together with the estimated duration in seconds.
+    Each command is a dictionary with a "type": "wait", "premix", "distribute", "column", "magnet", "swap" (see queue_plates)
+    or "refill" (see plan_tips).
+    Commands that use the pipette have the "seconds" they are expected to take. Waits for incubations have the "IDs" of the
+    columns they wait for (and a "lead" if they end that many seconds before), so the engine waits for the real end of
+    those incubations instead of the planned "seconds" (see timer.py).
+    Distributed steps wait for every column to be ready, like magnet steps, and then only the mixing is done column by column.
+    With the "linear" scheduler every step is done in all columns before the next one, and incubations start after the last column.
+    With several plates, the plan of one plate is repeated for each of them (see queue_plates).
+    """
+    if settings["scheduler"] == "linear":
+        commands, now = _plan_linear(steps, settings)
+    else:
+        commands, now = _plan_pipelined(steps, settings)
+    if settings["plates"] > 1:
+        commands, now = queue_plates(commands, now, settings)
+    return plan_tips(commands, steps, settings), now
+
+
+def queue_plates(commands, seconds, settings):
+    """
+    <commands> (the plan of one plate, that takes <seconds>) for every plate of the queue, with a "swap" command between
+    plates where the robot pauses for the operator to change them. The last wait of every plate but the last one has
+    "announce": the next plate, so the operator gets it ready during that incubation instead of after the run.
+    Every command has its "plate", from 1.
+    """
+    queued = []
+    plates = settings["plates"]
+    for plate in range(1, plates + 1):
+        if plate > 1:
+            queued.append({"type": "swap", "plate": plate})
+        plateCommands = [dict(command, plate=plate) for command in commands]
+        waits = [position for position, command in enumerate(plateCommands) if command["type"] == "wait"]
+        if plate < plates and waits:
+            plateCommands[waits[-1]]["announce"] = plate + 1
+        queued += plateCommands
+    return queued, seconds*plates + settings["swapMinutes"]*60*(plates - 1)
+
+
+def _plan_pipelined(steps, settings):
+    """Commands of plan() for a single plate, with incubations counted for every column. Returns (commands, seconds)"""
+    columnID = column_ids(settings)
+    commands = []
+    now = 0
+    ready = {ID: 0 for ID in columnID} # When each column is done with its incubation
+    pause = False
+    start = 0
+    while start < len(steps):
+        if steps[start]["action"] == "magnet":
+            step = steps[start]
+            freeAt = max([now] + list(ready.values()))
+            if freeAt > now:
+                commands.append({"type": "wait", "seconds": freeAt - now, "reason": "the last column to be ready for the magnet", "pause": pause,
+                "IDs": columnID})
+                now = freeAt
+            commands.append({"type": "magnet", "step": start, "engage": step["engage"]})
+            for ID in columnID:
+                ready[ID] = now + step.get("incubation", 0)*60
+            pause = step.get("pause", False)
+            start += 1
+            continue
+        nextStep = {ID: start for ID in columnID}
+        if steps[start].get("distribute"):
+            step = steps[start]
+            freeAt = max([now] + list(ready.values()))
+            if freeAt > now:
+                commands.append({"type": "wait", "seconds": freeAt - now, "reason": "the last column to be ready for %s" % step["reagentName"], "pause": pause,
+                "IDs": columnID})
+                pause = False
+                now = freeAt
+            commands.append({"type": "distribute", "step": start, "IDs": columnID, "seconds": distribute_seconds(step, settings, len(columnID))})
+            now += commands[-1]["seconds"]
+            if not needs_mixing(step):
+                for ID in columnID:
+                    ready[ID] = now + step.get("incubation", 0)*60
+                    nextStep[ID] += 1
+        #Column steps until the next magnet or distributed step can be mixed freely between columns
+        end = start + 1
+        while end < len(steps) and steps[end]["action"] != "magnet" and not steps[end].get("distribute"):
+            end += 1
+        while any(nextStep[ID] < end for ID in columnID):
+            best = None
+            for position, ID in enumerate(columnID):
+                index = nextStep[ID]
+                if index == end:
+                    continue
+                step = steps[index]
+                premix = needs_premix(step, position, settings)
+                prep = premix_seconds(step, settings) if premix else 0
+                begin = max(now, ready[ID] - prep)
+                key = (begin, -index, position) #Earliest first, and if that is a tie, the column that is further ahead
+                if best is None or key < best[0]:
+                    best = (key, ID, index, premix, prep)
+            (begin, _, _), ID, index, premix, prep = best
+            step = steps[index]
+            if begin > now:
+                commands.append({"type": "wait", "seconds": begin - now, "reason": "column %s" % ID, "pause": pause, "IDs": [ID], "lead": prep})
+                pause = False
+                now = begin
+            if premix:
+                commands.append({"type": "premix", "step": index, "ID": ID, "seconds": prep})
+                now += prep
+            if ready[ID] > now:
+                commands.append({"type": "wait", "seconds": ready[ID] - now, "reason": "column %s" % ID, "pause": pause, "IDs": [ID]})
+                pause = False
+                now = ready[ID]
+            mixOnly = step.get("distribute", False)
+            commands.append({"type": "column", "step": index, "ID": ID, "tipOn": premix, "mixOnly": mixOnly,
+            "seconds": column_seconds(step, settings, mixOnly)})
+            now += commands[-1]["seconds"]
+            ready[ID] = now + step.get("incubation", 0)*60
+            nextStep[ID] += 1
+        start = end
+    return commands, now
+
+
+def _plan_linear(steps, settings):
+    """The order the protocols followed before plan() existed"""
+    commands = []
+    now = 0
+    for index, step in enumerate(steps):
+        columnID = column_ids(settings)
+        if step["action"] == "magnet":
+            commands.append({"type": "magnet", "step": index, "engage": step["engage"]})
+        elif step.get("distribute"):
+            commands.append({"type": "distribute", "step": index, "IDs": columnID, "seconds": distribute_seconds(step, settings, len(columnID))})
+            now += commands[-1]["seconds"]
+            if needs_mixing(step):
+                for ID in columnID:
+                    commands.append({"type": "column", "step": index, "ID": ID, "tipOn": False, "mixOnly": True,
+                    "seconds": column_seconds(step, settings, mixOnly=True)})
+                    now += commands[-1]["seconds"]
+        else:
+            for position, ID in enumerate(columnID):
+                premix = needs_premix(step, position, settings)
+                if premix:
+                    commands.append({"type": "premix", "step": index, "ID": ID, "seconds": premix_seconds(step, settings)})
+                    now += commands[-1]["seconds"]
+                commands.append({"type": "column", "step": index, "ID": ID, "tipOn": premix, "mixOnly": False, "seconds": column_seconds(step, settings)})
+                now += commands[-1]["seconds"]
+        if step.get("incubation", 0) > 0:
+            commands.append({"type": "wait", "seconds": step["incubation"]*60, "reason": "the incubation", "pause": step.get("pause", False)})
+            now += step["incubation"]*60
+    return commands, now
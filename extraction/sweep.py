@@ -0,0 +1,147 @@
+"""
+Parameter sweeps. Every combination of a grid of settings is simulated in its own process, using all the cores, and the
+estimated duration (see estimate.py), the tips and the reagents to load (see reagents.py) of each run end up in a table.
+
+    python -m extraction.sweep viapath-16-07-20 --grid mixRepeats=10,15,20 --grid runColumns=4,6
+    python -m extraction.sweep 200ul --grid flowRates.aspirate=30,50 --grid washMixing=150,180 --csv sweep.csv
+
+Grid values are JSON, separated by commas. Dotted names change a single key of a setting that is a dictionary, like
+flowRates.aspirate. --set changes settings for every run of the sweep. --fake runs them with the ProtocolContext of
+fake.py instead of opentrons_simulate, for big grids.
+"""
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import sys
+
+from .estimate import estimate, minutes, parse_settings
+from .labware import custom_labware
+from .profile import ColumnsError, load_profile
+from .reagents import fill_sheet
+
+
+def parse_grid(pairs):
+    """["mixRepeats=10,15", "flowRates.aspirate=30,50"] -> {"mixRepeats": [10, 15], "flowRates.aspirate": [30, 50]}"""
+    grid = {}
+    for pair in pairs or []:
+        key, _, values = pair.partition("=")
+        try:
+            grid[key] = json.loads("[" + values + "]")
+        except ValueError:
+            grid[key] = values.split(",")
+    return grid
+
+
+def combinations(grid):
+    """Every combination of the values of <grid>, as {name: value} in the order of the grid"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def expand(point):
+    """{"flowRates.aspirate": 30} -> {"flowRates": {"aspirate": 30}}, the way load_profile() takes them"""
+    settings = {}
+    for name, value in point.items():
+        keys = name.split(".")
+        nested = settings
+        for key in keys[:-1]:
+            nested = nested.setdefault(key, {})
+        nested[keys[-1]] = value
+    return settings
+
+
+def simulate(profile, point, settings=None, context=None):
+    """
+    Row of the sweep for <point> (the grid values) on top of <profile> and <settings>: the grid values, "duration" (s),
+    "tips", "commands" and ml of every reagent to load. A combination the profile doesn't take (ValueError, like a
+    ColumnsError) or the robot would stop at (the RuntimeError of the fake, or of opentrons) has an "error" instead.
+    Other exceptions are bugs, and stop the sweep.
+    """
+    overrides = dict(settings or {})
+    overrides.update(expand(point))
+    row = dict(point)
+    try:
+        report = estimate(profile, context=context, **overrides)
+        sheet = fill_sheet(load_profile(profile, **overrides))
+    except (ValueError, ColumnsError, RuntimeError) as error:
+        row["error"] = "%s: %s" % (type(error).__name__, error)
+        return row
+    row.update({"duration": report["total"], "tips": report["tips"], "commands": report["commands"]})
+    for line in sheet:
+        row[line["reagent"]] = round(row.get(line["reagent"], 0) + line["fill"]/1000, 2)
+    return row
+
+
+def _simulate(job):
+    return simulate(*job)
+
+
+def run_sweep(profile, grid, settings=None, workers=None, context=None):
+    """
+    Rows of simulate() for every combination of <grid>, in the order of combinations(). They run in <workers> processes
+    (one per core if None); with 1, everything runs in this process. <context> must be picklable to use several processes.
+    """
+    jobs = [(profile, point, settings, context) for point in combinations(grid)]
+    if workers == 1 or len(jobs) < 2:
+        return [_simulate(job) for job in jobs]
+    custom_labware() # Read once here, so the workers start with the definitions already parsed
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        return list(pool.map(_simulate, jobs))
+
+
+def format_rows(rows, grid):
+    """The sweep as a table, one row per combination. Durations as minutes"""
+    columns = list(grid) + ["duration", "tips", "commands"]
+    for row in rows:
+        columns += [key for key in row if key not in columns and key != "error"]
+    lines = []
+    table = [columns]
+    for row in rows:
+        if "error" in row:
+            continue
+        table.append([minutes(row[column]) if column == "duration" else str(row.get(column, "-")) for column in columns])
+    widths = [max(len(str(line[i])) for line in table) for i in range(len(columns))]
+    for line in table:
+        lines.append("  ".join(str(cell).rjust(width) for cell, width in zip(line, widths)))
+    for row in rows:
+        if "error" in row:
+            lines.append("%s  ERROR %s" % (json.dumps(dict((name, row[name]) for name in grid)), row["error"]))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulates a run profile for every combination of a grid of settings")
+    parser.add_argument("profile", help="run profile")
+    parser.add_argument("--grid", action="append", metavar="SETTING=VALUE,VALUE...", help="values of a setting, can be repeated")
+    parser.add_argument("--set", action="append", metavar="SETTING=VALUE", help="change a setting in every run, can be repeated")
+    parser.add_argument("--workers", type=int, help="processes to use (default one per core)")
+    parser.add_argument("--sort", help="sort the rows by this column, e.g. duration")
+    parser.add_argument("--csv", metavar="FILE", help="also write the table to FILE")
+    parser.add_argument("--fake", action="store_true", help="use the fake ProtocolContext (fake.py) instead of opentrons_simulate")
+    args = parser.parse_args(argv)
+    grid = parse_grid(args.grid)
+    context = None
+    if args.fake:
+        from .fake import ProtocolContext as context
+    rows = run_sweep(args.profile, grid, parse_settings(args.set), args.workers, context)
+    if args.sort:
+        rows.sort(key=lambda row: (args.sort not in row, row.get(args.sort, 0)))
+    print(format_rows(rows, grid))
+    if args.csv:
+        columns = []
+        for row in rows:
+            columns += [key for key in row if key not in columns]
+        with open(args.csv, "w", newline="") as handle:
+            writer = csv.DictWriter(handle, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(rows)
+    if any("error" in row for row in rows):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Incubation deadlines. IncubationTimer keeps when the incubation of every column ends, so a wait lasts only what is left
+of it: if the robot was slower than planned, or paused for tips or the waste, that time already counts.
+In the robot the clock is the real one. In a simulation nothing takes time, so the clock moves with the delays and with
+the time the planner expects every command to take (the "seconds" of the commands of scheduler.plan()).
+"""
+import time
+
+
+class IncubationTimer:
+    """
+    Run clock and incubation deadlines, in seconds since the run started.
+    """
+
+    def __init__(self, simulating):
+        self.simulating = simulating
+        self.started = time.monotonic()
+        self.simulated = 0
+        self.deadlines = {} # {column ID: when its incubation ends}
+
+    def now(self):
+        if self.simulating:
+            return self.simulated
+        return time.monotonic() - self.started
+
+    def advance(self, seconds):
+        """<seconds> went by. Only the simulated clock needs to be told"""
+        self.simulated += seconds
+
+    def start(self, IDs, seconds):
+        """The incubation of the columns <IDs> starts now and lasts <seconds>"""
+        for ID in IDs:
+            self.deadlines[ID] = self.now() + seconds
+
+    def deadline(self, IDs, lead=0):
+        """When the last of the columns <IDs> is ready, <lead> seconds early. Columns without incubation are ready already"""
+        return max(self.deadlines.get(ID, 0) for ID in IDs) - lead
+
+
+def count_down(protocol, timer, deadline, reason, interval, factor=1, stop=False):
+    """
+    Waits on <protocol> until <deadline> of <timer>, saying every <interval> seconds how much is left. Intervals are
+    seconds of incubation, the delays are <factor> times them (delayFactor). The first delay is the part that doesn't
+    fill an interval, so the clock then says round numbers. If <stop> is True, it pauses one minute before <deadline>,
+    wherever that falls in the intervals, and the pause counts as part of the wait.
+    """
+    def remaining():
+        #The clock only falls behind if something took longer than planned, like a pause
+        return max((deadline - timer.now())/factor, 0)
+
+    def delay(seconds):
+        protocol.delay(seconds=seconds)
+        timer.advance(seconds)
+
+    left = remaining()
+    if left < 1:
+        return
+    protocol.comment("Waiting %s seconds for %s" % (int(round(left)), reason))
+    #With <stop>, it counts down to the pause first, and then to the end
+    for until in ((60, 0) if stop else (0,)):
+        if left - until >= 1:
+            rest = (left - until) % interval
+            if rest >= 1:
+                delay(round(rest*factor, 1))
+            left -= rest
+            while left - until >= 1:
+                chunk = min(interval, left - until)
+                delay(round(chunk*factor, 2))
+                left -= chunk
+                left = min(left, remaining())
+                if left % 60 < 1 or left % 60 > 59:
+                    protocol.comment("Only %s minutes more! Hold in there!" % int(round(left/60)))
+                else:
+                    protocol.comment("Only %s seconds more! Hold in there!" % int(round(left)))
+        if until and left > 0:
+            protocol.pause()
+            left = min(left, remaining())
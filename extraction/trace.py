@@ -0,0 +1,291 @@
+"""
+Records what a protocol asks the robot to do. Recorder wraps the ProtocolContext it is given, and the pipettes and modules
+loaded through it, so every aspirate, dispense, move, tip, delay and magnet call is written down with its location, volume
+and flow rate before it is done. Calls made inside other calls (the aspirates of a transfer) are recorded too, with a
+bigger "depth". It works the same in a simulation and on the robot, as it only wraps the objects of that run.
+
+The engine marks which step every call belongs to with section(), and its helpers (slow_transfer, well_mix...) with
+@helper, which do nothing when nothing is being recorded. chrome_trace() turns a recording into a Chrome trace
+(chrome://tracing, ui.perfetto.dev or speedscope), with the steps and helpers as the frames of a flame graph.
+"""
+import contextlib
+import functools
+import inspect
+import json
+import time
+
+_active = None
+
+#Calls that only group other calls. They are recorded, but their time is the time of what they do inside
+CONTAINERS = ("transfer", "distribute", "consolidate", "mix", "air_gap")
+PIPETTE_CALLS = ("aspirate", "dispense", "blow_out", "touch_tip", "move_to", "pick_up_tip", "drop_tip", "return_tip", "home") + CONTAINERS
+PROTOCOL_CALLS = ("delay", "pause", "comment", "home")
+MODULE_CALLS = ("engage", "disengage")
+
+
+@contextlib.contextmanager
+def section(name):
+    """
+    Everything recorded inside belongs to <name> (a step of the extraction, normally)
+    """
+    if _active is None:
+        yield
+        return
+    recorder = _active
+    recorder.sections.append(name)
+    span = recorder.open_span(name, "step")
+    try:
+        yield
+    finally:
+        recorder.sections.pop()
+        recorder.close_span(span)
+
+
+def recording():
+    """The Recorder recording now, or None"""
+    return _active
+
+
+def helper(function):
+    """Records the calls made inside <function> as a frame with its name"""
+    @functools.wraps(function)
+    def traced(*args, **kwargs):
+        recorder = _active
+        if recorder is None:
+            return function(*args, **kwargs)
+        recorder.helpers.append(function.__name__)
+        span = recorder.open_span(function.__name__, "helper")
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.helpers.pop()
+            recorder.close_span(span)
+    return traced
+
+
+def point(location, well="bottom"):
+    """
+    (x, y, z) deck coordinates of <location>. Wells are taken at 1 mm over their bottom, or at their top with well="top".
+    """
+    if location is None:
+        return None
+    found = getattr(location, "point", None)
+    if found is None and hasattr(location, well):
+        if well == "bottom":
+            found = location.bottom(1).point
+        else:
+            found = location.top().point
+    if found is None:
+        return None
+    return (found.x, found.y, found.z)
+
+
+class Recorder:
+    """
+    with Recorder() as recorder:
+        protocol = recorder.wrap(protocol)
+        run(protocol)
+    recorder.commands is the list of calls, each one a dictionary with at least "name", "section", "helpers" (the helpers
+    it was called from), "depth", and "start" and "end" (seconds since the recording started, as the clock sees them).
+    recorder.spans has the steps and helpers, with the positions of their first and last commands.
+    """
+
+    def __init__(self):
+        self.commands = []
+        self.sections = []
+        self.helpers = []
+        self.spans = []
+        self.depth = 0
+        self.trash = None
+        self.started = time.time()
+
+    def __enter__(self):
+        global _active
+        self._previous = _active
+        _active = self
+        self.started = time.time()
+        return self
+
+    def now(self):
+        return time.time() - self.started
+
+    def open_span(self, name, kind):
+        span = {"name": name, "kind": kind, "first": len(self.commands), "start": self.now()}
+        self.spans.append(span)
+        return span
+
+    def close_span(self, span):
+        span["last"] = len(self.commands)
+        span["end"] = self.now()
+
+    def __exit__(self, *exc):
+        global _active
+        _active = self._previous
+        return False
+
+    def wrap(self, protocol):
+        """Starts recording <protocol>, and what gets loaded through it. Returns <protocol> itself"""
+        for name in PROTOCOL_CALLS:
+            self._wrap(protocol, name, "protocol")
+        loadInstrument = protocol.load_instrument
+        loadModule = protocol.load_module
+
+        def load_instrument(*args, **kwargs):
+            instrument = loadInstrument(*args, **kwargs)
+            for name in PIPETTE_CALLS:
+                self._wrap(instrument, name, "pipette")
+            return instrument
+
+        def load_module(*args, **kwargs):
+            module = loadModule(*args, **kwargs)
+            for name in MODULE_CALLS:
+                self._wrap(module, name, "module")
+            return module
+
+        protocol.load_instrument = load_instrument
+        protocol.load_module = load_module
+        try:
+            self.trash = point(protocol.fixed_trash.wells()[0], well="top")
+        except (AttributeError, IndexError, KeyError):
+            self.trash = None
+        return protocol
+
+    def _wrap(self, target, name, kind):
+        """Replaces target.<name> with a version that records the call before doing it"""
+        original = getattr(target, name, None)
+        if original is None:
+            return
+        try:
+            signature = inspect.signature(original)
+        except (TypeError, ValueError):
+            signature = None
+
+        def recorded(*args, **kwargs):
+            arguments = {}
+            if signature is not None:
+                try:
+                    arguments = dict(signature.bind(*args, **kwargs).arguments)
+                except TypeError:
+                    arguments = dict(kwargs)
+            command = self.describe(target, name, kind, arguments)
+            command["start"] = self.now()
+            self.commands.append(command)
+            start = len(self.commands)
+            self.depth += 1
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.depth -= 1
+                command["children"] = len(self.commands) - start
+                command["end"] = self.now()
+
+        recorded.__name__ = name
+        recorded.__wrapped__ = original
+        setattr(target, name, recorded)
+
+    def describe(self, target, name, kind, arguments):
+        """The dictionary recorded for a call of target.<name> with <arguments>"""
+        command = {
+            "name": name,
+            "kind": kind,
+            "section": self.sections[-1] if self.sections else "protocol",
+            "helpers": list(self.helpers),
+            "depth": self.depth,
+        }
+        if kind == "pipette":
+            command["instrument"] = id(target)
+            flowRates = getattr(target, "flow_rate", None)
+            currentVolume = getattr(target, "current_volume", 0) or 0
+            volume = arguments.get("volume")
+            if name == "aspirate":
+                if volume is None:
+                    volume = (getattr(target, "max_volume", 0) or 0) - currentVolume
+                command["flowRate"] = getattr(flowRates, "aspirate", None)
+            elif name == "dispense":
+                if volume is None:
+                    volume = currentVolume
+                command["flowRate"] = getattr(flowRates, "dispense", None)
+            elif name == "transfer":
+                command["flowRate"] = getattr(flowRates, "aspirate", None)
+                command["dispenseRate"] = getattr(flowRates, "dispense", None)
+            elif name == "blow_out":
+                command["flowRate"] = getattr(flowRates, "blow_out", None)
+            if command.get("flowRate") is not None:
+                command["flowRate"] *= arguments.get("rate", 1.0) or 1.0
+            if volume is not None:
+                command["volume"] = volume
+            if name == "transfer":
+                command["source"] = point(arguments.get("source"))
+                command["location"] = point(arguments.get("dest"))
+            elif name in ("pick_up_tip", "drop_tip"):
+                command["location"] = point(arguments.get("location"), well="top")
+            else:
+                command["location"] = point(arguments.get("location"))
+            #How fast it goes there, and if it goes straight instead of in an arc (see estimate.travel_seconds)
+            command["speed"] = arguments.get("speed") or getattr(target, "default_speed", None)
+            if arguments.get("force_direct"):
+                command["direct"] = True
+        elif kind == "protocol":
+            if name == "delay":
+                command["seconds"] = (arguments.get("seconds") or 0) + 60*(arguments.get("minutes") or 0)
+            elif name in ("comment", "pause"):
+                command["text"] = arguments.get("msg")
+        elif kind == "module":
+            command["height"] = arguments.get("height")
+        return command
+
+
+def model_times(commands):
+    """
+    (start, end) of every command if each one takes the "seconds" (and "travel") given by estimate.timed(), one after
+    the other. This is the clock used for simulations, where calls take no time.
+    """
+    times = []
+    now = 0
+    for command in commands:
+        start = now
+        now += command.get("travel", 0) + (command.get("seconds") or 0) + command.get("liquid", 0)
+        times.append([start, now])
+    for position, command in enumerate(commands):
+        if command.get("children"):
+            times[position][1] = times[position + command["children"]][1]
+    return times
+
+
+def chrome_trace(recorder, clock="wall"):
+    """
+    Chrome trace of <recorder>: a complete event for every step, helper and robot command, nested as they were called.
+    <clock> is "wall" for the time things really took (on the robot) or "model" for the times of estimate.timed().
+    """
+    commands = recorder.commands
+    if clock == "model":
+        times = model_times(commands)
+    else:
+        times = [[command["start"], command["end"]] for command in commands]
+    events = []
+    for span in recorder.spans:
+        if span["last"] > span["first"]:
+            start, end = times[span["first"]][0], max(time[1] for time in times[span["first"]:span["last"]])
+        elif clock == "model":
+            continue
+        else:
+            start, end = span["start"], span["end"]
+        events.append({"name": span["name"], "cat": span["kind"], "ph": "X", "pid": 1, "tid": 1,
+        "ts": round(start*1e6), "dur": round((end - start)*1e6)})
+    for command, (start, end) in zip(commands, times):
+        if command["name"] == "comment":
+            events.append({"name": command.get("text") or "comment", "cat": "comment", "ph": "i", "s": "t", "pid": 1, "tid": 1,
+            "ts": round(start*1e6)})
+            continue
+        args = dict((key, command[key]) for key in ("location", "volume", "flowRate", "seconds", "height", "section") if command.get(key) is not None)
+        events.append({"name": command["name"], "cat": command["kind"], "ph": "X", "pid": 1, "tid": 1,
+        "ts": round(start*1e6), "dur": round((end - start)*1e6), "args": args})
+    #Parents before children when they start at the same time, so viewers nest them right
+    events.sort(key=lambda event: (event["ts"], -event.get("dur", 0)))
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def write_trace(recorder, path, clock="wall"):
+    """Writes chrome_trace() of <recorder> in <path>"""
+    with open(path, "w") as handle:
+        json.dump(chrome_trace(recorder, clock), handle)
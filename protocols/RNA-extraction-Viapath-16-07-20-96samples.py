@@ -0,0 +1,12 @@
+from opentrons import protocol_api
+from extraction import run_profile
+
+metadata =  {
+    "protocolName": "Beckman RNA extraction protocol",
+    "author": "Angel Menendez Vazquez <angel.menendez_vazquez@kcl.ac.uk>",
+    "description": "Viapath 16/07/20 with a full plate of 96 samples in a single run",
+    "apiLevel": "2.3"
+}
+
+def run(protocol: protocol_api.ProtocolContext):
+    run_profile(protocol, "viapath-16-07-20-96samples") # Settings are in profiles/viapath-16-07-20-96samples.json
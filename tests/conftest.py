@@ -0,0 +1,13 @@
+"""
+Most of tests/ are protocol scripts for the robot (run with opentrons_simulate, benchmark.py or golden.py), some of them
+called test_*.py too. pytest only collects the tests of the extraction package here, run from the repository:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+#Protocol scripts with a test_ name
+collect_ignore = ["test_calibration.py", "test_calibration0.py"]
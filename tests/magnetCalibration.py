@@ -0,0 +1,12 @@
+from opentrons import protocol_api
+from extraction.calibration import run_calibration
+
+metadata =  {
+    "protocolName": "Magnet height calibration",
+    "author": "Angel Menendez Vazquez <angel.menendez_vazquez@kcl.ac.uk>",
+    "description": "Every column tests a magnet height and a capture time. Fill the columns with beads as after the beads step",
+    "apiLevel": "2.3"
+}
+
+def run(protocol: protocol_api.ProtocolContext):
+    run_calibration(protocol, 'viapath-16-07-20', heights=[6.2, 6.7, 7.2], captureMinutes=[2.0, 4.0], sampleVol=100)
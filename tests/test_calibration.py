@@ -1,6 +1,5 @@
 from opentrons import protocol_api, types
-import json
-import math
+from extraction.liquid import liquid_height, well_geometry
 
 metadata =  {
     "protocolName": "Beckman RNA extraction protocol",
@@ -51,15 +50,8 @@ def run(protocol: protocol_api.ProtocolContext):
     moveSide = 0
 
     def getMixingTopHeight(stringLabware, volume):
-        labwareDefinition = protocol_api.labware.get_labware_definition(stringLabware)
-        shape = labwareDefinition["wells"]["A1"]["shape"]
-        if shape=="circular":
-            diameter = labwareDefinition["wells"]["A1"]["diameter"]
-            height = (math.pi*diameter**2)/volume
-        else:
-            width = labwareDefinition["wells"]["A1"]["xDimension"]
-            length = labwareDefinition["wells"]["A1"]["yDimension"]
-            height = volume/(width*length)
+        """Height (mm from the bottom) of <volume> ul in a well of <stringLabware>, from the well geometry of its definition"""
+        return liquid_height(well_geometry(stringLabware), volume)
 
     def well_mix(vol, loc, reps, labwareName="eppendorf_96_deepwell_2ml", height=generalHeight, moveSide=0, bottomHeight = bottomMixHeight):
         """
@@ -75,7 +67,7 @@ def run(protocol: protocol_api.ProtocolContext):
         loc2 = loc.bottom().move(types.Point(x=0+moveSide, y=0, z=height))
         for _ in range(reps):
             p300.aspirate(vol, loc1)
-            p300.dispense(vol, loc1)
+            p300.dispense(vol, loc2)
         p300.flow_rate.aspirate = 50
         p300.flow_rate.dispense = 150
         p300.dispense(20, loc.top(topOffset))
@@ -0,0 +1,78 @@
+"""
+A run that stops and is resumed from its checkpoint (see checkpoint.py) ends like the run that didn't stop.
+"""
+import json
+
+import pytest
+
+from extraction.checkpoint import progress, resume_position
+from extraction.fake import ProtocolContext
+from extraction.profile import load_profile
+from extraction.scheduler import build_steps, command_tips, plan, tip_capacity, tips_needed
+
+
+class Crash(Exception):
+    pass
+
+
+def crashed_run(settings, method, calls):
+    """Runs <settings> until call number <calls> of Extraction.<method>, and stops there like the robot would"""
+    from extraction.engine import Extraction
+    protocol = ProtocolContext()
+    extraction = Extraction(protocol, settings)
+    original = getattr(extraction, method)
+    made = []
+    def crashing(*args, **kwargs):
+        made.append(1)
+        if len(made) == calls:
+            raise Crash()
+        return original(*args, **kwargs)
+    setattr(extraction, method, crashing)
+    with pytest.raises(Crash):
+        extraction.run()
+    return protocol
+
+
+def picked(protocol):
+    return len([command for command in protocol.commands if command["name"] == "pick_up_tip"])
+
+
+def full_run(tmp_path, **settings):
+    from extraction.engine import Extraction
+    protocol = ProtocolContext()
+    extraction = Extraction(protocol, load_profile("viapath-16-07-20", checkpointFile=str(tmp_path / "full.json"), **settings))
+    extraction.run()
+    return protocol, extraction
+
+
+def test_resumed_waste(tmp_path):
+    from extraction.engine import resume_profile
+    _, full = full_run(tmp_path, runColumns=3)
+    #Stops in the middle of the first batch of removals, when its trips are planned for all the columns
+    path = str(tmp_path / "crash.json")
+    crashed_run(load_profile("viapath-16-07-20", runColumns=3, checkpointFile=path), "remove_supernatant", 2)
+    resumed = resume_profile(ProtocolContext(), "viapath-16-07-20", runColumns=3, checkpointFile=path)
+    assert resumed.wasteVolumes == full.wasteVolumes
+
+
+@pytest.mark.parametrize("method, calls", [("slow_transfer", 3), ("slow_transfer", 8), ("remove_supernatant", 1),
+("remove_supernatant", 5), ("premix_reagent", 2), ("elute", 2)])
+def test_resumed_tips(tmp_path, method, calls):
+    from extraction.engine import resume_profile
+    fullProtocol, full = full_run(tmp_path, runColumns=3)
+    path = str(tmp_path / "crash.json")
+    settings = load_profile("viapath-16-07-20", runColumns=3, checkpointFile=path)
+    first = crashed_run(settings, method, calls)
+    #What the resumed run plans: the tips gone before the checkpoint and the ones of the commands left are those of a full run
+    with open(path) as handle:
+        checkpoint = json.load(handle)
+    steps = build_steps(settings)
+    commands = progress(plan(steps, settings)[0])
+    start = resume_position(commands, checkpoint["done"])
+    used = tip_capacity(settings) - len(checkpoint["tips"])
+    assert used + sum(command_tips(command, steps, settings) for command in commands[start:]) == tips_needed(steps, settings)
+    #And what it does: it stopped before taking a tip, so no tip is lost
+    second = ProtocolContext()
+    resumed = resume_profile(second, "viapath-16-07-20", runColumns=3, checkpointFile=path)
+    assert len(resumed.availableTips) == len(full.availableTips)
+    assert picked(first) + picked(second) == picked(fullProtocol)
@@ -0,0 +1,56 @@
+"""
+The fake ProtocolContext keeps the volume of every well, also when opentrons is installed and the script makes its own
+opentrons Locations.
+"""
+import os
+
+import pytest
+
+from extraction.fake import ProtocolContext, run_script
+from extraction.profile import column_ids, load_profile
+
+
+def test_opentrons_locations():
+    types = pytest.importorskip("opentrons.types")
+    protocol = ProtocolContext()
+    plate = protocol.load_labware("eppendorf_96_deepwell_2ml", 1)
+    tips = protocol.load_labware("opentrons_96_filtertiprack_200ul", 2)
+    pipette = protocol.load_instrument("p300_single_gen2", "left", [tips])
+    pipette.pick_up_tip()
+    pipette.aspirate(100, plate["A1"].bottom())
+    pipette.dispense(100, types.Location(types.Point(0, 0, 10), plate["A2"]))
+    assert plate["A2"].volume == 100
+    pipette.air_gap(20)
+    assert protocol.commands[-2]["name"] == "move_to"
+    assert protocol.commands[-2]["location"] == tuple(plate["A2"].top(5).point)
+
+
+def test_profile_volumes():
+    from extraction.engine import run_profile
+    protocol = ProtocolContext()
+    run_profile(protocol, "viapath-16-07-20", runColumns=2)
+    settings = load_profile("viapath-16-07-20", runColumns=2)
+    outplate = protocol.deck[settings["deck"]["outplate"]]
+    for ID in column_ids(settings):
+        assert outplate[ID].volume == settings["dilutionVol"]*8
+
+
+def test_script_volumes():
+    pytest.importorskip("opentrons") # Protocol scripts import it
+    protocol = run_script(os.path.join(os.path.dirname(__file__), "dryrun-RNA-extraction-140ul.py"))
+    names = [command["name"] for command in protocol.commands]
+    assert names.count("move_to") > 0
+    outplate = [labware for labware in protocol.deck.values() if getattr(labware, "name", "") == "Output plate"][0]
+    assert any(well.volume > 0 for well in outplate.wells())
+
+
+def test_small_pipette_flow_rates():
+    from extraction.engine import Extraction
+    settings = load_profile("viapath-16-07-20", runColumns=1, smallPipette="p20_multi_gen2", deck={"smallTipracks": [11]})
+    extraction = Extraction(ProtocolContext(), settings)
+    loaded = extraction.smallPipette.flow_rate.aspirate
+    ID = column_ids(settings)[0]
+    extraction.remove_supernatant(15, ID, "A1", newtip=True, small=True)
+    extraction.elute(15, ID, small=True)
+    assert extraction.smallPipette.flow_rate.aspirate == loaded
+    assert extraction.p300.flow_rate.aspirate == settings["flowRates"]["aspirate"]
@@ -0,0 +1,56 @@
+"""
+Custom labware of labware.py: files are read once and kept by their hash, and a .zip (or .json) that changes is read
+again.
+"""
+import json
+import os
+import zipfile
+
+import pytest
+
+from extraction import labware
+
+DEFINITION = os.path.join(labware.LABWARE_DIR, "eppendorf_96_deepwell_2ml.json")
+
+
+def write_zip(path, definition, mtime):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("definition/1.json", json.dumps(definition))
+    os.utime(path, (mtime, mtime))
+
+
+def test_zip_cache(tmp_path, monkeypatch):
+    reads = []
+    read = labware.read_definitions
+    monkeypatch.setattr(labware, "read_definitions", lambda path: reads.append(path) or read(path))
+    with open(DEFINITION) as handle:
+        definition = json.load(handle)
+    path = str(tmp_path / "plate.zip")
+    definition["parameters"]["loadName"] = "test_plate_zip"
+    write_zip(path, definition, 1000000)
+    assert labware.custom_labware(str(tmp_path))["test_plate_zip"]["dimensions"] == definition["dimensions"]
+    labware.custom_labware(str(tmp_path))
+    assert reads == [path]
+    #The zip changes: it is hashed and read again, and the old definition is gone
+    definition["parameters"]["loadName"] = "test_plate_zip_v2"
+    definition["dimensions"]["zDimension"] += 1
+    write_zip(path, definition, 2000000)
+    found = labware.custom_labware(str(tmp_path))
+    assert list(found) == ["test_plate_zip_v2"]
+    assert found["test_plate_zip_v2"]["dimensions"]["zDimension"] == definition["dimensions"]["zDimension"]
+    assert reads == [path, path]
+
+
+def test_bad_files(tmp_path):
+    with open(DEFINITION) as handle:
+        definition = json.load(handle)
+    write_zip(str(tmp_path / "a.zip"), definition, 1000000)
+    with open(str(tmp_path / "b.json"), "w") as handle:
+        json.dump(definition, handle)
+    with pytest.raises(ValueError, match="is defined in a.zip and in b.json"):
+        labware.custom_labware(str(tmp_path))
+    del definition["wells"]
+    write_zip(str(tmp_path / "a.zip"), definition, 2000000)
+    os.remove(str(tmp_path / "b.json"))
+    with pytest.raises(ValueError, match="has no wells"):
+        labware.custom_labware(str(tmp_path))
@@ -0,0 +1,48 @@
+"""
+Deck layouts of layout.py on a tiny deck, where every layout can be tried: the optimizer finds the one where the pipette
+travels less, and never one worse than the deck of the profile.
+"""
+import itertools
+
+import pytest
+
+from extraction import layout
+from extraction.profile import load_profile
+from extraction.scheduler import build_steps, plan
+
+
+def tiny_deck(monkeypatch):
+    """Settings of a 1 column run on a deck of slots 1 to 7, with a single tiprack"""
+    monkeypatch.setattr(layout, "SLOTS", list(range(1, 8)))
+    monkeypatch.setattr(layout, "MAGNET_SLOTS", (1, 4, 7))
+    return load_profile("viapath-16-07-20", runColumns=1,
+    deck={"magnet": 7, "reagents": 1, "waste": 2, "outplate": 3, "parking": 4, "tipracks": [5]})
+
+
+def test_transitions():
+    counts = layout.transitions(["tips", "reagents", "magnet", "magnet", "reagents", "magnet", "trash"])
+    assert counts == {("tips", "reagents"): 1, ("reagents", "magnet"): 2, ("magnet", "reagents"): 1, ("magnet", "trash"): 1}
+    slots = {"tips": 1, "reagents": 2, "magnet": 3, "trash": 12}
+    assert layout.travel(counts, slots) == layout.distance(1, 2) + 3*layout.distance(2, 3) + layout.distance(3, 12)
+
+
+def test_tiny_deck(monkeypatch):
+    settings = tiny_deck(monkeypatch)
+    steps = build_steps(settings)
+    commands, _ = plan(steps, settings)
+    counts = layout.transitions(layout.visits(steps, commands, settings))
+    deck, travelled, current = layout.optimize(settings)
+    assert current == layout.travel(counts, layout.deck_slots(settings["deck"]))
+    #Every way of placing the labware and the tiprack in the tiny deck
+    best = None
+    roles = list(layout.ROLES) + [("tips", 0)]
+    for placed in itertools.permutations(layout.SLOTS, len(roles)):
+        slots = dict(zip(roles, placed), trash=layout.TRASH)
+        if slots["magnet"] in layout.MAGNET_SLOTS:
+            distance = layout.travel(counts, slots)
+            best = distance if best is None else min(best, distance)
+    assert travelled == pytest.approx(best)
+    assert travelled <= current
+    used = [deck[role] for role in layout.ROLES] + deck["tipracks"]
+    assert deck["magnet"] in layout.MAGNET_SLOTS and len(set(used)) == len(used)
+    assert set(used) <= set(layout.SLOTS)
@@ -0,0 +1,40 @@
+"""
+Motion settings of the profiles ("motion", see Extraction.set_speeds, meneillo and hop): off by default, so moves are
+the ones the robot always did, and when they are on, the moves they change are faster to estimate.
+"""
+from extraction.estimate import record, summarize
+from extraction.fake import ProtocolContext
+from extraction.profile import DEFAULTS
+from extraction.trace import Recorder
+
+MOTION = {"speed": 300, "directWiggles": True, "hopHeight": 3}
+
+
+def moves(**settings):
+    commands = record("viapath-16-07-20", context=ProtocolContext, recorder=Recorder(), runColumns=2, **settings)
+    return commands, [command for command in commands if command["name"] == "move_to"]
+
+
+def test_motion_off():
+    assert all(value in (None, False) for value in DEFAULTS["motion"].values())
+    commands, moved = moves(distribute=["WBE"])
+    assert moved and not any(command.get("direct") for command in moved)
+    #The robot default speed, as it comes with the pipette
+    assert set(command["speed"] for command in commands if command["kind"] == "pipette") == {400}
+    assert "hop" not in [helper for command in commands for helper in command["helpers"]]
+
+
+def test_motion_on():
+    commands, moved = moves(distribute=["WBE"], motion=MOTION)
+    offCommands, offMoved = moves(distribute=["WBE"])
+    #Wiggles go straight, hops go straight at hopHeight over the plate, everything else at the motion speed
+    wiggles = [command for command in moved if "meneillo" in command["helpers"]]
+    hops = [command for command in moved if "hop" in command["helpers"]]
+    assert wiggles and all(command.get("direct") for command in wiggles)
+    assert hops and all(command.get("direct") for command in hops)
+    assert len(moved) == len(offMoved) + len(hops)
+    assert set(command["speed"] for command in commands if command["kind"] == "pipette") == {MOTION["speed"]}
+    #The same calls otherwise, in the same order
+    names = lambda commands: [command["name"] for command in commands if "hop" not in command["helpers"]]
+    assert names(commands) == names(offCommands)
+    assert summarize(commands)["total"] != summarize(offCommands)["total"]
@@ -0,0 +1,45 @@
+"""
+Profiles with settings that can't work are stopped by check_profile() when they are loaded, and dry runs change the
+settings once, however many times they go through dry_run().
+"""
+import pytest
+
+from extraction.fake import ProtocolContext
+from extraction.profile import dry_run, load_profile
+
+
+def test_disposal_volume():
+    load_profile("viapath-16-07-20", disposalVolume=0)
+    with pytest.raises(ValueError, match="disposalVolume"):
+        load_profile("viapath-16-07-20", disposalVolume=180)
+    with pytest.raises(ValueError, match="disposalVolume"):
+        load_profile("viapath-16-07-20", tipVolume=100, disposalVolume=150)
+
+
+def test_dry_run():
+    settings = load_profile("viapath-02-07-20")
+    dry = load_profile("viapath-02-07-20", dryRun=True)
+    assert dry["returnTips"] and dry["delayFactor"] == settings["dryRunFactor"]
+    #Delays are not changed, the engine makes them delayFactor of their time
+    assert (dry["dripDelay"], dry["mixDelay"]) == (settings["dripDelay"], settings["mixDelay"])
+    assert dry_run(dry) == dry
+    assert load_profile(dry) == dry
+    assert not settings["dryRun"] and settings["delayFactor"] == 1
+
+
+def test_dry_run_delays():
+    from extraction.engine import run_profile
+    delays = {}
+    for dryRun in (False, True):
+        protocol = ProtocolContext()
+        run_profile(protocol, "viapath-02-07-20", runColumns=1, dryRun=dryRun)
+        delays[dryRun] = [command["seconds"] for command in protocol.commands if command["name"] == "delay"]
+    assert 2 in delays[False]
+    assert max(delays[True]) < 2
+
+
+def test_dry_run_environment(monkeypatch):
+    monkeypatch.setenv("EXTRACTION_DRY_RUN", "1")
+    assert load_profile("viapath-16-07-20") == load_profile("viapath-16-07-20", dryRun=True)
+    monkeypatch.setenv("EXTRACTION_DRY_RUN", "no")
+    assert not load_profile("viapath-16-07-20")["dryRun"]
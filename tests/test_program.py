@@ -0,0 +1,101 @@
+"""
+Programs are the calls of a planned profile (see program.py): check_program() finds what the robot can't do, and
+run_program() does the same as run_profile(), waiting by the incubations of its own run.
+"""
+import json
+
+import pytest
+
+from extraction.fake import ProtocolContext
+from extraction.program import check_program, compile_program, run_program
+
+
+def program(profile="viapath-16-07-20", **settings):
+    """Program of <profile>, written and read back as JSON"""
+    return json.loads(json.dumps(compile_program(profile, **settings)))
+
+
+def test_check():
+    check_program(program(runColumns=6))
+    check_program(program(runColumns=6, scheduler="linear"))
+    check_program(program(runColumns=2, plates=2))
+
+
+def same_calls(commands, other):
+    """Commands of two fake runs are the same, but for the rounding of the points of a program"""
+    assert [dict(command, location=None) for command in commands] == [dict(command, location=None) for command in other]
+    for command, otherCommand in zip(commands, other):
+        if command.get("location") is not None:
+            assert command["location"] == pytest.approx(otherCommand["location"], abs=0.001)
+
+
+def test_order():
+    compiled = program(runColumns=2)
+    commands = compiled["plan"]
+    first = [position for position, command in enumerate(commands) if command["type"] == "column" and command["ID"] == "A1"][:2]
+    commands[first[0]], commands[first[1]] = commands[first[1]], commands[first[0]]
+    with pytest.raises(ValueError, match="column A1"):
+        check_program(compiled)
+
+
+def test_missing_column():
+    compiled = program(runColumns=2)
+    compiled["plan"] = [command for command in compiled["plan"] if not (command["type"] == "column" and command["ID"] == "A2" and command["step"] == 0)]
+    with pytest.raises(ValueError, match="A2"):
+        check_program(compiled)
+
+
+def test_tips():
+    compiled = program(runColumns=6, tipRefills=True, deck={"tipracks": [10, 8]})
+    check_program(compiled)
+    compiled["plan"] = [dict(command, refill=False) for command in compiled["plan"] if command["type"] != "refill"]
+    with pytest.raises(ValueError, match="tipracks are empty"):
+        check_program(compiled)
+
+
+def test_reservoir():
+    compiled = program("200ul", runColumns=6)
+    with pytest.raises(ValueError, match="Reservoir well A3"):
+        check_program(compiled)
+
+
+def test_calls():
+    compiled = program(runColumns=2)
+    ops = compiled["ops"]
+    aspirate = [op for op in ops if op["op"] == "aspirate"][0]
+    aspirate["args"]["volume"] = 1000
+    with pytest.raises(ValueError, match="don't fit in the pipette"):
+        check_program(compiled)
+    compiled = program(runColumns=2)
+    compiled["loads"] = [load for load in compiled["loads"] if load.get("label") != "Output plate"]
+    with pytest.raises(ValueError, match="there is no labware in slot %s" % compiled["settings"]["deck"]["outplate"]):
+        check_program(compiled)
+    compiled = program(runColumns=2)
+    compiled["ops"].remove([op for op in compiled["ops"] if op["op"] == "pick_up_tip"][0])
+    with pytest.raises(ValueError, match="the pipette has no tip"):
+        check_program(compiled)
+
+
+@pytest.mark.parametrize("settings", [{"runColumns": 3}, {"runColumns": 2, "plates": 2},
+{"runColumns": 4, "smallPipette": "p20_multi_gen2", "deck": {"smallTipracks": [11]}}])
+def test_run(settings):
+    from extraction.engine import run_profile
+    compiled = program(**settings)
+    expected = ProtocolContext()
+    run_profile(expected, "viapath-16-07-20", **settings)
+    protocol = ProtocolContext()
+    run_program(protocol, compiled)
+    same_calls(protocol.commands, expected.commands)
+
+
+def test_waits():
+    #Waits are for deadlines: if something before takes 100 s more than planned, the wait after it is 100 s shorter
+    compiled = program(runColumns=2)
+    waiting = [position for position, op in enumerate(compiled["ops"]) if op["op"] == "wait" and op["args"]["IDs"]][0]
+    protocol = ProtocolContext()
+    run_program(protocol, compiled)
+    compiled["ops"].insert(waiting, {"op": "advance", "kind": "timer", "target": None, "section": "slow", "args": {"seconds": 100}})
+    slower = ProtocolContext()
+    run_program(slower, compiled)
+    delays = lambda protocol: sum(command["seconds"] for command in protocol.commands if command["name"] == "delay")
+    assert delays(slower) == pytest.approx(delays(protocol) - 100)
@@ -0,0 +1,56 @@
+"""
+Queues of plates (scheduler.queue_plates): two plates are the plan of one done twice, with a swap between them, and the
+robot pauses once to change them. Tips and reagents are counted for the whole queue.
+"""
+from extraction.fake import ProtocolContext
+from extraction.profile import column_ids, load_profile
+from extraction.reagents import fill_sheet
+from extraction.scheduler import build_steps, plan, tips_needed
+
+
+def planned(**settings):
+    settings = load_profile("viapath-16-07-20", **settings)
+    steps = build_steps(settings)
+    commands, seconds = plan(steps, settings)
+    return settings, steps, commands, seconds
+
+
+def without_plate(commands):
+    return [dict((key, value) for key, value in command.items() if key not in ("plate", "announce", "refill"))
+    for command in commands]
+
+
+def test_two_plates():
+    settings, steps, one, oneSeconds = planned(runColumns=2)
+    _, _, two, twoSeconds = planned(runColumns=2, plates=2)
+    swaps = [position for position, command in enumerate(two) if command["type"] == "swap"]
+    assert swaps == [len(one)] and two[swaps[0]]["plate"] == 2
+    assert without_plate(two[:len(one)]) == without_plate(one)
+    assert without_plate(two[len(one) + 1:]) == without_plate(one)
+    assert [command["plate"] for command in two if command["type"] != "swap"] == [1]*len(one) + [2]*len(one)
+    assert twoSeconds == 2*oneSeconds + settings["swapMinutes"]*60
+    #The operator hears of plate 2 in the last incubation of plate 1
+    announced = [command for command in two if command.get("announce")]
+    assert len(announced) == 1 and announced[0]["announce"] == 2 and announced[0]["plate"] == 1
+    assert tips_needed(steps, load_profile("viapath-16-07-20", runColumns=2, plates=2)) == 2*tips_needed(steps, settings)
+
+
+def test_fill_sheet():
+    one = fill_sheet(load_profile("viapath-16-07-20", runColumns=2))
+    two = fill_sheet(load_profile("viapath-16-07-20", runColumns=2, plates=2))
+    assert [row["reagent"] for row in two] == [row["reagent"] for row in one]
+    assert [row["used"] for row in two] == [2*row["used"] for row in one]
+
+
+def test_queued_run():
+    from extraction.engine import run_profile
+    protocol = ProtocolContext()
+    extraction = run_profile(protocol, "viapath-16-07-20", runColumns=2, plates=2)
+    pauses = [command for command in protocol.commands if command["name"] == "pause"]
+    assert any("Plate 2 of 2" in (command["text"] or "") for command in pauses)
+    #The fake has a single output plate, so it gets the elution of both. The engine knows the second one only has its own
+    settings = extraction.settings
+    outplate = protocol.deck[settings["deck"]["outplate"]]
+    for ID in column_ids(settings):
+        assert outplate[ID].volume == 2*settings["dilutionVol"]*8
+        assert extraction.liquid.volume("outplate", ID) == settings["dilutionVol"] # Per well, the fake counts the 8 channels
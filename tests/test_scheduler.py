@@ -0,0 +1,106 @@
+"""
+Plans of scheduler.py: the order of the columns with the linear and the pipelined scheduler, and the tips they take.
+Plans don't need a ProtocolContext, so these run without opentrons.
+"""
+import pytest
+
+from extraction.profile import column_ids, load_profile
+from extraction.scheduler import build_steps, command_tips, plan, plan_tips, tip_capacity, tips_needed
+
+
+def planned(**settings):
+    settings = load_profile("viapath-16-07-20", **settings)
+    steps = build_steps(settings)
+    commands, seconds = plan(steps, settings)
+    return settings, steps, commands, seconds
+
+
+def column_order(commands):
+    """[(step, ID)] of the column commands, in the order they are done"""
+    return [(command["step"], command["ID"]) for command in commands if command["type"] == "column"]
+
+
+def test_every_column_in_order():
+    for scheduler in ("linear", "pipelined"):
+        settings, steps, commands, _ = planned(runColumns=4, scheduler=scheduler)
+        order = column_order(commands)
+        for ID in column_ids(settings):
+            done = [step for step, column in order if column == ID]
+            assert done == sorted(done)
+            assert len(done) == len(set(done))
+        #Every column step is done in every column, or distributed to all of them at once
+        for index, step in enumerate(steps):
+            if step["action"] == "magnet":
+                continue
+            IDs = [ID for done, ID in order if done == index]
+            distributed = [ID for command in commands if command["type"] == "distribute" and command["step"] == index for ID in command["IDs"]]
+            assert sorted(IDs or distributed) == sorted(column_ids(settings))
+
+
+def test_linear_order():
+    settings, steps, commands, _ = planned(runColumns=4, scheduler="linear")
+    order = column_order(commands)
+    assert [step for step, _ in order] == sorted(step for step, _ in order)
+    #Columns go one after the other within a step
+    first = [ID for step, ID in order if step == order[0][0]]
+    assert first == column_ids(settings)
+
+
+def test_pipelined_order():
+    _, _, linear, linearSeconds = planned(runColumns=4, scheduler="linear")
+    settings, steps, commands, seconds = planned(runColumns=4, scheduler="pipelined")
+    assert sorted(column_order(commands)) == sorted(column_order(linear))
+    assert seconds < linearSeconds
+    #Incubations are counted for every column, so waits are for the columns that are not ready
+    assert all(command.get("IDs") for command in commands if command["type"] == "wait")
+    assert not any(command.get("IDs") for command in linear if command["type"] == "wait")
+    #Magnets wait for every column
+    for position, command in enumerate(commands):
+        if command["type"] == "magnet":
+            later = [step for step, _ in column_order(commands[position:])]
+            earlier = [step for step, _ in column_order(commands[:position])]
+            assert not later or not earlier or min(later) > max(earlier)
+
+
+def test_pipelined_interleaving():
+    #Without the proteinase incubation the first column can have its beads while the others still get the proteinase
+    settings, steps, commands, _ = planned(runColumns=4, incubationProteinase=0)
+    order = column_order(commands)
+    assert order.index((1, "A1")) < order.index((0, "A7"))
+    _, _, linear, _ = planned(runColumns=4, incubationProteinase=0, scheduler="linear")
+    order = column_order(linear)
+    assert order.index((1, "A1")) > order.index((0, "A7"))
+
+
+def test_plan_tips():
+    for scheduler in ("linear", "pipelined"):
+        settings, steps, commands, _ = planned(runColumns=6, scheduler=scheduler)
+        assert sum(command_tips(command, steps, settings) for command in commands) == tips_needed(steps, settings)
+        assert plan_tips(commands, steps, settings) == commands
+
+
+def test_tips_run_out():
+    with pytest.raises(ValueError, match="tipRefills"):
+        planned(runColumns=6, deck={"tipracks": [10, 8]})
+
+
+def test_refills():
+    settings, steps, commands, _ = planned(runColumns=6, deck={"tipracks": [10, 8]}, tipRefills=True, keepTips=False)
+    refills = [position for position, command in enumerate(commands) if command["type"] == "refill" or command.get("refill")]
+    assert refills
+    #Between refills the racks are never taken more tips than they have
+    used = 0
+    for command in commands:
+        if command["type"] == "refill" or command.get("refill"):
+            used %= 12
+        used += command_tips(command, steps, settings)
+        assert used <= tip_capacity(settings)
+
+
+def test_resumed_tips():
+    settings, steps, commands, _ = planned(runColumns=6)
+    needed = tips_needed(steps, settings)
+    for start in range(0, len(commands), 7):
+        used = sum(command_tips(command, steps, settings) for command in commands[:start])
+        remaining = plan_tips(commands[start:], steps, settings, used=used)
+        assert used + sum(command_tips(command, steps, settings) for command in remaining) == needed
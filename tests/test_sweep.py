@@ -0,0 +1,38 @@
+"""
+Sweeps of sweep.py on the fake ProtocolContext: every combination of the grid gets its row, combinations the profile
+doesn't take get an error and the exit code says so, and bugs stop the sweep.
+"""
+import pytest
+
+from extraction import sweep
+from extraction.fake import ProtocolContext
+
+
+def test_grid():
+    grid = sweep.parse_grid(["runColumns=1,2", "flowRates.aspirate=30,50", "meneillo=blow_out"])
+    assert grid == {"runColumns": [1, 2], "flowRates.aspirate": [30, 50], "meneillo": ["blow_out"]}
+    points = sweep.combinations(grid)
+    assert len(points) == 4
+    assert points[1] == {"runColumns": 1, "flowRates.aspirate": 50, "meneillo": "blow_out"}
+    assert sweep.expand(points[1]) == {"runColumns": 1, "flowRates": {"aspirate": 50}, "meneillo": "blow_out"}
+
+
+def test_rows():
+    rows = sweep.run_sweep("viapath-16-07-20", {"runColumns": [1, 2, 7]}, workers=1, context=ProtocolContext)
+    assert [row["runColumns"] for row in rows] == [1, 2, 7]
+    assert rows[0]["tips"] < rows[1]["tips"] and rows[0]["duration"] < rows[1]["duration"]
+    assert rows[2]["error"].startswith("ColumnsError")
+
+
+def test_exit_code(capsys):
+    assert sweep.main(["viapath-16-07-20", "--grid", "runColumns=1,2", "--fake", "--workers", "1"]) == 0
+    assert sweep.main(["viapath-16-07-20", "--grid", "runColumns=1,7", "--fake", "--workers", "1"]) == 1
+    assert "ERROR ColumnsError" in capsys.readouterr().out
+
+
+def test_bugs_propagate(monkeypatch):
+    def broken(*args, **kwargs):
+        raise KeyError("a bug")
+    monkeypatch.setattr(sweep, "estimate", broken)
+    with pytest.raises(KeyError):
+        sweep.simulate("viapath-16-07-20", {"runColumns": 1}, context=ProtocolContext)
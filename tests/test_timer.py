@@ -0,0 +1,73 @@
+"""
+Waits of timer.py and Extraction.wait(): the delays they make, where the pause one minute before the end goes, and
+that time lost before a wait is not waited again.
+"""
+import pytest
+
+from extraction.fake import ProtocolContext
+from extraction.profile import load_profile
+from extraction.timer import IncubationTimer, count_down
+
+
+def waited(deadline, interval, factor=1, stop=False, timer=None):
+    """[(call, seconds, clock)] of a countdown to <deadline>, clock being when the call was made"""
+    protocol = ProtocolContext()
+    timer = timer or IncubationTimer(True)
+    calls = []
+    delay, pause = protocol.delay, protocol.pause
+
+    def delayed(seconds=0):
+        calls.append(("delay", seconds, timer.now()))
+        delay(seconds=seconds)
+
+    def paused(msg=None):
+        calls.append(("pause", 0, timer.now()))
+        pause(msg)
+
+    protocol.delay, protocol.pause = delayed, paused
+    count_down(protocol, timer, deadline, "the test", interval, factor, stop)
+    return calls
+
+
+def delays(calls):
+    return [seconds for call, seconds, _ in calls if call == "delay"]
+
+
+def test_first_partial_chunk():
+    assert delays(waited(150, 60)) == [30, 60, 60]
+    assert delays(waited(180, 60)) == [60, 60, 60]
+    #delayFactor scales the delays, the intervals stay in seconds of incubation
+    assert delays(waited(75, 60, factor=0.5)) == [15, 30, 30]
+    assert delays(waited(20.4, 60)) == [20.4]
+    assert waited(0.5, 60) == []
+
+
+@pytest.mark.parametrize("interval", [60, 90, 300, 45])
+def test_stop_pause(interval):
+    for deadline in (200, 600, 61, 30):
+        calls = waited(deadline, interval, stop=True)
+        pauses = [clock for call, _, clock in calls if call == "pause"]
+        assert pauses == [max(deadline - 60, 0)]
+        assert sum(delays(calls)) == pytest.approx(deadline)
+        assert max(delays(calls)) <= interval
+
+
+def test_lost_time():
+    timer = IncubationTimer(True)
+    timer.start(["A1", "A2"], 300)
+    timer.advance(130) # Slower than planned, or a pause for tips
+    assert sum(delays(waited(timer.deadline(["A1"]), 60, timer=timer))) == 170
+    #Columns without incubation are ready already
+    assert waited(timer.deadline(["A3"]), 60, timer=timer) == []
+
+
+def test_extraction_wait():
+    from extraction.engine import Extraction
+    protocol = ProtocolContext()
+    extraction = Extraction(protocol, load_profile("viapath-16-07-20", runColumns=1, clockInterval=90))
+    extraction.timer.start(["A1"], 400)
+    extraction.timer.advance(100)
+    extraction.wait(400, "the beads", stop=True, IDs=["A1"])
+    names = [(command["name"], command.get("seconds")) for command in protocol.commands if command["name"] in ("delay", "pause")]
+    assert names == [("delay", 60), ("delay", 90), ("delay", 90), ("pause", None), ("delay", 60)]
+    assert extraction.timer.now() == 400
@@ -0,0 +1,57 @@
+"""
+Chrome traces of trace.py, for a run on the fake ProtocolContext: the events have the fields the viewers need, and
+every robot command is inside the step and the helpers it was called from.
+"""
+import json
+
+from extraction.estimate import record, timed
+from extraction.fake import ProtocolContext
+from extraction.trace import Recorder, chrome_trace, write_trace
+
+
+def recorded(runColumns=1):
+    recorder = Recorder()
+    timed(record("viapath-16-07-20", context=ProtocolContext, recorder=recorder, runColumns=runColumns))
+    return recorder
+
+
+def test_event_shape():
+    recorder = recorded()
+    for clock in ("model", "wall"):
+        events = chrome_trace(recorder, clock)["traceEvents"]
+        assert events
+        for event in events:
+            assert event["ph"] in ("X", "i") and event["pid"] == 1 and event["tid"] == 1
+            assert isinstance(event["ts"], int) and event["ts"] >= 0
+            if event["ph"] == "X":
+                assert isinstance(event["dur"], int) and event["dur"] >= 0
+            else:
+                assert event["cat"] == "comment" and event["s"] == "t"
+        assert [event["ts"] for event in events] == sorted(event["ts"] for event in events)
+        kinds = set(event["cat"] for event in events)
+        assert {"step", "helper", "pipette", "protocol", "module", "comment"} <= kinds
+
+
+def test_nesting():
+    recorder = recorded()
+    events = chrome_trace(recorder, "model")["traceEvents"]
+    steps = [event for event in events if event["cat"] == "step"]
+    assert [event["name"] for event in steps][:2] == ["proteinase", "incubations"]
+    for event in events:
+        if event["cat"] == "pipette":
+            step = [span for span in steps if span["name"] == event["args"]["section"]]
+            #Start and duration are rounded to microseconds on their own, so ends can be 1 us apart
+            assert any(span["ts"] <= event["ts"] and event["ts"] + event["dur"] <= span["ts"] + span["dur"] + 1 for span in step)
+    aspirates = [event for event in events if event["name"] == "aspirate"]
+    assert all("volume" in event["args"] and "flowRate" in event["args"] for event in aspirates)
+    assert any("location" in event["args"] for event in aspirates) # Mixes aspirate where the pipette is
+    delays = [event for event in events if event["name"] == "delay"]
+    assert all(event["dur"] == round(event["args"]["seconds"]*1e6) for event in delays)
+
+
+def test_write_trace(tmp_path):
+    recorder = recorded()
+    path = str(tmp_path / "trace.json")
+    write_trace(recorder, path, clock="model")
+    with open(path) as handle:
+        assert json.load(handle) == json.loads(json.dumps(chrome_trace(recorder, "model")))